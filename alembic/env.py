@@ -11,7 +11,9 @@ from app.models.product import Product
 from app.models.cart import Cart, CartItem
 from app.models.order import Order, OrderItem
 from app.models.payment import Payment
+from app.models.reservation import StockReservation
 from app.models.webhook_event import WebhookEvent
+from app.models.outbox import OutboxMessage
 
 config = context.config
 
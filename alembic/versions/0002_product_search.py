@@ -0,0 +1,43 @@
+"""product full-text search
+
+Revision ID: 0002_product_search
+Revises: 0001_init
+Create Date: 2026-10-18
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002_product_search"
+down_revision = "0001_init"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Generated column: Postgres keeps it in sync on every INSERT/UPDATE of name/description
+    op.execute(
+        """
+        ALTER TABLE products ADD COLUMN search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(description, '')), 'B')
+        ) STORED
+        """
+    )
+    op.create_index("ix_products_search_vector", "products", ["search_vector"], postgresql_using="gin")
+
+    # Trigram index backs the partial-match fallback (`name ILIKE '%q%'`).
+    # Skipped where the contrib extension is not installed; ILIKE still works, just unindexed.
+    bind = op.get_bind()
+    has_trgm = bind.execute(sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")).first()
+    if has_trgm:
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute("CREATE INDEX ix_products_name_trgm ON products USING gin (name gin_trgm_ops)")
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_products_name_trgm")
+    op.drop_index("ix_products_search_vector", table_name="products")
+    op.drop_column("products", "search_vector")
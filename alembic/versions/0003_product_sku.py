@@ -0,0 +1,25 @@
+"""product sku (natural key for bulk upserts)
+
+Revision ID: 0003_product_sku
+Revises: 0002_product_search
+Create Date: 2026-10-18
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003_product_sku"
+down_revision = "0002_product_search"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("products", sa.Column("sku", sa.String(length=64), nullable=True))
+    op.create_index("ix_products_sku", "products", ["sku"], unique=True)
+
+
+def downgrade():
+    op.drop_index("ix_products_sku", table_name="products")
+    op.drop_column("products", "sku")
@@ -0,0 +1,25 @@
+"""orders (status, id) index for keyset-paginated listing
+
+Revision ID: 0004_orders_status_id_index
+Revises: 0003_product_sku
+Create Date: 2026-10-18
+
+"""
+
+from alembic import op
+
+revision = "0004_orders_status_id_index"
+down_revision = "0003_product_sku"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_orders_status_id", "orders", ["status", "id"])
+    # the composite index covers status-only lookups too
+    op.drop_index("ix_orders_status", table_name="orders")
+
+
+def downgrade():
+    op.create_index("ix_orders_status", "orders", ["status"])
+    op.drop_index("ix_orders_status_id", table_name="orders")
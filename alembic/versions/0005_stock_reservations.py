@@ -0,0 +1,63 @@
+"""stock reservations (conditional decrements instead of FOR UPDATE)
+
+Revision ID: 0005_stock_reservations
+Revises: 0004_orders_status_id_index
+Create Date: 2026-10-18
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "0005_stock_reservations"
+down_revision = "0004_orders_status_id_index"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    reservation_status_enum = postgresql.ENUM(
+        "HELD", "CONSUMED", "RELEASED",
+        name="reservation_status",
+        create_type=False,
+    )
+    reservation_status_enum.create(op.get_bind(), checkfirst=True)
+
+    op.create_table(
+        "stock_reservations",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("order_id", sa.Integer(), sa.ForeignKey("orders.id"), nullable=False),
+        sa.Column("product_id", sa.Integer(), sa.ForeignKey("products.id"), nullable=False),
+        sa.Column("qty", sa.Integer(), nullable=False),
+        sa.Column("status", reservation_status_enum, nullable=False, server_default="HELD"),
+        sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.UniqueConstraint("order_id", "product_id", name="uq_reservation_order_product"),
+    )
+    op.create_index("ix_stock_reservations_order_id", "stock_reservations", ["order_id"])
+    op.create_index(
+        "ix_stock_reservations_held_expires_at",
+        "stock_reservations",
+        ["expires_at"],
+        postgresql_where=sa.text("status = 'HELD'"),
+    )
+
+    # orders still awaiting payment already hold their stock
+    op.execute(
+        """
+        INSERT INTO stock_reservations (order_id, product_id, qty, status, expires_at)
+        SELECT oi.order_id, oi.product_id, SUM(oi.qty), 'HELD', o.created_at + interval '30 minutes'
+        FROM order_items oi
+        JOIN orders o ON o.id = oi.order_id
+        WHERE o.status = 'PENDING_PAYMENT'
+        GROUP BY oi.order_id, oi.product_id, o.created_at
+        """
+    )
+
+
+def downgrade():
+    op.drop_index("ix_stock_reservations_held_expires_at", table_name="stock_reservations")
+    op.drop_index("ix_stock_reservations_order_id", table_name="stock_reservations")
+    op.drop_table("stock_reservations")
+    postgresql.ENUM(name="reservation_status").drop(op.get_bind(), checkfirst=True)
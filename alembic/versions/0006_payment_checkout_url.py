@@ -0,0 +1,23 @@
+"""payments.checkout_url (deferred checkout: clients poll for it)
+
+Revision ID: 0006_payment_checkout_url
+Revises: 0005_stock_reservations
+Create Date: 2026-10-18
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006_payment_checkout_url"
+down_revision = "0005_stock_reservations"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("payments", sa.Column("checkout_url", sa.String(length=2048), nullable=True))
+
+
+def downgrade():
+    op.drop_column("payments", "checkout_url")
@@ -0,0 +1,60 @@
+"""webhook_events becomes an inbox (store now, process in a worker)
+
+Revision ID: 0007_webhook_inbox
+Revises: 0006_payment_checkout_url
+Create Date: 2026-10-18
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "0007_webhook_inbox"
+down_revision = "0006_payment_checkout_url"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    webhook_status_enum = postgresql.ENUM(
+        "RECEIVED", "PROCESSED", "FAILED",
+        name="webhook_status",
+        create_type=False,
+    )
+    webhook_status_enum.create(op.get_bind(), checkfirst=True)
+
+    op.add_column("webhook_events", sa.Column("event_type", sa.String(length=100), nullable=True))
+    op.add_column("webhook_events", sa.Column("payload", postgresql.JSONB(), nullable=True))
+    # rows from before the inbox were processed inline
+    op.add_column(
+        "webhook_events",
+        sa.Column("status", webhook_status_enum, nullable=False, server_default="PROCESSED"),
+    )
+    op.alter_column("webhook_events", "status", server_default="RECEIVED")
+    op.add_column("webhook_events", sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"))
+    op.add_column(
+        "webhook_events",
+        sa.Column("next_attempt_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    op.add_column("webhook_events", sa.Column("last_error", sa.Text(), nullable=True))
+    op.add_column(
+        "webhook_events",
+        sa.Column("received_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    op.alter_column("webhook_events", "processed_at", nullable=True, server_default=None)
+    op.create_index(
+        "ix_webhook_events_due",
+        "webhook_events",
+        ["next_attempt_at"],
+        postgresql_where=sa.text("status = 'RECEIVED'"),
+    )
+
+
+def downgrade():
+    op.drop_index("ix_webhook_events_due", table_name="webhook_events")
+    op.execute("UPDATE webhook_events SET processed_at = COALESCE(processed_at, received_at)")
+    op.alter_column("webhook_events", "processed_at", nullable=False, server_default=sa.func.now())
+    for column in ("received_at", "last_error", "next_attempt_at", "attempts", "status", "payload", "event_type"):
+        op.drop_column("webhook_events", column)
+    postgresql.ENUM(name="webhook_status").drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,47 @@
+"""denormalized cart totals
+
+Revision ID: 0009_cart_totals
+Revises: 0008_outbox
+Create Date: 2026-10-18
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0009_cart_totals"
+down_revision = "0008_outbox"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("carts", sa.Column("total_cents", sa.Integer(), nullable=False, server_default="0"))
+    op.add_column("carts", sa.Column("item_count", sa.Integer(), nullable=False, server_default="0"))
+    op.add_column("carts", sa.Column("currency", sa.String(length=10), nullable=False, server_default="brl"))
+    op.execute(
+        """
+        UPDATE carts c
+        SET total_cents = t.total_cents, item_count = t.item_count
+        FROM (
+            SELECT cart_id, sum(qty * unit_price_cents) AS total_cents, sum(qty) AS item_count
+            FROM cart_items GROUP BY cart_id
+        ) t
+        WHERE t.cart_id = c.id
+        """
+    )
+    op.execute(
+        """
+        UPDATE carts c
+        SET currency = p.currency
+        FROM (SELECT DISTINCT ON (cart_id) cart_id, product_id FROM cart_items ORDER BY cart_id, id) first_item
+        JOIN products p ON p.id = first_item.product_id
+        WHERE first_item.cart_id = c.id
+        """
+    )
+
+
+def downgrade():
+    op.drop_column("carts", "currency")
+    op.drop_column("carts", "item_count")
+    op.drop_column("carts", "total_cents")
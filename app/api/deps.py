@@ -1 +1,18 @@
-from app.core.db import get_db
+import hmac
+
+from fastapi import Header, HTTPException
+
+from app.core.config import settings
+from app.core.db import get_db, get_async_db, run_sync
+
+# Request-scoped DB session; routes run their unit of work through `run_sync`,
+# so the same service code serves both modes.
+get_session = get_async_db if settings.DB_ASYNC else get_db
+
+def require_admin(authorization: str | None = Header(None)):
+    """Guard for `/admin/*`: 404 unless `ADMIN_TOKEN` is set, 401 without that bearer token."""
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), settings.ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Admin token required", headers={"WWW-Authenticate": "Bearer"})
@@ -5,6 +5,8 @@ from app.api.routes.cart import router as cart_router
 from app.api.routes.checkout import router as checkout_router
 from app.api.routes.orders import router as orders_router
 from app.api.routes.webhooks import router as webhooks_router
+from app.api.routes.admin import router as admin_router
+from app.api.routes.metrics import router as metrics_router
 
 router = APIRouter()
 router.include_router(categories_router, tags=["categories"])
@@ -13,3 +15,5 @@ router.include_router(cart_router, tags=["cart"])
 router.include_router(checkout_router, tags=["checkout"])
 router.include_router(orders_router, tags=["orders"])
 router.include_router(webhooks_router, tags=["webhooks"])
+router.include_router(admin_router, tags=["admin"])
+router.include_router(metrics_router, tags=["metrics"])
@@ -0,0 +1,29 @@
+from fastapi import APIRouter, Depends, HTTPException
+from app.api.deps import require_admin
+from app.core.config import settings
+from app.core.db import pool_stats
+from app.core.profiling import profiles
+
+router = APIRouter(prefix="/admin", dependencies=[Depends(require_admin)])
+
+def _require_profiling():
+    if not settings.PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling disabled")
+
+@router.get("/db/pool")
+def db_pool():
+    """Connection pool usage of this API process (checked out, wait time, overflow hits)."""
+    return pool_stats()
+
+@router.get("/profiles", dependencies=[Depends(_require_profiling)])
+def profiles_list():
+    """Slowest sampled requests of this API process (`PROFILING_ENABLED`), slowest first."""
+    return {"items": [p.summary() for p in profiles.slowest()]}
+
+@router.get("/profiles/{profile_id}", dependencies=[Depends(_require_profiling)])
+def profile_detail(profile_id: int):
+    """Call tree (cProfile, by cumulative time) and SQL timeline of one kept request."""
+    profile = profiles.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile.detail()
@@ -1,41 +1,42 @@
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
-from app.core.db import get_db
+from app.api.deps import get_session, run_sync
+from app.models.cart import Cart
 from app.schemas.cart import CartCreateOut, CartItemAdd, CartItemPatch, CartOut
 from app.services.cart_service import create_cart, get_cart, add_item, patch_item_qty, delete_item, cart_totals, expire_cart
 
 router = APIRouter(prefix="/cart")
 
+def _cart_out(c: Cart) -> dict:
+    # Runs inside the unit of work: `items` may lazy-load.
+    total, currency = cart_totals(c)
+    return {
+        "id": c.id, "status": c.status.value, "items": list(c.items),
+        "item_count": c.item_count, "total_cents": total, "currency": currency,
+    }
+
 @router.post("", response_model=CartCreateOut, status_code=201)
-def create(db: Session = Depends(get_db)):
-    c = create_cart(db)
+async def create(db: Session = Depends(get_session)):
+    c = await run_sync(db, create_cart)
     return {"id": c.id, "status": c.status.value}
 
 @router.get("/{cart_id}", response_model=CartOut)
-def get_(cart_id: int, db: Session = Depends(get_db)):
-    c = get_cart(db, cart_id)
-    total, currency = cart_totals(c)
-    return {"id": c.id, "status": c.status.value, "items": c.items, "total_cents": total, "currency": currency}
+async def get_(cart_id: int, db: Session = Depends(get_session)):
+    return await run_sync(db, lambda s: _cart_out(get_cart(s, cart_id)))
 
 @router.post("/{cart_id}/items", response_model=CartOut)
-def add(cart_id: int, payload: CartItemAdd, db: Session = Depends(get_db)):
-    c = add_item(db, cart_id, payload.product_id, payload.qty)
-    total, currency = cart_totals(c)
-    return {"id": c.id, "status": c.status.value, "items": c.items, "total_cents": total, "currency": currency}
+async def add(cart_id: int, payload: CartItemAdd, db: Session = Depends(get_session)):
+    return await run_sync(db, lambda s: _cart_out(add_item(s, cart_id, payload.product_id, payload.qty)))
 
 @router.patch("/{cart_id}/items/{item_id}", response_model=CartOut)
-def patch_item(cart_id: int, item_id: int, payload: CartItemPatch, db: Session = Depends(get_db)):
-    c = patch_item_qty(db, cart_id, item_id, payload.qty)
-    total, currency = cart_totals(c)
-    return {"id": c.id, "status": c.status.value, "items": c.items, "total_cents": total, "currency": currency}
+async def patch_item(cart_id: int, item_id: int, payload: CartItemPatch, db: Session = Depends(get_session)):
+    return await run_sync(db, lambda s: _cart_out(patch_item_qty(s, cart_id, item_id, payload.qty)))
 
 @router.delete("/{cart_id}/items/{item_id}", response_model=CartOut)
-def delete_item_(cart_id: int, item_id: int, db: Session = Depends(get_db)):
-    c = delete_item(db, cart_id, item_id)
-    total, currency = cart_totals(c)
-    return {"id": c.id, "status": c.status.value, "items": c.items, "total_cents": total, "currency": currency}
+async def delete_item_(cart_id: int, item_id: int, db: Session = Depends(get_session)):
+    return await run_sync(db, lambda s: _cart_out(delete_item(s, cart_id, item_id)))
 
 @router.post("/{cart_id}/expire")
-def expire(cart_id: int, db: Session = Depends(get_db)):
-    expire_cart(db, cart_id)
+async def expire(cart_id: int, db: Session = Depends(get_session)):
+    await run_sync(db, expire_cart, cart_id)
     return {"status": "ok"}
@@ -1,19 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
-from app.core.db import get_db
-from app.models.category import Category
+from app.api.deps import get_session, run_sync
 from app.schemas.category import CategoryCreate, CategoryOut
-from app.services.catalog_service import create_category
+from app.services.catalog_service import create_category, list_categories
 
 router = APIRouter(prefix="/categories")
 
 @router.get("", response_model=list[CategoryOut])
-def list_categories(db: Session = Depends(get_db)):
-    return db.query(Category).order_by(Category.id.asc()).all()
+async def list_(db: Session = Depends(get_session)):
+    return await run_sync(db, list_categories)
 
 @router.post("", response_model=CategoryOut, status_code=201)
-def create(payload: CategoryCreate, db: Session = Depends(get_db)):
-    exists = db.query(Category).filter(Category.name == payload.name).first()
-    if exists:
-        raise HTTPException(status_code=409, detail="Category exists")
-    return create_category(db, payload.name)
+async def create(payload: CategoryCreate, db: Session = Depends(get_session)):
+    return await run_sync(db, create_category, payload.name)
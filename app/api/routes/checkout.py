@@ -1,12 +1,29 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
-from app.core.db import get_db
-from app.schemas.order import CheckoutOut, OrderOut
-from app.services.checkout_service import checkout
+from app.api.deps import get_session
+from app.core.config import settings
+from app.schemas.order import CheckoutAcceptedOut, CheckoutOut, CheckoutStatusOut
+from app.services.checkout_service import checkout_async, checkout_deferred, wait_for_checkout
 
 router = APIRouter(prefix="/checkout")
 
-@router.post("/{cart_id}", response_model=CheckoutOut)
-def start(cart_id: int, db: Session = Depends(get_db)):
-    order, session = checkout(db, cart_id)
-    return {"order_id": order.id, "session_id": session["id"], "checkout_url": session["url"]}
+@router.post("/{cart_id}", response_model=CheckoutOut, responses={202: {"model": CheckoutAcceptedOut}})
+async def start(cart_id: int, db: Session = Depends(get_session)):
+    if settings.CHECKOUT_ASYNC:
+        order_id = await checkout_deferred(db, cart_id)
+        return JSONResponse(
+            status_code=202,
+            content={"order_id": order_id, "status": "pending", "status_url": f"/checkout/orders/{order_id}"},
+        )
+    order_id, session = await checkout_async(db, cart_id)
+    return {"order_id": order_id, "session_id": session["id"], "checkout_url": session["url"]}
+
+@router.get("/orders/{order_id}", response_model=CheckoutStatusOut)
+async def status(order_id: int, wait: float = Query(0, ge=0, le=25), db: Session = Depends(get_session)):
+    """Checkout URL of an order placed with `202`; `wait` long-polls while it is still pending.
+
+    Example:
+      /checkout/orders/42?wait=10
+    """
+    return await wait_for_checkout(db, order_id, wait=wait)
@@ -0,0 +1,13 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse
+from app.core.config import settings
+from app.core.metrics import registry
+
+router = APIRouter()
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Per-route latency, SQL, Redis and cache counters of this API process (Prometheus text format)."""
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics disabled")
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -1,22 +1,76 @@
+from datetime import datetime
+
 from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from app.core.db import get_db
-from app.models.order import Order, OrderStatus
-from app.schemas.order import OrderOut
+from app.api.deps import get_session, run_sync
+from app.models.order import OrderStatus
+from app.schemas.order import OrderListOut, OrderOut
+from app.services.order_service import EXPORT_BATCH_SIZE, get_order, list_orders
 
 router = APIRouter(prefix="/orders")
 
+@router.get("", response_model=OrderListOut)
+async def list_(
+    status: OrderStatus | None = None,
+    created_from: datetime | None = None,
+    created_to: datetime | None = None,
+    limit: int = Query(50, ge=1, le=200),
+    before_id: int | None = Query(None, ge=1),
+    db: Session = Depends(get_session),
+):
+    """Cursor-paginated order listing, newest first.
+
+    Example:
+      /orders?status=PAID&limit=50
+      /orders?status=PAID&limit=50&before_id=1234
+      /orders?created_from=2026-10-01T00:00:00Z&created_to=2026-10-02T00:00:00Z
+    """
+    def _list(s: Session):
+        orders, next_cursor = list_orders(
+            s, status, created_from=created_from, created_to=created_to, before_id=before_id, limit=limit
+        )
+        return OrderListOut(items=[OrderOut.model_validate(o) for o in orders], next_cursor=next_cursor)
+    return await run_sync(db, _list)
+
+@router.get("/export")
+async def export(
+    status: OrderStatus | None = None,
+    created_from: datetime | None = None,
+    created_to: datetime | None = None,
+    db: Session = Depends(get_session),
+):
+    """Every matching order as NDJSON (one `OrderOut` per line), streamed in keyset batches.
+
+    Example:
+      curl '/orders/export?status=PAID&created_from=2026-10-01T00:00:00Z' > paid.ndjson
+    """
+    def _batch(s: Session, before_id: int | None):
+        orders, next_cursor = list_orders(
+            s, status, created_from=created_from, created_to=created_to,
+            before_id=before_id, limit=EXPORT_BATCH_SIZE,
+        )
+        body = "".join(OrderOut.model_validate(o).model_dump_json() + "\n" for o in orders)
+        s.expunge_all()  # keep the session's identity map from growing across batches
+        return body, next_cursor
+
+    async def _lines():
+        try:
+            before_id = None
+            while True:
+                body, before_id = await run_sync(db, _batch, before_id)
+                if body:
+                    yield body
+                if before_id is None:
+                    break
+        finally:
+            # the stream may outlive the request dependency; release the connection here
+            await run_sync(db, lambda s: s.close())
+
+    return StreamingResponse(_lines(), media_type="application/x-ndjson")
+
 @router.get("/{order_id}", response_model=OrderOut)
-def get_(order_id: int, db: Session = Depends(get_db)):
-    o = db.query(Order).filter(Order.id == order_id).first()
-    if not o:
-        from fastapi import HTTPException
-        raise HTTPException(status_code=404, detail="Order not found")
-    return o
-
-@router.get("", response_model=list[OrderOut])
-def list_(status: str | None = None, db: Session = Depends(get_db)):
-    q = db.query(Order)
-    if status:
-        q = q.filter(Order.status == OrderStatus(status))
-    return q.order_by(Order.id.desc()).all()
+async def get_(order_id: int, db: Session = Depends(get_session)):
+    def _get(s: Session):
+        return OrderOut.model_validate(get_order(s, order_id))
+    return await run_sync(db, _get)
@@ -1,19 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from app.core.db import get_db
-from app.models.product import Product
-from app.schemas.product import ProductCreate, ProductPatch, ProductOut
-from app.services.catalog_service import list_products, get_product, invalidate_product_cache
+from app.api.deps import get_session, run_sync
+from app.schemas.product import (
+    ProductCreate, ProductPatch, ProductOut, ProductBatchIn, ProductImportOut, ProductAdjustIn, ProductAdjustOut,
+)
+from app.services.catalog_service import (
+    list_products, search_products, get_product, get_products_many, create_product, update_product, adjust_products,
+)
+from app.services.export_service import EXPORT_FORMATS, export_products
+from app.services.import_service import IMPORT_FORMATS, import_products
 
 router = APIRouter(prefix="/products")
 
 @router.get("", response_model=dict)
-def list_(
+async def list_(
     category: str | None = None,
     q: str | None = None,
     limit: int = Query(20, ge=1, le=100),
     after_id: int | None = Query(None, ge=0),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_session),
 ):
     """Cursor-paginated product listing.
 
@@ -21,33 +27,77 @@ def list_(
       /products?limit=20
       /products?limit=20&after_id=40
     """
-    return list_products(db, category, q, limit=limit, after_id=after_id)
+    return await run_sync(db, list_products, category, q, limit=limit, after_id=after_id)
+
+@router.get("/search", response_model=dict)
+async def search(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str | None = None,
+    db: Session = Depends(get_session),
+):
+    """Ranked full-text search (name + description) with a partial-match fallback.
+
+    Example:
+      /products/search?q=nier poster
+      /products/search?q=nier poster&cursor=<next_cursor>
+    """
+    return await run_sync(db, search_products, q, limit=limit, cursor=cursor)
+
+@router.post("/batch", response_model=dict)
+async def batch(payload: ProductBatchIn, db: Session = Depends(get_session)):
+    """Many products by id in one call (cart / wishlist rendering), in the requested order.
+
+    Example:
+      {"ids": [3, 1, 42]}  ->  {"items": [{...id 3}, {...id 1}], "missing": [42]}
+    """
+    return await run_sync(db, get_products_many, payload.ids)
+
+@router.get("/export")
+async def export(format: str = Query("ndjson", pattern="^(ndjson|csv)$"), db: Session = Depends(get_session)):
+    """Stream the whole catalog (one product per line) for indexers and marketplace feeds.
+
+    Example:
+      curl '/products/export?format=csv' > catalog.csv
+    """
+    # the session stays open while the body streams (FastAPI >= 0.118, see requirements.txt)
+    return StreamingResponse(
+        export_products(db, format),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="products.{format}"'},
+    )
+
+@router.post("/import", response_model=ProductImportOut)
+async def import_(request: Request, db: Session = Depends(get_session)):
+    """Bulk upsert by `sku` from a streamed NDJSON (`application/x-ndjson`) or CSV (`text/csv`) body.
+
+    Example:
+      curl -X POST /products/import -H 'Content-Type: application/x-ndjson' --data-binary @feed.ndjson
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    return await import_products(db, request.stream(), IMPORT_FORMATS.get(content_type))
+
+@router.post("/adjust", response_model=ProductAdjustOut)
+async def adjust(payload: ProductAdjustIn, db: Session = Depends(get_session)):
+    """Apply many stock deltas / price changes in a single UPDATE (stock never goes below zero).
+
+    Example:
+      {"items": [{"product_id": 1, "stock_delta": -3}, {"product_id": 2, "stock_delta": 10, "price_cents": 1990}]}
+    """
+    items = [a.model_dump() for a in payload.items]
+    return await run_sync(db, adjust_products, items, atomic=payload.atomic)
 
 @router.get("/{product_id}", response_model=dict)
-def get_(product_id: int, db: Session = Depends(get_db)):
-    p = get_product(db, product_id)
+async def get_(product_id: int, db: Session = Depends(get_session)):
+    p = await run_sync(db, get_product, product_id)
     if not p:
         raise HTTPException(status_code=404, detail="Product not found")
     return p
 
 @router.post("", response_model=ProductOut, status_code=201)
-def create(payload: ProductCreate, db: Session = Depends(get_db)):
-    p = Product(**payload.model_dump())
-    db.add(p)
-    db.commit()
-    db.refresh(p)
-    invalidate_product_cache(p.id)
-    return p
+async def create(payload: ProductCreate, db: Session = Depends(get_session)):
+    return await run_sync(db, create_product, payload.model_dump())
 
 @router.patch("/{product_id}", response_model=ProductOut)
-def patch(product_id: int, payload: ProductPatch, db: Session = Depends(get_db)):
-    p = db.query(Product).filter(Product.id == product_id).first()
-    if not p:
-        raise HTTPException(status_code=404, detail="Product not found")
-    data = payload.model_dump(exclude_unset=True)
-    for k,v in data.items():
-        setattr(p, k, v)
-    db.commit()
-    db.refresh(p)
-    invalidate_product_cache(p.id)
-    return p
+async def patch(product_id: int, payload: ProductPatch, db: Session = Depends(get_session)):
+    return await run_sync(db, update_product, product_id, payload.model_dump(exclude_unset=True))
@@ -1,8 +1,8 @@
 from fastapi import APIRouter, Depends, Request, Header
 from sqlalchemy.orm import Session
-from app.core.db import get_db
+from app.api.deps import get_session, run_sync
 from app.services.stripe_service import verify_webhook
-from app.services.webhook_service import process_stripe_event
+from app.services.webhook_service import enqueue_stripe_event
 
 router = APIRouter(prefix="/webhooks")
 
@@ -10,8 +10,9 @@ router = APIRouter(prefix="/webhooks")
 async def stripe_webhook(
     request: Request,
     stripe_signature: str | None = Header(default=None, alias="Stripe-Signature"),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_session),
 ):
     payload = await request.body()
     event = verify_webhook(payload, stripe_signature or "")
-    return process_stripe_event(db, event)
+    # one INSERT into the inbox; a worker applies the event (see webhook_service)
+    return await run_sync(db, enqueue_stripe_event, event)
@@ -1,29 +1,435 @@
 from __future__ import annotations
+import asyncio
+import inspect
 import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
 import redis
+import redis.asyncio
+from redis.client import Pipeline
+from sqlalchemy.util.concurrency import await_only, in_greenlet
 from app.core.config import settings
+from app.core.db import cooperative_sleep
+from app.core.metrics import record_cache, record_redis
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "cache:invalidate"
 
 _redis = None
 
+
+class InstrumentedPipeline(Pipeline):
+    def execute(self, raise_on_error: bool = True):
+        started = time.perf_counter()
+        try:
+            return super().execute(raise_on_error)
+        finally:
+            record_redis(time.perf_counter() - started)
+
+
+class InstrumentedRedis(redis.Redis):
+    """`redis.Redis` that reports each round trip (command or pipeline) to the request's metrics."""
+
+    def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            record_redis(time.perf_counter() - started)
+
+    def pipeline(self, transaction=True, shard_hint=None) -> InstrumentedPipeline:
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class _LoopRedis:
+    """Sync facade over a `redis.asyncio` client for code running in `AsyncSession.run_sync`.
+
+    That code runs in a greenlet on the event loop: a blocking socket read there would stall
+    every request. Here each command is awaited on the loop instead (`await_only`, like
+    `cooperative_sleep`); pipelines queue as usual and only `execute()` awaits.
+    """
+
+    def __init__(self, target):
+        self._target = target
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if isinstance(result, redis.asyncio.client.Pipeline):  # also awaitable: check first
+                return _LoopRedis(result)
+            if inspect.isawaitable(result):
+                started = time.perf_counter()
+                try:
+                    return await_only(result)
+                finally:
+                    record_redis(time.perf_counter() - started)
+            return result
+
+        return call
+
+
+_async_redis = None  # (event loop, client): asyncio connections belong to one loop
+
+
+def _new_async_redis() -> redis.asyncio.Redis:
+    return redis.asyncio.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+
+
 def get_redis() -> redis.Redis:
-    global _redis
+    """The process's Redis client; inside `AsyncSession.run_sync` (`DB_ASYNC`) a facade
+    that awaits each command on the event loop instead of blocking it."""
+    global _redis, _async_redis
+    if in_greenlet():
+        loop = asyncio.get_running_loop()
+        if _async_redis is None or _async_redis[0] is not loop:
+            _async_redis = (loop, _new_async_redis())
+        return _LoopRedis(_async_redis[1])
     if _redis is None:
-        _redis = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+        _redis = InstrumentedRedis.from_url(settings.REDIS_URL, decode_responses=True)
     return _redis
 
+
+class LocalCache:
+    """Bounded in-process LRU with per-entry TTL (thread-safe).
+
+    Values are shared between callers: treat them as read-only.
+    """
+
+    def __init__(self, max_items: int, ttl_seconds: float):
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self._data: OrderedDict[str, tuple[float, object]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        """Return `(hit, value)`."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return False, None
+            self._data.move_to_end(key)
+            return True, value
+
+    def set(self, key: str, value, ttl_seconds: float | None = None):
+        ttl = self.ttl_seconds if ttl_seconds is None else min(ttl_seconds, self.ttl_seconds)
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys: str):
+        with self._lock:
+            for k in keys:
+                self._data.pop(k, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+local_cache = LocalCache(settings.LOCAL_CACHE_MAX_ITEMS, settings.LOCAL_CACHE_TTL_SECONDS)
+
+_listener_pid = None
+_listener_lock = threading.Lock()
+# (thread, stop event) of this process's listener
+_listener = None
+# how long the listener waits for a message before checking its stop event
+LISTENER_POLL_SECONDS = 0.5
+
+def _ensure_invalidation_listener():
+    """Start (once per process) the thread that applies other workers' invalidations."""
+    global _listener_pid, _listener
+    if _listener_pid == os.getpid():
+        return
+    with _listener_lock:
+        if _listener_pid == os.getpid():
+            return
+        # a forked child inherits the parent's entries but not its thread
+        local_cache.clear()
+        stop = threading.Event()
+        thread = threading.Thread(target=_listen_invalidations, args=(stop,), name="cache-invalidation", daemon=True)
+        thread.start()
+        _listener = (thread, stop)
+        _listener_pid = os.getpid()
+
+def stop_invalidation_listener(timeout: float = 5.0):
+    """Stop this process's listener (shutdown, tests); the next local cache use starts a new one."""
+    global _listener_pid, _listener
+    with _listener_lock:
+        listener, _listener = _listener, None
+        _listener_pid = None
+    if listener is not None and listener[0].is_alive():
+        thread, stop = listener
+        stop.set()
+        if thread is not threading.current_thread():
+            thread.join(timeout)
+
+def _listen_invalidations(stop: threading.Event):
+    backoff = 0.5
+    while not stop.is_set():
+        pubsub = None
+        try:
+            pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(INVALIDATION_CHANNEL)
+            backoff = 0.5
+            while not stop.is_set():
+                msg = pubsub.get_message(timeout=LISTENER_POLL_SECONDS)
+                if msg is not None and msg.get("type") == "message":
+                    local_cache.delete(*json.loads(msg["data"]))
+        except Exception:
+            logger.warning("cache invalidation listener disconnected", exc_info=True)
+        finally:
+            if pubsub is not None:
+                pubsub.close()
+        if stop.is_set():
+            return
+        # messages may have been missed while disconnected
+        local_cache.clear()
+        stop.wait(backoff)
+        backoff = min(backoff * 2, 30)
+
+def _local_enabled() -> bool:
+    if not settings.LOCAL_CACHE_ENABLED:
+        return False
+    _ensure_invalidation_listener()
+    return True
+
 def cache_get_json(key: str):
+    use_local = _local_enabled()
+    if use_local:
+        hit, value = local_cache.get(key)
+        if hit:
+            record_cache("local")
+            return value
     r = get_redis()
     raw = r.get(key)
     if raw is None:
+        record_cache("miss")
         return None
-    return json.loads(raw)
+    record_cache("redis")
+    value = json.loads(raw)
+    if use_local:
+        local_cache.set(key, value)
+    return value
 
 def cache_set_json(key: str, value, ttl_seconds: int):
     r = get_redis()
     r.setex(key, ttl_seconds, json.dumps(value))
+    if _local_enabled():
+        local_cache.set(key, value, ttl_seconds)
+
+def cache_get_many_json(keys: list[str]) -> dict:
+    """Batch `cache_get_json`: local tier first, then one `MGET` for the rest.
+
+    Returns only the keys that were found.
+    """
+    found = {}
+    use_local = _local_enabled()
+    remote = keys
+    if use_local:
+        remote = []
+        for k in keys:
+            hit, value = local_cache.get(k)
+            if hit:
+                found[k] = value
+            else:
+                remote.append(k)
+        record_cache("local", len(keys) - len(remote))
+    if remote:
+        for k, raw in zip(remote, get_redis().mget(remote)):
+            if raw is None:
+                continue
+            found[k] = json.loads(raw)
+            if use_local:
+                local_cache.set(k, found[k])
+        hits = len(found) - (len(keys) - len(remote))
+        record_cache("redis", hits)
+        record_cache("miss", len(remote) - hits)
+    return found
+
+def cache_set_many_json(values: dict, ttl_seconds: int):
+    """Batch `cache_set_json` in one pipeline."""
+    if not values:
+        return
+    pipe = get_redis().pipeline(transaction=False)
+    for k, v in values.items():
+        pipe.setex(k, ttl_seconds, json.dumps(v))
+    pipe.execute()
+    if _local_enabled():
+        for k, v in values.items():
+            local_cache.set(k, v, ttl_seconds)
 
 def cache_del(*keys: str):
     if not keys:
         return
+    local_cache.delete(*keys)
     r = get_redis()
-    r.delete(*keys)
+    pipe = r.pipeline(transaction=False)
+    pipe.delete(*keys)
+    pipe.publish(INVALIDATION_CHANNEL, json.dumps(keys))
+    pipe.execute()
+
+def cache_get_version(key: str) -> int:
+    """Namespace generation counter (0 until first bumped); cached in-process like any key."""
+    return int(cache_get_json(key) or 0)
+
+def cache_bump_version(key: str, *also_delete: str):
+    """Move a namespace to a new generation in one round trip.
+
+    Keys built on the old generation are simply never read again and age out by TTL.
+    """
+    keys = (key, *also_delete)
+    local_cache.delete(*keys)
+    pipe = get_redis().pipeline(transaction=False)
+    pipe.incr(key)
+    if also_delete:
+        pipe.delete(*also_delete)
+    pipe.publish(INVALIDATION_CHANNEL, json.dumps(keys))
+    pipe.execute()
+
+
+# ---- single-flight recompute + stale-while-revalidate ----
+
+_RELEASE_LOCK = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+def _lock_key(key: str) -> str:
+    return f"lock:{key}"
+
+def _acquire_lock(key: str) -> str | None:
+    token = uuid.uuid4().hex
+    ttl_ms = int(settings.CACHE_LOCK_TIMEOUT_SECONDS * 1000)
+    if get_redis().set(_lock_key(key), token, nx=True, px=ttl_ms):
+        return token
+    return None
+
+def release_lock(lock_key: str, token: str) -> bool:
+    """Delete the Redis lock `lock_key` only if it still holds `token` (a lock that expired and
+    was taken by someone else is left alone). Returns whether it was released."""
+    return bool(get_redis().eval(_RELEASE_LOCK, 1, lock_key, token))
+
+def _release_lock(key: str, token: str):
+    release_lock(_lock_key(key), token)
+
+def _is_fresh(envelope) -> bool:
+    return envelope is not None and envelope["fresh_until"] > time.time()
+
+def _as_envelope(value):
+    # anything else (e.g. a plain value written before envelopes) counts as a miss
+    if isinstance(value, dict) and "fresh_until" in value:
+        return value
+    return None
+
+def _get_envelope(key: str, *, bypass_local: bool = False):
+    if not bypass_local:
+        envelope = _as_envelope(cache_get_json(key))
+        if envelope is None or _is_fresh(envelope):
+            return envelope
+    # stale local copy: another worker may already have refreshed Redis
+    raw = get_redis().get(key)
+    envelope = _as_envelope(json.loads(raw)) if raw is not None else None
+    if envelope is not None and _local_enabled():
+        local_cache.set(key, envelope)
+    return envelope
+
+def _set_envelope(key: str, value, ttl_seconds: int, stale_seconds: int):
+    envelope = {"v": value, "fresh_until": time.time() + ttl_seconds}
+    cache_set_json(key, envelope, ttl_seconds + stale_seconds)
+
+def _wait_for_fresh(key: str):
+    deadline = time.monotonic() + settings.CACHE_LOCK_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        cooperative_sleep(0.02)
+        envelope = _get_envelope(key, bypass_local=True)
+        if _is_fresh(envelope):
+            return envelope
+        if not get_redis().exists(_lock_key(key)):
+            break  # holder failed without caching anything
+    return None
+
+def cache_get_or_compute_json(key: str, compute, ttl_seconds: int, *, stale_seconds: int | None = None):
+    """Read-through cache that never lets a whole crowd recompute the same key.
+
+    - fresh (age < ttl): served from cache
+    - stale (ttl .. ttl + stale_seconds): one caller recomputes under a Redis lock,
+      everyone else is served the stale value meanwhile
+    - miss: one caller recomputes; the others wait (up to CACHE_LOCK_WAIT_SECONDS)
+      for its result before falling back to computing themselves
+
+    A None result ("not found") is cached like any other value.
+    """
+    if stale_seconds is None:
+        stale_seconds = settings.CACHE_STALE_SECONDS
+
+    envelope = _get_envelope(key)
+    if _is_fresh(envelope):
+        return envelope["v"]
+
+    token = _acquire_lock(key)
+    if token is None:
+        if envelope is not None:
+            return envelope["v"]
+        envelope = _wait_for_fresh(key)
+        if envelope is not None:
+            return envelope["v"]
+        return compute()
+
+    try:
+        # the previous lock holder may have just finished
+        envelope = _get_envelope(key, bypass_local=True)
+        if _is_fresh(envelope):
+            return envelope["v"]
+        value = compute()
+        _set_envelope(key, value, ttl_seconds, stale_seconds)
+        return value
+    finally:
+        _release_lock(key, token)
+
+def cache_get_or_compute_many_json(keys: list[str], compute_many, ttl_seconds: int, *, stale_seconds: int | None = None) -> dict:
+    """Batch read-through over the same envelopes as `cache_get_or_compute_json`.
+
+    Fresh keys come from the local tier / one `MGET`; everything else (missing or stale)
+    goes to `compute_many(keys) -> {key: value}` in one call and is written back in one
+    pipeline. No per-key locks: the batch is a single query, so a burst costs little.
+    A key missing from the computed dict is cached as None.
+    """
+    if stale_seconds is None:
+        stale_seconds = settings.CACHE_STALE_SECONDS
+
+    result = {}
+    for k, raw in cache_get_many_json(keys).items():
+        envelope = _as_envelope(raw)
+        if _is_fresh(envelope):
+            result[k] = envelope["v"]
+    misses = [k for k in keys if k not in result]
+    if misses:
+        computed = compute_many(misses)
+        fresh_until = time.time() + ttl_seconds
+        envelopes = {}
+        for k in misses:
+            result[k] = computed.get(k)
+            envelopes[k] = {"v": result[k], "fresh_until": fresh_until}
+        cache_set_many_json(envelopes, ttl_seconds + stale_seconds)
+    return result
@@ -1,17 +1,90 @@
 from __future__ import annotations
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, DeclarativeBase
+import asyncio
+import time
+from contextlib import contextmanager
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import create_engine, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker, DeclarativeBase
+from sqlalchemy.util.concurrency import await_only, in_greenlet
+
+from app.core.config import settings
+from app.core.metrics import instrument_engine
+from app.core.profiling import profile_engine, profiled
+from app.core.pool import InstrumentedAsyncQueuePool, InstrumentedQueuePool
 
 engine = None
 SessionLocal = None
 
+async_engine = None
+AsyncSessionLocal = None
+
 class Base(DeclarativeBase):
     pass
 
+def _pool_options() -> dict:
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
 def init_db(database_url: str):
+    """Build the process-wide engine once; later calls with the same URL reuse it.
+
+    Celery tasks call this on every run, so it must not open a new pool each time.
+    """
     global engine, SessionLocal
-    engine = create_engine(database_url, pool_pre_ping=True, future=True)
+    if engine is not None and engine.url == make_url(database_url):
+        return engine
+    engine = create_engine(database_url, poolclass=InstrumentedQueuePool, future=True, **_pool_options())
+    instrument_engine(engine)
+    profile_engine(engine)
     SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False, future=True)
+    return engine
+
+def init_async_db(database_url: str):
+    global async_engine, AsyncSessionLocal
+    url = async_database_url(database_url)
+    if async_engine is not None and async_engine.url == make_url(url):
+        return async_engine
+    async_engine = create_async_engine(url, poolclass=InstrumentedAsyncQueuePool, **_pool_options())
+    instrument_engine(async_engine.sync_engine)
+    profile_engine(async_engine.sync_engine)
+    AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+    return async_engine
+
+def reset_db_after_fork():
+    """Drop pooled connections inherited from a parent process (prefork workers)."""
+    if engine is not None:
+        engine.dispose(close=False)
+
+def pool_stats() -> dict:
+    stats = {}
+    if engine is not None:
+        stats["sync"] = engine.pool.snapshot()
+    if async_engine is not None:
+        stats["async"] = async_engine.sync_engine.pool.snapshot()
+    return stats
+
+def async_database_url(database_url: str) -> str:
+    """psycopg (v3) speaks both sync and asyncio; psycopg2 only sync."""
+    for prefix in ("postgresql+psycopg2://", "postgresql://"):
+        if database_url.startswith(prefix):
+            return "postgresql+psycopg://" + database_url[len(prefix):]
+    return database_url
+
+@contextmanager
+def session_scope():
+    """Session on the process-wide engine, for code outside a request (Celery tasks)."""
+    init_db(settings.DATABASE_URL)
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
 
 def get_db():
     db = SessionLocal()
@@ -19,3 +92,25 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def run_sync(db: Session | AsyncSession, fn, *args, **kwargs):
+    """Run a sync-Session service function without blocking the event loop.
+
+    - AsyncSession: `fn` runs in a greenlet on the loop and every DB round trip
+      is awaited on the async driver (no threadpool worker held).
+    - Session: falls back to the threadpool, like a plain `def` route.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(profiled(fn), db, *args, **kwargs)
+
+def cooperative_sleep(seconds: float):
+    """`time.sleep` that yields the event loop when called from inside `AsyncSession.run_sync`."""
+    if in_greenlet():
+        await_only(asyncio.sleep(seconds))
+    else:
+        time.sleep(seconds)
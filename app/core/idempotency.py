@@ -0,0 +1,145 @@
+"""`Idempotency-Key` support for retry-prone mutations (checkout, cart).
+
+A request carrying the header runs at most once per key: its response is stored in
+Redis (`IDEMPOTENCY_TTL_SECONDS`) and replayed to any retry. While the first request
+is still running, duplicates wait for its response (an in-flight lock) instead of
+executing a second time.
+
+- the key is scoped to method + path, and bound to a fingerprint of the body:
+  reusing it for a different payload is a 422
+- 5xx responses are not stored, so a retry after a server error runs again; the lock is
+  released on every way out (5xx, exception, cancelled request), and a duplicate that was
+  waiting on a holder which failed runs the request itself instead of giving up
+- requests without the header are untouched
+"""
+from __future__ import annotations
+import asyncio
+import base64
+import hashlib
+import json
+import time
+import uuid
+
+import anyio
+from starlette.concurrency import run_in_threadpool
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.cache import get_redis, release_lock
+from app.core.config import settings
+
+HEADER = b"idempotency-key"
+REPLAYED_HEADER = b"idempotent-replayed"
+KEY_PREFIX = "idem:"
+_METHODS = {"POST", "PATCH", "PUT", "DELETE"}
+
+
+class IdempotencyMiddleware:
+    def __init__(self, app: ASGIApp, *, path_prefixes: tuple[str, ...] | None = None):
+        self.app = app
+        self.path_prefixes = tuple(path_prefixes if path_prefixes is not None else settings.IDEMPOTENCY_PATHS)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] not in _METHODS or not scope["path"].startswith(self.path_prefixes):
+            return await self.app(scope, receive, send)
+        idem_key = dict(scope["headers"]).get(HEADER)
+        if not idem_key:
+            return await self.app(scope, receive, send)
+
+        body = await _read_body(receive)
+        key = f"{KEY_PREFIX}{scope['method']}:{scope['path']}:{idem_key.decode('latin-1')}"
+        fingerprint = hashlib.sha256(scope.get("query_string", b"") + b"\n" + body).hexdigest()
+
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+        while not await run_in_threadpool(
+            get_redis().set, f"{key}:lock", token, nx=True, px=int(settings.IDEMPOTENCY_LOCK_SECONDS * 1000)
+        ):
+            stored = await self._wait_for_response(key, deadline)
+            if stored is not None:
+                return await _replay(send, stored, fingerprint)
+            if time.monotonic() >= deadline:
+                return await _send_json(send, 409, {"detail": "A request with this Idempotency-Key is in progress"})
+            # the holder released the lock without storing a response (5xx, error): try to take over
+
+        try:
+            # the previous holder may have just finished
+            stored = await run_in_threadpool(_load, key)
+            if stored is not None:
+                return await _replay(send, stored, fingerprint)
+            response = await self._run(scope, body, send)
+            if response["status"] < 500:
+                response["fingerprint"] = fingerprint
+                await run_in_threadpool(
+                    get_redis().set, key, json.dumps(response), ex=settings.IDEMPOTENCY_TTL_SECONDS
+                )
+        finally:
+            # shielded: a cancelled request (client gone) must still free the key for its retry
+            with anyio.CancelScope(shield=True):
+                await run_in_threadpool(release_lock, f"{key}:lock", token)
+
+    async def _run(self, scope: Scope, body: bytes, send: Send) -> dict:
+        """Run the app, passing its response through while keeping a copy."""
+        response = {"status": 500, "headers": [], "body": b""}
+        chunks = []
+        sent_body = False
+
+        async def receive() -> Message:
+            nonlocal sent_body
+            if sent_body:
+                return {"type": "http.disconnect"}
+            sent_body = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def capture(message: Message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = [(k.decode("latin-1"), v.decode("latin-1")) for k, v in message.get("headers", [])]
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        await self.app(scope, receive, capture)
+        response["body"] = base64.b64encode(b"".join(chunks)).decode()
+        return response
+
+    async def _wait_for_response(self, key: str, deadline: float) -> dict | None:
+        """The holder's stored response; None once the lock is gone without one, or at `deadline`."""
+        delay = 0.05
+        while time.monotonic() < deadline:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.5)
+            stored = await run_in_threadpool(_load, key)
+            if stored is not None:
+                return stored
+            if not await run_in_threadpool(get_redis().exists, f"{key}:lock"):
+                break  # holder failed (5xx / crash) without storing anything
+        return None
+
+
+def _load(key: str) -> dict | None:
+    raw = get_redis().get(key)
+    return json.loads(raw) if raw is not None else None
+
+
+async def _read_body(receive: Receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            return b"".join(chunks)
+
+
+async def _replay(send: Send, stored: dict, fingerprint: str):
+    if stored["fingerprint"] != fingerprint:
+        return await _send_json(send, 422, {"detail": "Idempotency-Key was already used with a different request"})
+    headers = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in stored["headers"]]
+    await send({"type": "http.response.start", "status": stored["status"], "headers": headers + [(REPLAYED_HEADER, b"true")]})
+    await send({"type": "http.response.body", "body": base64.b64decode(stored["body"])})
+
+
+async def _send_json(send: Send, status: int, payload: dict):
+    body = json.dumps(payload).encode()
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
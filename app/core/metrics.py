@@ -0,0 +1,244 @@
+"""Per-request performance counters: SQL, Redis, cache; `Server-Timing` + Prometheus text.
+
+- `MetricsMiddleware` opens a `RequestStats` for every HTTP request (a contextvar, so it
+  follows the request into the threadpool and into `AsyncSession.run_sync` greenlets)
+- engines built by `init_db` / `init_async_db` count and time every statement
+  (`instrument_engine`); `app.core.cache` times Redis round trips and records hits/misses
+- the response carries `Server-Timing: db, redis, cache, app`; `/metrics` serves per-route
+  histograms and counters in the Prometheus text format
+
+Counters are per process (like `/admin/db/pool`): scrape every worker.
+Work outside a request (Celery tasks, the outbox relay) is not counted.
+"""
+from __future__ import annotations
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from sqlalchemy import event
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+
+
+@dataclass
+class RequestStats:
+    db_queries: int = 0
+    db_seconds: float = 0.0
+    redis_calls: int = 0
+    redis_seconds: float = 0.0
+    cache_local_hits: int = 0
+    cache_redis_hits: int = 0
+    cache_misses: int = 0
+
+
+_current: ContextVar[RequestStats | None] = ContextVar("request_stats", default=None)
+
+
+def current_stats() -> RequestStats | None:
+    return _current.get()
+
+
+# ---- recorders (no-ops outside a request) ----
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is None:
+        return
+    started = conn.info["metrics_query_start"].pop()
+    stats.db_queries += 1
+    stats.db_seconds += time.perf_counter() - started
+
+
+def instrument_engine(engine):
+    """Count and time every statement run on `engine` (a sync Engine; pass `async_engine.sync_engine`)."""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    return engine
+
+
+def record_redis(seconds: float, calls: int = 1):
+    stats = _current.get()
+    if stats is not None:
+        stats.redis_calls += calls
+        stats.redis_seconds += seconds
+
+
+def record_cache(result: str, n: int = 1):
+    """`result`: "local" (in-process hit), "redis" (Redis hit) or "miss"."""
+    stats = _current.get()
+    if stats is None:
+        return
+    if result == "local":
+        stats.cache_local_hits += n
+    elif result == "redis":
+        stats.cache_redis_hits += n
+    else:
+        stats.cache_misses += n
+
+
+# ---- aggregation ----
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Per-(method, route) histograms and counters (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes: dict[tuple[str, str], dict] = {}
+        self._statuses: dict[tuple[str, str, int], int] = {}
+
+    def observe(self, method: str, route: str, status: int, seconds: float, stats: RequestStats):
+        key = (method, route)
+        with self._lock:
+            entry = self._routes.get(key)
+            if entry is None:
+                entry = self._routes[key] = {
+                    "duration": Histogram(DURATION_BUCKETS),
+                    "queries": Histogram(QUERY_BUCKETS),
+                    "db_seconds": 0.0,
+                    "redis_calls": 0,
+                    "redis_seconds": 0.0,
+                    "cache": {"local_hit": 0, "redis_hit": 0, "miss": 0},
+                }
+            entry["duration"].observe(seconds)
+            entry["queries"].observe(stats.db_queries)
+            entry["db_seconds"] += stats.db_seconds
+            entry["redis_calls"] += stats.redis_calls
+            entry["redis_seconds"] += stats.redis_seconds
+            entry["cache"]["local_hit"] += stats.cache_local_hits
+            entry["cache"]["redis_hit"] += stats.cache_redis_hits
+            entry["cache"]["miss"] += stats.cache_misses
+            status_key = (method, route, status)
+            self._statuses[status_key] = self._statuses.get(status_key, 0) + 1
+
+    def render(self) -> str:
+        """Prometheus text exposition format (0.0.4)."""
+        with self._lock:
+            routes = sorted(self._routes.items())
+            statuses = sorted(self._statuses.items())
+            out = [
+                "# HELP http_requests_total Requests by route and status.",
+                "# TYPE http_requests_total counter",
+            ]
+            for (method, route, status), n in statuses:
+                out.append(f'http_requests_total{{method="{method}",route="{_escape(route)}",status="{status}"}} {n}')
+            for name, help_, kind in (
+                ("http_request_duration_seconds", "Request latency.", "duration"),
+                ("http_request_sql_queries", "SQL statements per request.", "queries"),
+            ):
+                out += [f"# HELP {name} {help_}", f"# TYPE {name} histogram"]
+                for (method, route), entry in routes:
+                    out += _render_histogram(name, f'method="{method}",route="{_escape(route)}"', entry[kind])
+            for name, help_, field in (
+                ("http_request_db_seconds_total", "Time spent in SQL statements.", "db_seconds"),
+                ("http_request_redis_calls_total", "Redis round trips.", "redis_calls"),
+                ("http_request_redis_seconds_total", "Time spent in Redis round trips.", "redis_seconds"),
+            ):
+                out += [f"# HELP {name} {help_}", f"# TYPE {name} counter"]
+                for (method, route), entry in routes:
+                    out.append(f'{name}{{method="{method}",route="{_escape(route)}"}} {_num(entry[field])}')
+            out += [
+                "# HELP http_request_cache_lookups_total Cache lookups by result (local_hit, redis_hit, miss).",
+                "# TYPE http_request_cache_lookups_total counter",
+            ]
+            for (method, route), entry in routes:
+                for result, n in entry["cache"].items():
+                    out.append(
+                        f'http_request_cache_lookups_total{{method="{method}",route="{_escape(route)}",result="{result}"}} {n}'
+                    )
+        return "\n".join(out) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+            self._statuses.clear()
+
+
+def _render_histogram(name: str, labels: str, h: Histogram) -> list[str]:
+    lines = [f'{name}_bucket{{{labels},le="{_num(b)}"}} {c}' for b, c in zip(h.buckets, h.counts)]
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {h.count}')
+    lines.append(f"{name}_sum{{{labels}}} {_num(h.total)}")
+    lines.append(f"{name}_count{{{labels}}} {h.count}")
+    return lines
+
+
+def _num(v: float) -> str:
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+registry = MetricsRegistry()
+
+
+# ---- middleware ----
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp, *, exclude_paths: tuple[str, ...] = ("/metrics",)):
+        self.app = app
+        self.exclude_paths = exclude_paths
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths:
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if settings.SERVER_TIMING_ENABLED:
+                    header = server_timing(stats, time.perf_counter() - started)
+                    message = {**message, "headers": [*message.get("headers", []), (b"server-timing", header.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            # the route template keeps label cardinality bounded; unmatched paths share one label
+            route_path = getattr(route, "path", None) or "<unmatched>"
+            registry.observe(scope["method"], route_path, status, time.perf_counter() - started, stats)
+
+
+def server_timing(stats: RequestStats, total_seconds: float) -> str:
+    """`Server-Timing` value (durations in ms, as of the response start)."""
+    return ", ".join((
+        f'db;dur={stats.db_seconds * 1000:.2f};desc="{stats.db_queries} queries"',
+        f'redis;dur={stats.redis_seconds * 1000:.2f};desc="{stats.redis_calls} calls"',
+        f'cache;desc="local={stats.cache_local_hits} redis={stats.cache_redis_hits} miss={stats.cache_misses}"',
+        f"app;dur={total_seconds * 1000:.2f}",
+    ))
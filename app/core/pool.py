@@ -0,0 +1,89 @@
+from __future__ import annotations
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+
+class PoolStats:
+    """Cumulative checkout counters for one pool (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.overflow_hits = 0
+        self.timeouts = 0
+
+    def record_checkout(self, waited: float):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+    def record_overflow(self):
+        with self._lock:
+            self.overflow_hits += 1
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            avg = self.wait_seconds_total / self.checkouts if self.checkouts else 0.0
+            return {
+                "checkouts": self.checkouts,
+                "wait_ms_avg": round(avg * 1000, 3),
+                "wait_ms_max": round(self.wait_seconds_max * 1000, 3),
+                "overflow_hits": self.overflow_hits,
+                "timeouts": self.timeouts,
+            }
+
+
+class _InstrumentedPool:
+    """Times every checkout (queue wait + pre-ping) and counts overflow connections."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            conn = super().connect()
+        except exc.TimeoutError:
+            self.stats.record_timeout()
+            raise
+        self.stats.record_checkout(time.perf_counter() - start)
+        return conn
+
+    def _create_connection(self):
+        # `_do_get` bumps the overflow counter before creating; > 0 means past pool_size
+        if self.overflow() > 0:
+            self.stats.record_overflow()
+        return super()._create_connection()
+
+    def recreate(self):
+        new = super().recreate()
+        new.stats = self.stats
+        return new
+
+    def snapshot(self) -> dict:
+        return {
+            "pool_size": self.size(),
+            "checked_out": self.checkedout(),
+            "checked_in": self.checkedin(),
+            "overflow": max(self.overflow(), 0),
+            **self.stats.snapshot(),
+        }
+
+
+class InstrumentedQueuePool(_InstrumentedPool, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedPool, AsyncAdaptedQueuePool):
+    pass
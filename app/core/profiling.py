@@ -0,0 +1,289 @@
+"""Opt-in request profiling (call tree + SQL timeline) and the slow-query log.
+
+- `PROFILING_ENABLED`: every `PROFILE_EVERY_N`-th request, and any request sending
+  `X-Profile: 1`, runs under cProfile with every SQL statement and its duration recorded;
+  the `PROFILE_KEEP` slowest are kept in memory for `GET /admin/profiles`
+- `SLOW_QUERY_MS`: statements slower than this (requests, Celery tasks, the relay) are
+  logged with their `EXPLAIN` plan
+
+One profiler runs at a time: the middleware's, enabled for the whole request (an
+overlapping sampled request keeps its SQL timeline only). From Python 3.12 cProfile sits on
+`sys.monitoring`, which sees every thread and allows a single profiler per process, so that
+one profiler also covers the threadpool; on 3.11 it sees only the loop thread, and work
+handed to the threadpool through `run_sync` / `profiled` gets a per-thread profiler, merged in.
+Other requests running meanwhile show up in the tree: read it together with the SQL
+timeline (a statement waiting on a row lock is one long entry there).
+"""
+from __future__ import annotations
+import cProfile
+import heapq
+import io
+import itertools
+import logging
+import pstats
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from sqlalchemy import event
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile"
+EXCLUDE_PATHS = ("/admin/profiles", "/metrics")
+# per profile: statements kept in the timeline, functions in the call tree
+MAX_STATEMENTS = 500
+TOP_FUNCTIONS = 60
+
+_current: ContextVar[RequestProfile | None] = ContextVar("request_profile", default=None)
+_ids = itertools.count(1)
+_requests = itertools.count()
+_loop_profiler = threading.Lock()
+# before 3.12 a profiler only sees the thread that enabled it
+PER_THREAD_PROFILERS = sys.version_info < (3, 12)
+
+
+class RequestProfile:
+    def __init__(self, method: str, path: str):
+        self.id = next(_ids)
+        self.method = method
+        self.path = path
+        self.route: str | None = None
+        self.status: int | None = None
+        self.captured_at = datetime.now(timezone.utc)
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+        self.statement_count = 0
+        self.db_seconds = 0.0
+        self.statements: list[dict] = []
+        self.call_tree: str | None = None
+        self.note: str | None = None
+        self._profilers: list[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def add_statement(self, statement: str, started: float, seconds: float):
+        with self._lock:
+            self.statement_count += 1
+            self.db_seconds += seconds
+            if len(self.statements) < MAX_STATEMENTS:
+                self.statements.append({
+                    "at_ms": round((started - self.started) * 1000, 2),
+                    "ms": round(seconds * 1000, 2),
+                    "sql": statement,
+                })
+
+    def add_profiler(self, profiler: cProfile.Profile):
+        with self._lock:
+            self._profilers.append(profiler)
+
+    def finish(self, status: int, route: str | None):
+        self.seconds = time.perf_counter() - self.started
+        self.status = status
+        self.route = route
+
+    def render(self):
+        """Turn the raw profilers into the text call tree (only for profiles that are kept)."""
+        if self._profilers:
+            out = io.StringIO()
+            stats = pstats.Stats(self._profilers[0], stream=out)
+            for profiler in self._profilers[1:]:
+                stats.add(profiler)
+            stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+            self.call_tree = out.getvalue()
+        self._profilers = []
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "captured_at": self.captured_at.isoformat(),
+            "duration_ms": round(self.seconds * 1000, 2),
+            "db_ms": round(self.db_seconds * 1000, 2),
+            "sql_count": self.statement_count,
+        }
+
+    def detail(self) -> dict:
+        return {**self.summary(), "note": self.note, "sql": self.statements, "call_tree": self.call_tree}
+
+
+class SlowestProfiles:
+    """The `PROFILE_KEEP` slowest profiles seen so far (thread-safe)."""
+
+    def __init__(self):
+        self._heap: list[tuple[float, int, RequestProfile]] = []
+        self._lock = threading.Lock()
+
+    def add(self, profile: RequestProfile) -> bool:
+        entry = (profile.seconds, profile.id, profile)
+        with self._lock:
+            if len(self._heap) < settings.PROFILE_KEEP:
+                heapq.heappush(self._heap, entry)
+            elif self._heap and entry[:2] > self._heap[0][:2]:
+                heapq.heapreplace(self._heap, entry)
+            else:
+                return False
+        profile.render()
+        return True
+
+    def slowest(self) -> list[RequestProfile]:
+        with self._lock:
+            return [p for _, _, p in sorted(self._heap, key=lambda e: e[:2], reverse=True)]
+
+    def get(self, profile_id: int) -> RequestProfile | None:
+        with self._lock:
+            return next((p for _, _, p in self._heap if p.id == profile_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._heap.clear()
+
+
+profiles = SlowestProfiles()
+
+
+def _start_profiler() -> cProfile.Profile | None:
+    """An enabled profiler, or None if another one (or a debugger / coverage tool) is active."""
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:  # 3.12+: "Another profiling tool is already active"
+        return None
+    return profiler
+
+
+def profiled(fn):
+    """Wrap `fn` (about to run in a threadpool thread) so the current profile covers it too.
+
+    A no-op from 3.12, where the request's profiler already sees every thread.
+    """
+    profile = _current.get()
+    if profile is None or not PER_THREAD_PROFILERS:
+        return fn
+
+    def wrapper(*args, **kwargs):
+        profiler = _start_profiler()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                profile.add_profiler(profiler)
+
+    return wrapper
+
+
+class ProfilingMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"].startswith(EXCLUDE_PATHS) or not _sampled(scope):
+            return await self.app(scope, receive, send)
+
+        profile = RequestProfile(scope["method"], scope["path"])
+        token = _current.set(profile)
+        status = 500
+
+        async def send_with_id(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", str(profile.id).encode())]}
+            await send(message)
+
+        loop_profiler = None
+        if _loop_profiler.acquire(blocking=False):
+            loop_profiler = _start_profiler()
+            if loop_profiler is None:
+                _loop_profiler.release()
+        if loop_profiler is None:
+            profile.note = "another profiler was active: SQL timeline only for the loop side"
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            if loop_profiler is not None:
+                loop_profiler.disable()
+                _loop_profiler.release()
+                profile.add_profiler(loop_profiler)
+            _current.reset(token)
+            profile.finish(status, getattr(scope.get("route"), "path", None))
+            profiles.add(profile)
+
+
+def _sampled(scope: Scope) -> bool:
+    for name, value in scope["headers"]:
+        if name == PROFILE_HEADER and value not in (b"", b"0"):
+            return True
+    n = settings.PROFILE_EVERY_N
+    return n > 0 and next(_requests) % n == 0
+
+
+# ---- SQL: per-request timeline + slow-query log ----
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None or settings.SLOW_QUERY_MS > 0:
+        conn.info.setdefault("profiling_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("profiling_query_start")
+    if not starts:
+        return
+    started = starts.pop()
+    seconds = time.perf_counter() - started
+    profile = _current.get()
+    if profile is not None:
+        profile.add_statement(statement, started, seconds)
+    if 0 < settings.SLOW_QUERY_MS <= seconds * 1000:
+        _log_slow_query(conn, statement, parameters, executemany, seconds)
+
+
+def profile_engine(engine):
+    """Record statements run on `engine` into sampled profiles and the slow-query log."""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    return engine
+
+
+def _log_slow_query(conn, statement, parameters, executemany, seconds):
+    plan = None
+    if settings.SLOW_QUERY_EXPLAIN and not executemany and statement.lstrip()[:6].lower().startswith(
+        ("select", "insert", "update", "delete", "with")
+    ):
+        plan = explain(conn, statement, parameters)
+    # parameters stay out of the log (customer data)
+    logger.warning(
+        "slow query (%.1f ms): %s%s", seconds * 1000, statement, f"\n{plan}" if plan else "",
+    )
+
+
+def explain(conn, statement: str, parameters) -> str | None:
+    """`EXPLAIN` (no ANALYZE: nothing runs twice) on the statement's own connection.
+
+    Runs in a savepoint so a failing EXPLAIN cannot abort the caller's transaction.
+    """
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute("SAVEPOINT slow_query_explain")
+        try:
+            cursor.execute("EXPLAIN " + statement, parameters)
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+        except Exception:
+            cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+            raise
+        cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+        return plan
+    except Exception:
+        logger.debug("EXPLAIN failed for slow query", exc_info=True)
+        return None
+    finally:
+        cursor.close()
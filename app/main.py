@@ -1,11 +1,22 @@
 from fastapi import FastAPI
 from app.core.config import settings
-from app.core.db import init_db
+from app.core.db import init_db, init_async_db
+from app.core.idempotency import IdempotencyMiddleware
+from app.core.metrics import MetricsMiddleware
+from app.core.profiling import ProfilingMiddleware
 from app.api.routes import router
 
 def create_app() -> FastAPI:
     app = FastAPI(title="Mini E-commerce API")
     init_db(settings.DATABASE_URL)
+    if settings.DB_ASYNC:
+        init_async_db(settings.DATABASE_URL)
+    app.add_middleware(IdempotencyMiddleware)
+    if settings.PROFILING_ENABLED:
+        app.add_middleware(ProfilingMiddleware)
+    if settings.METRICS_ENABLED:
+        # outermost: idempotency replays are measured too
+        app.add_middleware(MetricsMiddleware)
     app.include_router(router)
     return app
 
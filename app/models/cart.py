@@ -15,6 +15,11 @@ class Cart(Base):
     status: Mapped[CartStatus] = mapped_column(Enum(CartStatus, name="cart_status"), default=CartStatus.active, index=True)
     created_at: Mapped[object] = mapped_column(DateTime(timezone=True), server_default=func.now())
     updated_at: Mapped[object] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    # Denormalized from the items, kept by every item mutation (see cart_service._bump_totals):
+    # sum(qty * unit_price_cents), sum(qty), and the currency of the first item added
+    total_cents: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    item_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    currency: Mapped[str] = mapped_column(String(10), default="brl", server_default="brl")
 
     items = relationship("CartItem", back_populates="cart", cascade="all,delete-orphan")
 
@@ -1,6 +1,6 @@
 from __future__ import annotations
 import enum
-from sqlalchemy import Integer, String, ForeignKey, Enum, DateTime, func, UniqueConstraint
+from sqlalchemy import Integer, String, ForeignKey, Enum, DateTime, Index, func, UniqueConstraint
 from sqlalchemy import Enum as SAEnum
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from app.core.db import Base
@@ -13,6 +13,8 @@ class OrderStatus(str, enum.Enum):
 
 class Order(Base):
     __tablename__ = "orders"
+    # status filter + keyset order (id DESC) in one index scan
+    __table_args__ = (Index("ix_orders_status_id", "status", "id"),)
     id: Mapped[int] = mapped_column(primary_key=True)
     cart_id: Mapped[int] = mapped_column(ForeignKey("carts.id"), unique=True, index=True)
     total_cents: Mapped[int] = mapped_column(Integer)
@@ -27,7 +29,6 @@ class Order(Base):
         ),
         nullable=False,
         server_default=OrderStatus.pending_payment,
-        index=True,
     )
     created_at: Mapped[object] = mapped_column(DateTime(timezone=True), server_default=func.now())
 
@@ -0,0 +1,22 @@
+from __future__ import annotations
+from sqlalchemy import BigInteger, Integer, String, Text, DateTime, func
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Mapped, mapped_column
+from app.core.db import Base
+
+class OutboxMessage(Base):
+    """A task to publish, written in the same transaction as the change that calls for it.
+
+    The relay (`python -m app.outbox_relay`) publishes rows in id order and deletes them.
+    `attempts` counts failures of this row alone (broker outages do not count); at
+    `OUTBOX_MAX_ATTEMPTS` the row is parked.
+    """
+    __tablename__ = "outbox"
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    task: Mapped[str] = mapped_column(String(200))
+    args: Mapped[list] = mapped_column(JSONB, default=list)
+    kwargs: Mapped[dict] = mapped_column(JSONB, default=dict)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    last_error: Mapped[str | None] = mapped_column(Text, default=None)
+    created_at: Mapped[object] = mapped_column(DateTime(timezone=True), server_default=func.now())
@@ -30,6 +30,7 @@ class Payment(Base):
     amount_cents: Mapped[int] = mapped_column(Integer)
     currency: Mapped[str] = mapped_column(String(10), default="brl")
     stripe_session_id: Mapped[str | None] = mapped_column(String(255), index=True, default=None)
+    checkout_url: Mapped[str | None] = mapped_column(String(2048), default=None)
     stripe_payment_intent_id: Mapped[str | None] = mapped_column(String(255), index=True, default=None)
     created_at: Mapped[object] = mapped_column(DateTime(timezone=True), server_default=func.now())
 
@@ -0,0 +1,37 @@
+from __future__ import annotations
+import enum
+from sqlalchemy import Integer, ForeignKey, DateTime, Index, func, text, UniqueConstraint
+from sqlalchemy import Enum as SAEnum
+from sqlalchemy.orm import Mapped, mapped_column
+from app.core.db import Base
+
+class ReservationStatus(str, enum.Enum):
+    held = "HELD"
+    consumed = "CONSUMED"  # order paid: the stock is sold
+    released = "RELEASED"  # order cancelled/expired: the stock went back
+
+class StockReservation(Base):
+    """Stock taken out of `products.stock` for a pending order, until paid or released."""
+    __tablename__ = "stock_reservations"
+    __table_args__ = (
+        UniqueConstraint("order_id", "product_id", name="uq_reservation_order_product"),
+        Index("ix_stock_reservations_held_expires_at", "expires_at", postgresql_where=text("status = 'HELD'")),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    order_id: Mapped[int] = mapped_column(ForeignKey("orders.id"), index=True)
+    product_id: Mapped[int] = mapped_column(ForeignKey("products.id"))
+    qty: Mapped[int] = mapped_column(Integer)
+    status: Mapped[ReservationStatus] = mapped_column(
+        SAEnum(
+            ReservationStatus,
+            name="reservation_status",
+            values_callable=lambda e: [i.value for i in e],
+            native_enum=True,
+            create_type=False,
+        ),
+        nullable=False,
+        default=ReservationStatus.held,
+    )
+    expires_at: Mapped[object] = mapped_column(DateTime(timezone=True))
+    created_at: Mapped[object] = mapped_column(DateTime(timezone=True), server_default=func.now())
@@ -1,13 +1,42 @@
 from __future__ import annotations
-from sqlalchemy import String, DateTime, func, UniqueConstraint
+import enum
+from sqlalchemy import Integer, String, Text, DateTime, Index, func, text, UniqueConstraint
+from sqlalchemy import Enum as SAEnum
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, mapped_column
 from app.core.db import Base
 
+class WebhookStatus(str, enum.Enum):
+    received = "RECEIVED"    # in the inbox, waiting for (another) attempt
+    processed = "PROCESSED"
+    failed = "FAILED"        # gave up after WEBHOOK_MAX_ATTEMPTS; needs a human
+
 class WebhookEvent(Base):
+    """Inbox of provider events: stored as received, processed by a worker."""
     __tablename__ = "webhook_events"
-    __table_args__ = (UniqueConstraint("provider", "event_id", name="uq_provider_event_id"),)
+    __table_args__ = (
+        UniqueConstraint("provider", "event_id", name="uq_provider_event_id"),
+        Index("ix_webhook_events_due", "next_attempt_at", postgresql_where=text("status = 'RECEIVED'")),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     provider: Mapped[str] = mapped_column(String(30), default="stripe", index=True)
     event_id: Mapped[str] = mapped_column(String(255), index=True)
-    processed_at: Mapped[object] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    event_type: Mapped[str | None] = mapped_column(String(100), default=None)
+    payload: Mapped[dict | None] = mapped_column(JSONB, default=None)
+    status: Mapped[WebhookStatus] = mapped_column(
+        SAEnum(
+            WebhookStatus,
+            name="webhook_status",
+            values_callable=lambda e: [i.value for i in e],
+            native_enum=True,
+            create_type=False,
+        ),
+        nullable=False,
+        default=WebhookStatus.received,
+    )
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    next_attempt_at: Mapped[object] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    last_error: Mapped[str | None] = mapped_column(Text, default=None)
+    received_at: Mapped[object] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    processed_at: Mapped[object | None] = mapped_column(DateTime(timezone=True), default=None)
@@ -0,0 +1,42 @@
+"""Outbox relay process: `python -m app.outbox_relay`.
+
+Drains the `outbox` table whenever a transaction that queued a task commits (Postgres
+`LISTEN`/`NOTIFY`), and at least every `OUTBOX_POLL_SECONDS` (missed notifications,
+rows left behind while the broker was down). Several relays can run side by side.
+"""
+from __future__ import annotations
+import logging
+
+import psycopg
+from sqlalchemy import make_url
+
+from app.core.config import settings
+from app.core.db import session_scope
+from app.services.outbox_service import NOTIFY_CHANNEL, relay_outbox
+# registers the publishers for non-Celery outbox tasks
+import app.services.fulfillment_service  # noqa: F401
+
+logger = logging.getLogger(__name__)
+
+
+def run():
+    url = make_url(settings.DATABASE_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+    with psycopg.connect(url, autocommit=True) as listener:
+        listener.execute(f"LISTEN {NOTIFY_CHANNEL}")
+        logger.info("outbox relay listening on %r", NOTIFY_CHANNEL)
+        while True:
+            with session_scope() as db:
+                while _full_batch(relay_outbox(db)):
+                    pass
+            for _ in listener.notifies(timeout=settings.OUTBOX_POLL_SECONDS, stop_after=1):
+                pass
+
+
+def _full_batch(result: dict) -> bool:
+    """More rows are probably waiting, and the broker was reachable for this batch."""
+    return result["claimed"] == settings.OUTBOX_BATCH_SIZE and result["published"] + result["failed"] == result["claimed"]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run()
@@ -24,5 +24,6 @@ class CartOut(BaseModel):
     id: int
     status: str
     items: list[CartItemOut]
+    item_count: int
     total_cents: int
     currency: str
@@ -31,7 +31,23 @@ class OrderOut(BaseModel):
     class Config:
         from_attributes = True
 
+class OrderListOut(BaseModel):
+    items: list[OrderOut]
+    next_cursor: int | None
+
 class CheckoutOut(BaseModel):
     order_id: int
     session_id: str
     checkout_url: str
+
+class CheckoutAcceptedOut(BaseModel):
+    order_id: int
+    status: str
+    status_url: str
+
+class CheckoutStatusOut(BaseModel):
+    order_id: int
+    order_status: str
+    status: str
+    session_id: str | None
+    checkout_url: str | None
@@ -1,7 +1,8 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 class ProductCreate(BaseModel):
     category_id: int
+    sku: str | None = None
     name: str
     description: str | None = None
     price_cents: int
@@ -10,6 +11,7 @@ class ProductCreate(BaseModel):
     active: bool = True
 
 class ProductPatch(BaseModel):
+    sku: str | None = None
     name: str | None = None
     description: str | None = None
     price_cents: int | None = None
@@ -21,6 +23,7 @@ class ProductPatch(BaseModel):
 class ProductOut(BaseModel):
     id: int
     category_id: int
+    sku: str | None
     name: str
     description: str | None
     price_cents: int
@@ -30,3 +33,35 @@ class ProductOut(BaseModel):
 
     class Config:
         from_attributes = True
+
+class ProductBatchIn(BaseModel):
+    ids: list[int] = Field(min_length=1, max_length=200)
+
+class ProductImportRow(ProductCreate):
+    # column limits checked per row, so one bad row cannot fail its whole batch
+    sku: str = Field(min_length=1, max_length=64)
+    name: str = Field(max_length=200)
+    price_cents: int = Field(ge=0)
+    currency: str = Field(default="brl", max_length=10)
+    stock: int = Field(default=0, ge=0)
+
+class ProductImportOut(BaseModel):
+    inserted: int
+    updated: int
+    superseded: int
+    failed: int
+    errors: list[dict]
+    errors_truncated: bool
+
+class ProductAdjustment(BaseModel):
+    product_id: int
+    stock_delta: int = 0
+    price_cents: int | None = Field(default=None, ge=0)
+
+class ProductAdjustIn(BaseModel):
+    items: list[ProductAdjustment] = Field(min_length=1, max_length=10_000)
+    atomic: bool = False
+
+class ProductAdjustOut(BaseModel):
+    applied: list[dict]
+    rejected: list[dict]
@@ -1,60 +1,178 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import select
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import case, exists, func, literal, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from fastapi import HTTPException
 
+from app.core.config import settings
 from app.models.cart import Cart, CartItem, CartStatus
 from app.models.product import Product
 from app.models.order import Order, OrderStatus
+from app.models.reservation import ReservationStatus, StockReservation
+from app.services import cart_store
+from app.services.catalog_service import get_product
+from app.services.reservation_service import release_reservations
+
+_carts = Cart.__table__
+_items = CartItem.__table__
+_products = Product.__table__
+
+def _redis_backend() -> bool:
+    return settings.CART_BACKEND == "redis"
 
 def create_cart(db: Session) -> Cart:
+    if _redis_backend():
+        return cart_store.create(db)
     c = Cart(status=CartStatus.active)
     db.add(c)
     db.commit()
     db.refresh(c)
     return c
 
+def _load_cart(db: Session, cart_id: int, *, refresh: bool = False) -> Cart | None:
+    """Cart (totals included) and its items in 2 queries, however many items."""
+    q = db.query(Cart).options(selectinload(Cart.items))
+    if refresh:
+        # re-run the eager loads on a cart already in the session (after a mutation)
+        q = q.populate_existing()
+    return q.filter(Cart.id == cart_id).first()
+
 def get_cart(db: Session, cart_id: int) -> Cart:
-    c = db.query(Cart).filter(Cart.id == cart_id).first()
+    if _redis_backend():
+        stored = cart_store.load(cart_id)
+        if stored is not None:
+            return stored
+        # checked-out / expired carts live in Postgres
+    c = _load_cart(db, cart_id)
     if not c:
         raise HTTPException(status_code=404, detail="Cart not found")
     return c
 
 def cart_totals(cart: Cart):
-    total = sum(i.qty * i.unit_price_cents for i in cart.items)
-    currency = cart.items[0].product.currency if cart.items else "brl"
-    return total, currency
+    # columns on `carts` (no item walk); Redis carts derive them from their items
+    return cart.total_cents, cart.currency
+
+def _lock_cart(db: Session, cart_id: int) -> Cart:
+    """The cart row, locked until commit: mutations of one cart (and checkout) queue up,
+    so the incremental totals never see a concurrent change."""
+    cart = db.query(Cart).filter(Cart.id == cart_id).with_for_update().first()
+    if not cart:
+        raise HTTPException(status_code=404, detail="Cart not found")
+    return cart
+
+def _bump_totals(cart: Cart, cents: int, units: int):
+    """Apply a change to an existing item to the denormalized totals (as SQL increments, in the same UPDATE).
+
+    Adding an item goes through `_upsert_item`, which also sets the currency of an empty cart.
+    """
+    cart.total_cents = Cart.total_cents + cents
+    cart.item_count = Cart.item_count + units
+    cart.updated_at = func.now()  # last activity, for the expiry sweeper
+
+def persist_cart(db: Session, cart_id: int):
+    """Write-behind point: stage a Redis cart into Postgres within the caller's transaction."""
+    if _redis_backend():
+        cart_store.persist(db, cart_id)
+
+def forget_cart(cart_id: int):
+    """Drop the Redis copy once Postgres owns the cart (after the checkout commit)."""
+    if _redis_backend():
+        cart_store.discard(cart_id)
+
+def _stored_cart_mutation(db: Session, cart_id: int, mutate) -> Cart:
+    try:
+        mutate()
+    except cart_store.NotInStore:
+        get_cart(db, cart_id)  # 404 if it exists nowhere
+        raise HTTPException(status_code=400, detail="cart not active")
+    return get_cart(db, cart_id)
 
 def add_item(db: Session, cart_id: int, product_id: int, qty: int) -> Cart:
     if qty <= 0:
         raise HTTPException(status_code=400, detail="qty must be > 0")
-    cart = get_cart(db, cart_id)
-    if cart.status != CartStatus.active:
+    if _redis_backend():
+        # cached product read; stock is re-checked authoritatively at checkout
+        product = get_product(db, product_id)
+        if not product or not product["active"]:
+            raise HTTPException(status_code=404, detail="Product not found")
+        return _stored_cart_mutation(db, cart_id, lambda: cart_store.add_item(cart_id, product, qty))
+    result = db.execute(_upsert_item(cart_id, product_id, qty)).one()
+    if result.cart_status is None:
+        raise HTTPException(status_code=404, detail="Cart not found")
+    if result.cart_status != CartStatus.active:
         raise HTTPException(status_code=400, detail="cart not active")
-
-    product = db.query(Product).filter(Product.id == product_id, Product.active.is_(True)).first()
-    if not product:
+    if result.stock is None:
         raise HTTPException(status_code=404, detail="Product not found")
-    if product.stock < qty:
+    if result.item_qty is None:
         raise HTTPException(status_code=409, detail="Insufficient stock")
+    db.commit()
+    return _load_cart(db, cart_id, refresh=True)
 
-    existing = db.query(CartItem).filter(CartItem.cart_id == cart_id, CartItem.product_id == product_id).first()
-    if existing:
-        new_qty = existing.qty + qty
-        if product.stock < new_qty:
-            raise HTTPException(status_code=409, detail="Insufficient stock")
-        existing.qty = new_qty
-    else:
-        item = CartItem(cart_id=cart_id, product_id=product_id, qty=qty, unit_price_cents=product.price_cents)
-        db.add(item)
+def _upsert_item(cart_id: int, product_id: int, qty: int):
+    """`add_item` as one statement: lock the cart, upsert the line, bump the totals.
 
-    db.commit()
-    db.refresh(cart)
-    return cart
+    - `INSERT ... ON CONFLICT (cart_id, product_id) DO UPDATE SET qty = qty + EXCLUDED.qty`:
+      a line that already exists keeps its captured unit price; no SELECT-then-INSERT race
+    - stock is checked against the new line qty inside the insert (new line) or the
+      `DO UPDATE ... WHERE` (existing line): nothing is written if it does not fit
+    - the cart's totals are updated from the upserted row, as `_bump_totals` does; an empty
+      cart takes the product's currency (the only place that rule lives)
+
+    Returns one row (`cart_status`, `stock`, `item_qty`); NULLs say what was missing.
+    """
+    cart = (
+        select(_carts.c.id, _carts.c.status)
+        .where(_carts.c.id == cart_id)
+        .with_for_update()
+        .cte("cart")
+    )
+    product = (
+        select(_products.c.id, _products.c.price_cents, _products.c.currency, _products.c.stock)
+        .where(_products.c.id == product_id, _products.c.active.is_(True))
+        .cte("product")
+    )
+    insert_line = pg_insert(_items).from_select(
+        ["cart_id", "product_id", "qty", "unit_price_cents"],
+        select(cart.c.id, product.c.id, literal(qty), product.c.price_cents)
+        .where(cart.c.status == CartStatus.active, product.c.stock >= qty),
+    )
+    upserted = (
+        insert_line.on_conflict_do_update(
+            index_elements=[_items.c.cart_id, _items.c.product_id],
+            set_={"qty": _items.c.qty + insert_line.excluded.qty},
+            where=_items.c.qty + insert_line.excluded.qty <= select(product.c.stock).scalar_subquery(),
+        )
+        .returning(_items.c.qty, _items.c.unit_price_cents)
+        .cte("upserted")
+    )
+    totals = (
+        update(_carts)
+        .where(_carts.c.id == cart_id, exists(select(upserted.c.qty)))
+        .values(
+            total_cents=_carts.c.total_cents + qty * select(upserted.c.unit_price_cents).scalar_subquery(),
+            item_count=_carts.c.item_count + qty,
+            # an empty cart takes the currency of the first item added
+            currency=case((_carts.c.item_count == 0, select(product.c.currency).scalar_subquery()), else_=_carts.c.currency),
+            updated_at=func.now(),  # last activity, for the expiry sweeper
+        )
+        .returning(_carts.c.id)
+        .cte("totals")
+    )
+    return select(
+        select(cart.c.status).scalar_subquery().label("cart_status"),
+        select(product.c.stock).scalar_subquery().label("stock"),
+        select(upserted.c.qty).scalar_subquery().label("item_qty"),
+        # referenced so the UPDATE is rendered (and executed) with the rest
+        select(totals.c.id).scalar_subquery().label("cart_id"),
+    )
 
 def patch_item_qty(db: Session, cart_id: int, item_id: int, qty: int) -> Cart:
     if qty <= 0:
         raise HTTPException(status_code=400, detail="qty must be > 0")
-    cart = get_cart(db, cart_id)
+    if _redis_backend():
+        product = get_product(db, item_id)  # item id == product id in Redis carts
+        stock = product["stock"] if product else 0
+        return _stored_cart_mutation(db, cart_id, lambda: cart_store.set_item_qty(cart_id, item_id, qty, stock))
+    cart = _lock_cart(db, cart_id)
     if cart.status != CartStatus.active:
         raise HTTPException(status_code=400, detail="cart not active")
 
@@ -66,24 +184,31 @@ def patch_item_qty(db: Session, cart_id: int, item_id: int, qty: int) -> Cart:
     if product.stock < qty:
         raise HTTPException(status_code=409, detail="Insufficient stock")
 
+    _bump_totals(cart, (qty - item.qty) * item.unit_price_cents, qty - item.qty)
     item.qty = qty
     db.commit()
-    db.refresh(cart)
-    return cart
+    return _load_cart(db, cart_id, refresh=True)
 
 def delete_item(db: Session, cart_id: int, item_id: int) -> Cart:
-    cart = get_cart(db, cart_id)
+    if _redis_backend():
+        return _stored_cart_mutation(db, cart_id, lambda: cart_store.set_item_qty(cart_id, item_id, 0, 0))
+    cart = _lock_cart(db, cart_id)
     item = db.query(CartItem).filter(CartItem.id == item_id, CartItem.cart_id == cart_id).first()
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
+    _bump_totals(cart, -item.qty * item.unit_price_cents, -item.qty)
     db.delete(item)
     db.commit()
+    return _load_cart(db, cart_id, refresh=True)
+
 def expire_cart(db: Session, cart_id: int):
     """Expire a cart and (if needed) release reserved stock.
 
-    Stock is reserved at checkout (rows locked + stock decremented). If the payment
-    never completes, we cancel the pending order and restore stock.
+    Stock is reserved at checkout (see `reservation_service`). If the payment
+    never completes, we cancel the pending order and release the reservation.
     """
+    if _redis_backend() and cart_store.expire(cart_id):
+        return
     cart = db.query(Cart).filter(Cart.id == cart_id).first()
     if not cart:
         return
@@ -106,23 +231,63 @@ def expire_cart(db: Session, cart_id: int):
         if order.status != OrderStatus.pending_payment:
             return
 
-        # Lock product rows and restore stock
-        product_ids = [it.product_id for it in order.items]
-        products = db.execute(
-            select(Product)
-            .where(Product.id.in_(product_ids))
-            .with_for_update()
-        ).scalars().all()
-        by_id = {p.id: p for p in products}
-
-        for it in order.items:
-            p = by_id.get(it.product_id)
-            if p:
-                p.stock += it.qty
-
+        release_reservations(db, order.id)
         order.status = OrderStatus.cancelled
         cart.status = CartStatus.expired
         db.commit()
     if cart.status == CartStatus.active:
         cart.status = CartStatus.expired
         db.commit()
+
+def sweep_expired_carts(db: Session, *, limit: int | None = None) -> dict:
+    """One batch of the periodic expiry sweep (beat), in one transaction.
+
+    - active carts idle for `CART_TTL_SECONDS` → `expired` (they hold no stock)
+    - pending orders whose reservation ran out → `CANCELLED`, stock released, cart `expired`
+
+    Rows are claimed with `FOR UPDATE SKIP LOCKED`, so concurrent sweepers (or a
+    checkout / payment touching the same row) never wait on each other.
+    """
+    limit = limit or settings.CART_SWEEP_BATCH_SIZE
+    idle_before = func.now() - func.make_interval(0, 0, 0, 0, 0, 0, settings.CART_TTL_SECONDS)
+    stale = (
+        select(Cart.id)
+        .where(Cart.status == CartStatus.active, Cart.updated_at < idle_before)
+        .order_by(Cart.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    expired_carts = db.execute(
+        update(Cart)
+        .where(Cart.id.in_(stale))
+        .values(status=CartStatus.expired)
+        .returning(Cart.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+
+    due = (
+        select(StockReservation.order_id)
+        .where(StockReservation.status == ReservationStatus.held, StockReservation.expires_at < func.now())
+    )
+    orders = db.execute(
+        select(Order.id, Order.cart_id)
+        .where(Order.id.in_(due), Order.status == OrderStatus.pending_payment)
+        .order_by(Order.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    ).all()
+    released = 0
+    if orders:
+        order_ids = [o.id for o in orders]
+        released = release_reservations(db, *order_ids)
+        db.execute(
+            update(Order).where(Order.id.in_(order_ids)).values(status=OrderStatus.cancelled)
+            .execution_options(synchronize_session=False)
+        )
+        db.execute(
+            update(Cart).where(Cart.id.in_([o.cart_id for o in orders])).values(status=CartStatus.expired)
+            .execution_options(synchronize_session=False)
+        )
+    db.commit()
+    return {"carts_expired": len(expired_carts), "orders_cancelled": len(orders), "lines_released": released}
@@ -0,0 +1,216 @@
+"""Redis-backed storage for active carts (`CART_BACKEND=redis`).
+
+Active carts live only in Redis (sliding `CART_TTL_SECONDS`, so abandoned carts simply
+expire) and are written to `carts` / `cart_items` at checkout, inside the checkout
+transaction. Once persisted, Postgres is the source of truth for that cart.
+
+Layout:
+- `cart:{id}`        hash: status, currency
+- `cart:{id}:qty`    hash: product_id -> qty
+- `cart:{id}:price`  hash: product_id -> unit_price_cents (captured at first add)
+- `cart:ids`         list: cart ids reserved from the `carts` sequence, not handed out yet
+
+In this backend a cart item's id is its product id.
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field
+
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.core.cache import get_redis
+from app.core.config import settings
+from app.models.cart import Cart, CartItem, CartStatus
+
+
+@dataclass
+class StoredCartItem:
+    id: int
+    product_id: int
+    qty: int
+    unit_price_cents: int
+
+
+@dataclass
+class StoredCart:
+    id: int
+    status: CartStatus
+    currency: str
+    items: list[StoredCartItem] = field(default_factory=list)
+
+    # same interface as the denormalized `Cart` columns
+    @property
+    def total_cents(self) -> int:
+        return sum(i.qty * i.unit_price_cents for i in self.items)
+
+    @property
+    def item_count(self) -> int:
+        return sum(i.qty for i in self.items)
+
+
+def _keys(cart_id: int) -> list[str]:
+    return [f"cart:{cart_id}", f"cart:{cart_id}:qty", f"cart:{cart_id}:price"]
+
+# KEYS: cart, qty, price   ARGV: product_id, qty, unit_price, currency, stock, ttl
+# -> new qty | -1 insufficient stock | -2 cart not active | -4 cart not in Redis
+_ADD_ITEM = """
+local status = redis.call("hget", KEYS[1], "status")
+if not status then return -4 end
+if status ~= "active" then return -2 end
+local new_qty = tonumber(redis.call("hget", KEYS[2], ARGV[1]) or "0") + tonumber(ARGV[2])
+if new_qty > tonumber(ARGV[5]) then return -1 end
+redis.call("hset", KEYS[2], ARGV[1], new_qty)
+redis.call("hsetnx", KEYS[3], ARGV[1], ARGV[3])
+redis.call("hsetnx", KEYS[1], "currency", ARGV[4])
+for i = 1, 3 do redis.call("expire", KEYS[i], ARGV[6]) end
+return new_qty
+"""
+
+# KEYS: cart, qty, price   ARGV: product_id, qty (0 = delete), stock, ttl
+# -> qty | -1 insufficient stock | -2 cart not active | -3 item missing | -4 cart not in Redis
+_SET_ITEM = """
+local status = redis.call("hget", KEYS[1], "status")
+if not status then return -4 end
+if status ~= "active" then return -2 end
+if redis.call("hexists", KEYS[2], ARGV[1]) == 0 then return -3 end
+if tonumber(ARGV[2]) == 0 then
+    redis.call("hdel", KEYS[2], ARGV[1])
+    redis.call("hdel", KEYS[3], ARGV[1])
+elseif tonumber(ARGV[2]) > tonumber(ARGV[3]) then
+    return -1
+else
+    redis.call("hset", KEYS[2], ARGV[1], ARGV[2])
+end
+for i = 1, 3 do redis.call("expire", KEYS[i], ARGV[4]) end
+return tonumber(ARGV[2])
+"""
+
+_ERRORS = {
+    -1: (409, "Insufficient stock"),
+    -2: (400, "cart not active"),
+    -3: (404, "Item not found"),
+}
+
+
+class NotInStore(Exception):
+    """The cart is not (or no longer) held in Redis; Postgres decides what it is."""
+
+
+def _check(result: int):
+    if result == -4:
+        raise NotInStore()
+    if result in _ERRORS:
+        status, detail = _ERRORS[result]
+        raise HTTPException(status_code=status, detail=detail)
+
+
+CART_IDS_KEY = "cart:ids"
+
+
+def _next_cart_id(db: Session) -> int:
+    """A cart id from the `carts` sequence, without a Postgres round trip per cart.
+
+    Ids are reserved from the sequence `CART_ID_BLOCK_SIZE` at a time and handed out from a
+    Redis list, so they never collide with carts created by the db backend. Trade-offs: ids
+    are not in creation order across blocks, ids still in the list when Redis loses it are
+    gaps, and `cart:ids` must be dropped if the database is recreated without Redis.
+    """
+    r = get_redis()
+    cart_id = r.lpop(CART_IDS_KEY)
+    if cart_id is not None:
+        return int(cart_id)
+    cart_id, *spare = db.execute(
+        text("SELECT nextval('carts_id_seq') FROM generate_series(1, :n)"), {"n": settings.CART_ID_BLOCK_SIZE}
+    ).scalars().all()
+    db.commit()
+    if spare:
+        r.rpush(CART_IDS_KEY, *spare)
+    return cart_id
+
+
+def create(db: Session) -> StoredCart:
+    # ids come from the carts sequence so they stay unique once persisted
+    cart_id = _next_cart_id(db)
+    key = _keys(cart_id)[0]
+    pipe = get_redis().pipeline(transaction=False)
+    pipe.hset(key, mapping={"status": CartStatus.active.value})
+    pipe.expire(key, settings.CART_TTL_SECONDS)
+    pipe.execute()
+    return StoredCart(id=cart_id, status=CartStatus.active, currency="brl")
+
+
+def load(cart_id: int) -> StoredCart | None:
+    pipe = get_redis().pipeline(transaction=False)
+    for k in _keys(cart_id):
+        pipe.hgetall(k)
+    meta, qtys, prices = pipe.execute()
+    if not meta:
+        return None
+    items = [
+        StoredCartItem(id=int(pid), product_id=int(pid), qty=int(q), unit_price_cents=int(prices.get(pid, 0)))
+        for pid, q in sorted(qtys.items(), key=lambda kv: int(kv[0]))
+    ]
+    return StoredCart(
+        id=cart_id,
+        status=CartStatus(meta["status"]),
+        currency=meta.get("currency", "brl"),
+        items=items,
+    )
+
+
+def add_item(cart_id: int, product: dict, qty: int):
+    result = get_redis().eval(
+        _ADD_ITEM, 3, *_keys(cart_id),
+        product["id"], qty, product["price_cents"], product["currency"], product["stock"],
+        settings.CART_TTL_SECONDS,
+    )
+    _check(int(result))
+
+
+def set_item_qty(cart_id: int, product_id: int, qty: int, stock: int):
+    """`qty=0` removes the item."""
+    result = get_redis().eval(_SET_ITEM, 3, *_keys(cart_id), product_id, qty, stock, settings.CART_TTL_SECONDS)
+    _check(int(result))
+
+
+def expire(cart_id: int) -> bool:
+    """Mark an active Redis cart expired; False if the cart is not in Redis."""
+    key = _keys(cart_id)[0]
+    r = get_redis()
+    if not r.exists(key):
+        return False
+    r.hset(key, "status", CartStatus.expired.value)
+    return True
+
+
+def persist(db: Session, cart_id: int):
+    """Write an active Redis cart to `carts`/`cart_items` (no commit: joins the caller's transaction).
+
+    `ON CONFLICT DO NOTHING` makes a concurrent second checkout of the same cart fall
+    through to the regular "Cart not active" path once the first one commits.
+    """
+    cart = load(cart_id)
+    if cart is None or cart.status != CartStatus.active:
+        return
+    inserted = db.execute(
+        insert(Cart)
+        .values(
+            id=cart.id, status=CartStatus.active,
+            total_cents=cart.total_cents, item_count=cart.item_count, currency=cart.currency,
+        )
+        .on_conflict_do_nothing()
+        .returning(Cart.id)
+    ).first()
+    if not inserted or not cart.items:
+        return
+    db.execute(insert(CartItem).values([
+        {"cart_id": cart.id, "product_id": i.product_id, "qty": i.qty, "unit_price_cents": i.unit_price_cents}
+        for i in cart.items
+    ]))
+
+
+def discard(cart_id: int):
+    get_redis().delete(*_keys(cart_id))
+
@@ -1,10 +1,21 @@
+import hashlib
+from fastapi import HTTPException
+from sqlalchemy import Float, Integer, and_, cast, column, func, or_, select, update, values
+from sqlalchemy.dialects.postgresql import REGCONFIG
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from app.models.category import Category
 from app.models.product import Product
 from app.services.utils import slugify
-from app.core.cache import cache_get_json, cache_set_json, cache_del
+from app.core.cache import (
+    cache_bump_version, cache_del, cache_get_or_compute_json, cache_get_or_compute_many_json, cache_get_version,
+)
 
 PRODUCT_LIST_KEY = "products:list"
+PRODUCT_LIST_GEN_KEY = "products:list:gen"
+PRODUCT_SEARCH_KEY = "products:search"
+INVALIDATION_CHUNK = 1000
+SEARCH_CONFIG = "simple"  # must match the generated column (migration 0002)
 PRODUCT_KEY_PREFIX = "product:"
 
 def list_products(
@@ -22,14 +33,33 @@ def list_products(
     """
     # Normalize / guardrails
     limit = max(1, min(int(limit), 100))
+    q = normalize_query(q)
 
-    # Cache only for the "default first page" (no filters, no cursor)
-    cacheable = (not category_slug and not q and after_id is None and limit == 20)
-    if cacheable:
-        cached = cache_get_json(PRODUCT_LIST_KEY)
-        if cached is not None:
-            return cached
+    def compute() -> dict:
+        return _query_products(db, category_slug, q, limit=limit, after_id=after_id)
 
+    return cache_get_or_compute_json(
+        product_list_key(category_slug, q, after_id, limit), compute, ttl_seconds=60
+    )
+
+def normalize_query(q: str | None) -> str | None:
+    q = " ".join((q or "").split()).lower()
+    return q or None
+
+def product_list_key(category_slug: str | None, q: str | None, after_id: int | None, limit: int) -> str:
+    """Every listing page gets its own key inside the current catalog generation."""
+    gen = cache_get_version(PRODUCT_LIST_GEN_KEY)
+    q_part = hashlib.sha1(q.encode()).hexdigest()[:16] if q else "-"
+    return f"{PRODUCT_LIST_KEY}:v{gen}:{category_slug or '-'}:{q_part}:{after_id or 0}:{limit}"
+
+def _query_products(
+    db: Session,
+    category_slug: str | None,
+    q: str | None,
+    *,
+    limit: int,
+    after_id: int | None,
+) -> dict:
     query = db.query(Product).filter(Product.active.is_(True))
     if category_slug:
         query = query.join(Category).filter(Category.slug == category_slug)
@@ -46,26 +76,117 @@ def list_products(
     result_items = [serialize_product(p) for p in items]
     next_cursor = items[-1].id if (has_more and items) else None
 
-    result = {"items": result_items, "next_cursor": next_cursor}
+    return {"items": result_items, "next_cursor": next_cursor}
+
+def search_products(db: Session, q: str, *, limit: int = 20, cursor: str | None = None) -> dict:
+    """Ranked product search over name + description.
+
+    - Full-text (`search_vector @@ websearch_to_tsquery`, GIN): ordered by rank DESC, id ASC
+    - No full-text hit on the first page: partial match on name (`ILIKE`, trigram GIN), by id
+    - Cursor: opaque string encoding the last row's sort key (`f:<rank>:<id>` / `p:<id>`)
+    """
+    limit = max(1, min(int(limit), 100))
+    q = normalize_query(q)
+    if not q:
+        raise HTTPException(status_code=400, detail="q is required")
+    mode, after = _decode_search_cursor(cursor)
 
-    if cacheable:
-        cache_set_json(PRODUCT_LIST_KEY, result, ttl_seconds=60)
+    def compute() -> dict:
+        if mode in (None, "f"):
+            page = _fulltext_page(db, q, limit, after)
+            if page["items"] or mode == "f":
+                return page
+        return _partial_page(db, q, limit, after if mode == "p" else None)
 
-    return result
+    gen = cache_get_version(PRODUCT_LIST_GEN_KEY)
+    q_hash = hashlib.sha1(q.encode()).hexdigest()[:16]
+    key = f"{PRODUCT_SEARCH_KEY}:v{gen}:{q_hash}:{cursor or '-'}:{limit}"
+    return cache_get_or_compute_json(key, compute, ttl_seconds=60)
+
+def _fulltext_page(db: Session, q: str, limit: int, after: tuple | None) -> dict:
+    tsquery = func.websearch_to_tsquery(cast(SEARCH_CONFIG, REGCONFIG), q)
+    # float8 so the value round-trips exactly through the cursor
+    rank = cast(func.ts_rank_cd(Product.search_vector, tsquery), Float)
+    query = (
+        db.query(Product, rank)
+        .filter(Product.active.is_(True), Product.search_vector.op("@@")(tsquery))
+    )
+    if after is not None:
+        last_rank, last_id = after
+        query = query.filter(or_(rank < last_rank, and_(rank == last_rank, Product.id > last_id)))
+    rows = query.order_by(rank.desc(), Product.id.asc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = None
+    if has_more and rows:
+        p, r = rows[-1]
+        next_cursor = f"f:{r!r}:{p.id}"
+    return {"items": [serialize_product(p) for p, _ in rows], "next_cursor": next_cursor}
+
+def _partial_page(db: Session, q: str, limit: int, after_id: int | None) -> dict:
+    escaped = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    query = db.query(Product).filter(Product.active.is_(True), Product.name.ilike(f"%{escaped}%"))
+    if after_id is not None:
+        query = query.filter(Product.id > after_id)
+    items = query.order_by(Product.id.asc()).limit(limit + 1).all()
+    has_more = len(items) > limit
+    items = items[:limit]
+    next_cursor = f"p:{items[-1].id}" if (has_more and items) else None
+    return {"items": [serialize_product(p) for p in items], "next_cursor": next_cursor}
+
+def _decode_search_cursor(cursor: str | None):
+    if not cursor:
+        return None, None
+    try:
+        mode, _, rest = cursor.partition(":")
+        if mode == "f":
+            r, _, pid = rest.partition(":")
+            return "f", (float(r), int(pid))
+        if mode == "p":
+            return "p", int(rest)
+    except ValueError:
+        pass
+    raise HTTPException(status_code=400, detail="Invalid cursor")
 
 def get_product(db: Session, product_id: int):
-    key = f"{PRODUCT_KEY_PREFIX}{product_id}"
-    cached = cache_get_json(key)
-    if cached is not None:
-        return cached
-    p = db.query(Product).filter(Product.id == product_id).first()
-    if not p:
-        return None
-    data = serialize_product(p)
-    cache_set_json(key, data, ttl_seconds=120)
-    return data
+    def compute():
+        p = db.query(Product).filter(Product.id == product_id).first()
+        return serialize_product(p) if p else None
+
+    return cache_get_or_compute_json(f"{PRODUCT_KEY_PREFIX}{product_id}", compute, ttl_seconds=120)
+
+def get_products_many(db: Session, product_ids: list[int]) -> dict:
+    """`get_product` for many ids in about three round trips, whatever the count.
+
+    One `MGET` (after the in-process tier), one `WHERE id IN (...)` for the misses and one
+    pipeline to cache them. Items keep the requested order (duplicates dropped); unknown
+    ids are listed under `missing`.
+    """
+    product_ids = list(dict.fromkeys(product_ids))
+    keys = {pid: f"{PRODUCT_KEY_PREFIX}{pid}" for pid in product_ids}
+
+    def compute_many(missing_keys: list[str]) -> dict:
+        ids = [int(k[len(PRODUCT_KEY_PREFIX):]) for k in missing_keys]
+        rows = db.query(Product).filter(Product.id.in_(ids)).all()
+        return {keys[p.id]: serialize_product(p) for p in rows}
+
+    cached = cache_get_or_compute_many_json(list(keys.values()), compute_many, ttl_seconds=120)
+    items, missing = [], []
+    for pid in product_ids:
+        p = cached.get(keys[pid])
+        if p is None:
+            missing.append(pid)
+        else:
+            items.append(p)
+    return {"items": items, "missing": missing}
+
+def list_categories(db: Session) -> list[Category]:
+    return db.query(Category).order_by(Category.id.asc()).all()
 
 def create_category(db: Session, name: str) -> Category:
+    exists = db.query(Category).filter(Category.name == name).first()
+    if exists:
+        raise HTTPException(status_code=409, detail="Category exists")
     slug = slugify(name)
     c = Category(name=name, slug=slug)
     db.add(c)
@@ -73,16 +194,109 @@ def create_category(db: Session, name: str) -> Category:
     db.refresh(c)
     return c
 
+def create_product(db: Session, data: dict) -> Product:
+    p = Product(**data)
+    db.add(p)
+    _commit_product(db)
+    db.refresh(p)
+    invalidate_product_cache(p.id)
+    return p
+
+def update_product(db: Session, product_id: int, data: dict) -> Product:
+    p = db.query(Product).filter(Product.id == product_id).first()
+    if not p:
+        raise HTTPException(status_code=404, detail="Product not found")
+    for k, v in data.items():
+        setattr(p, k, v)
+    _commit_product(db)
+    db.refresh(p)
+    invalidate_product_cache(p.id)
+    return p
+
+# constraints a client can trip on products; any other violation is a bug and stays a 500
+_PRODUCT_CONFLICTS = {
+    "ix_products_sku": "SKU exists",
+    "products_category_id_fkey": "Category not found",
+}
+
+def _commit_product(db: Session):
+    try:
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        detail = _PRODUCT_CONFLICTS.get(e.orig.diag.constraint_name)
+        if detail is None:
+            raise
+        raise HTTPException(status_code=409, detail=detail) from e
+
+def invalidate_products_cache(product_ids):
+    """Bulk variant of `invalidate_product_cache`.
+
+    Up to INVALIDATION_CHUNK ids this is a single pipelined round trip (DEL + INCR + PUBLISH);
+    larger sets are deleted chunk by chunk to keep commands and pub/sub messages small.
+    """
+    keys = [f"{PRODUCT_KEY_PREFIX}{pid}" for pid in product_ids]
+    chunks = [keys[i:i + INVALIDATION_CHUNK] for i in range(0, len(keys), INVALIDATION_CHUNK)] or [[]]
+    for chunk in chunks[:-1]:
+        cache_del(*chunk)
+    cache_bump_version(PRODUCT_LIST_GEN_KEY, *chunks[-1])
+
+def adjust_products(db: Session, adjustments: list[dict], *, atomic: bool = False) -> dict:
+    """Apply stock deltas / price changes to many products in one statement.
+
+    `UPDATE products SET ... FROM (VALUES ...) WHERE products.stock + delta >= 0 RETURNING ...`:
+    rows that would go negative are simply not matched, so the check cannot race with
+    concurrent checkouts. With `atomic=True` any rejection rolls the whole batch back (409).
+    """
+    # one row per product: deltas add up, the last price wins
+    merged: dict[int, dict] = {}
+    for a in adjustments:
+        m = merged.setdefault(a["product_id"], {"id": a["product_id"], "delta": 0, "price": None})
+        m["delta"] += a.get("stock_delta") or 0
+        if a.get("price_cents") is not None:
+            m["price"] = a["price_cents"]
+
+    v = values(
+        column("id", Integer), column("delta", Integer), column("price", Integer), name="v"
+    ).data([(m["id"], m["delta"], m["price"]) for m in merged.values()])
+    stmt = (
+        update(Product)
+        .where(Product.id == v.c.id, Product.stock + v.c.delta >= 0)
+        .values(
+            stock=Product.stock + v.c.delta,
+            price_cents=func.coalesce(cast(v.c.price, Integer), Product.price_cents),
+        )
+        .returning(Product.id, Product.stock, Product.price_cents)
+    )
+    applied = [dict(r._mapping) for r in db.execute(stmt)]
+
+    rejected = []
+    missing = set(merged) - {r["id"] for r in applied}
+    if missing:
+        existing = set(db.execute(select(Product.id).where(Product.id.in_(missing))).scalars())
+        rejected = [
+            {"product_id": pid, "reason": "insufficient stock" if pid in existing else "not found"}
+            for pid in sorted(missing)
+        ]
+    if rejected and atomic:
+        db.rollback()
+        raise HTTPException(status_code=409, detail={"rejected": rejected})
+    db.commit()
+
+    if applied:
+        invalidate_products_cache(r["id"] for r in applied)
+    return {"applied": applied, "rejected": rejected}
+
 def invalidate_product_cache(product_id: int | None = None):
-    keys = [PRODUCT_LIST_KEY]
-    if product_id is not None:
-        keys.append(f"{PRODUCT_KEY_PREFIX}{product_id}")
-    cache_del(*keys)
+    """Drop every cached listing page (one INCR) and, if given, the product's own key."""
+    keys = [f"{PRODUCT_KEY_PREFIX}{product_id}"] if product_id is not None else []
+    cache_bump_version(PRODUCT_LIST_GEN_KEY, *keys)
 
 def serialize_product(p: Product):
     return {
         "id": p.id,
         "category_id": p.category_id,
+        "sku": p.sku,
         "name": p.name,
         "description": p.description,
         "price_cents": p.price_cents,
@@ -1,26 +1,163 @@
 from __future__ import annotations
+import asyncio
+import logging
+import time
 
 from fastapi import HTTPException
-from sqlalchemy import select
-from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload, selectinload
+
+from app.core.config import settings
+from app.core.db import run_sync
+from app.core.profiling import profiled
 
 from app.models.cart import Cart, CartStatus
 from app.models.order import Order, OrderItem, OrderStatus
 from app.models.payment import Payment, PaymentStatus
-from app.models.product import Product
+from app.services.cart_service import forget_cart, persist_cart
+from app.services.fulfillment_service import start_fulfillment
+from app.services.outbox_service import enqueue_task
+from app.services.reservation_service import consume_reservations, release_reservations, reserve_stock
 from app.services.stripe_service import create_checkout_session
-from app.tasks.carts import expire_cart_later
-from app.tasks.orders import post_payment_pipeline
+
+logger = logging.getLogger(__name__)
 
 
 def checkout(db: Session, cart_id: int) -> tuple[Order, dict]:
     """Create an order/payment and return a Stripe Checkout session.
 
     Concurrency correctness:
-    - Reserves stock at checkout (row lock + decrement) to prevent overselling.
-    - A background task may later expire the cart and restore stock if payment never happens.
+    - Reserves stock at checkout (conditional decrement + reservation row) to prevent overselling.
+    - The expiry sweeper (beat) releases the reservation if payment never happens.
+    """
+    order = place_order(db, cart_id)
+
+    # Create Stripe session (external call) after commit
+    session = create_checkout_session(order_id=order.id, amount_cents=order.total_cents, currency=order.currency)
+    save_checkout_session(db, order.id, session)
+    return order, session
+
+
+async def checkout_async(db: Session | AsyncSession, cart_id: int) -> tuple[int, dict]:
+    """`checkout` for async routes: DB work via `run_sync`, Stripe call in the threadpool.
+
+    The Stripe HTTP call never runs on the event loop (nor inside the DB greenlet).
+    Returns `(order_id, session)` so callers never touch expired ORM state on the loop.
+    """
+    order_id, amount_cents, currency = await run_sync(db, _place_order_for_session, cart_id)
+    session = await _open_session_async(db, order_id, amount_cents, currency)
+    return order_id, session
+
+
+def _place_order_for_session(db: Session, cart_id: int) -> tuple[int, int, str]:
+    order = place_order(db, cart_id)
+    values = order.id, order.total_cents, order.currency
+    db.rollback()  # no connection held during the Stripe call
+    return values
+
+
+async def checkout_deferred(db: Session | AsyncSession, cart_id: int) -> int:
+    """`CHECKOUT_ASYNC`: place the order and leave the Stripe call to a worker.
+
+    The request costs the order transaction only (the task is queued in it, through the
+    outbox: no broker round trip); the client then polls `checkout_status` for the URL.
+    """
+    order = await run_sync(db, place_order, cart_id, defer_session=True)
+    return order.id
+
+
+async def _open_session_async(db: Session | AsyncSession, order_id: int, amount_cents: int, currency: str) -> dict:
+    session = await run_in_threadpool(
+        profiled(create_checkout_session), order_id=order_id, amount_cents=amount_cents, currency=currency
+    )
+    await run_sync(db, save_checkout_session, order_id, session)
+    return session
+
+
+def open_checkout_session(db: Session, order_id: int) -> dict | None:
+    """Worker side of `checkout_deferred`: create and store the order's Stripe session.
+
+    Idempotent: a session that already exists is returned as is, and the Stripe call
+    carries an idempotency key, so task retries never open a second session.
+    Returns None if the order is no longer awaiting payment.
     """
-    cart = db.query(Cart).filter(Cart.id == cart_id).first()
+    payment = db.query(Payment).options(joinedload(Payment.order)).filter(Payment.order_id == order_id).first()
+    if not payment or payment.order.status != OrderStatus.pending_payment:
+        db.rollback()
+        return None
+    if payment.stripe_session_id:
+        session = {"id": payment.stripe_session_id, "url": payment.checkout_url}
+        db.rollback()
+        return session
+    amount_cents, currency = payment.amount_cents, payment.currency
+    db.rollback()  # no connection held during the Stripe call
+
+    session = create_checkout_session(order_id=order_id, amount_cents=amount_cents, currency=currency)
+    save_checkout_session(db, order_id, session)
+    return session
+
+
+def fail_checkout(db: Session, order_id: int):
+    """No Stripe session could be created: cancel the order and give its stock back."""
+    payment = db.query(Payment).options(joinedload(Payment.order)).filter(Payment.order_id == order_id).first()
+    if not payment or payment.order.status != OrderStatus.pending_payment or payment.stripe_session_id:
+        return
+    payment.status = PaymentStatus.failed
+    payment.order.status = OrderStatus.cancelled
+    release_reservations(db, order_id)
+    db.commit()
+
+
+def checkout_status(db: Session, order_id: int) -> dict:
+    """Where a (deferred) checkout stands: `pending` → `ready` (URL available) or `failed`."""
+    payment = db.query(Payment).options(joinedload(Payment.order)).filter(Payment.order_id == order_id).first()
+    if not payment:
+        raise HTTPException(status_code=404, detail="Order not found")
+    if payment.stripe_session_id:
+        state = "ready"
+    elif payment.status == PaymentStatus.failed or payment.order.status == OrderStatus.cancelled:
+        state = "failed"
+    else:
+        state = "pending"
+    result = {
+        "order_id": order_id,
+        "order_status": payment.order.status.value,
+        "status": state,
+        "session_id": payment.stripe_session_id,
+        "checkout_url": payment.checkout_url,
+    }
+    db.rollback()  # long-polling: release the connection between polls, see fresh rows next time
+    return result
+
+
+async def wait_for_checkout(db: Session | AsyncSession, order_id: int, *, wait: float = 0) -> dict:
+    """`checkout_status`, long-polled for up to `wait` seconds while still `pending`."""
+    deadline = time.monotonic() + wait
+    delay = 0.1
+    while True:
+        status = await run_sync(db, checkout_status, order_id)
+        remaining = deadline - time.monotonic()
+        if status["status"] != "pending" or remaining <= 0:
+            return status
+        await asyncio.sleep(min(delay, remaining))
+        delay = min(delay * 2, 1.0)
+
+
+def place_order(db: Session, cart_id: int, *, defer_session: bool = False) -> Order:
+    """Reserve stock and persist order + payment in one transaction.
+
+    `defer_session` also queues `open_checkout_session` (outbox) in that transaction.
+    """
+    persist_cart(db, cart_id)
+    # locked like the cart mutations: items and totals cannot change under the order
+    cart = (
+        db.query(Cart)
+        .options(selectinload(Cart.items))
+        .filter(Cart.id == cart_id)
+        .with_for_update(of=Cart)
+        .first()
+    )
     if not cart:
         raise HTTPException(status_code=404, detail="Cart not found")
     if cart.status != CartStatus.active:
@@ -28,31 +165,11 @@ def checkout(db: Session, cart_id: int) -> tuple[Order, dict]:
     if not cart.items:
         raise HTTPException(status_code=400, detail="Cart is empty")
 
-    # Reserve stock atomically
-    product_ids = [i.product_id for i in cart.items]
-    products = (
-        db.execute(
-            select(Product)
-            .where(Product.id.in_(product_ids))
-            .with_for_update()
-        )
-        .scalars()
-        .all()
-    )
-    by_id = {p.id: p for p in products}
+    total = cart.total_cents
+    currency = cart.currency
 
-    total = 0
-    currency = cart.items[0].product.currency
-    for item in cart.items:
-        p = by_id.get(item.product_id)
-        if not p or not p.active:
-            raise HTTPException(status_code=409, detail="Product inactive")
-        if p.stock < item.qty:
-            raise HTTPException(status_code=409, detail="Insufficient stock")
-        p.stock -= item.qty  # reserve
-        total += item.qty * item.unit_price_cents
-
-    # Create order + items (still within the same transaction)
+    # Create order + items + payment first, so product rows are locked for as
+    # little of the transaction as possible
     order = Order(cart_id=cart.id, total_cents=total, currency=currency, status=OrderStatus.pending_payment)
     db.add(order)
     db.flush()
@@ -69,27 +186,26 @@ def checkout(db: Session, cart_id: int) -> tuple[Order, dict]:
 
     payment = Payment(order_id=order.id, amount_cents=total, currency=currency, status=PaymentStatus.initiated)
     db.add(payment)
+    db.flush()
+
+    # Reserve stock atomically (conditional decrements, see reservation_service)
+    reserve_stock(db, order.id, [(item.product_id, item.qty) for item in cart.items])
 
     cart.status = CartStatus.checked_out
+    if defer_session:
+        enqueue_task(db, "open_checkout_session", order.id)
     db.commit()
+    forget_cart(cart_id)
     db.refresh(order)
+    return order
 
-    # Create Stripe session (external call) after commit
-    session = create_checkout_session(order_id=order.id, amount_cents=total, currency=currency)
 
-    # Save session id
-    payment = db.query(Payment).filter(Payment.order_id == order.id).first()
+def save_checkout_session(db: Session, order_id: int, session: dict):
+    payment = db.query(Payment).filter(Payment.order_id == order_id).first()
     payment.stripe_session_id = session["id"]
+    payment.checkout_url = session["url"]
     db.commit()
 
-    # schedule cart expiry safety net (30min)
-    try:
-        expire_cart_later.apply_async(args=[cart.id], countdown=1800)
-    except Exception:
-        pass
-
-    return order, session
-
 
 def mark_order_paid(
     db: Session,
@@ -99,6 +215,32 @@ def mark_order_paid(
     order_id: int | None,
 ):
     """Mark payment as succeeded and move the order to PAID (idempotent)."""
+    order, _ = record_payment_succeeded(
+        db, stripe_session_id=stripe_session_id, payment_intent_id=payment_intent_id, order_id=order_id
+    )
+    # also commits a late payment recorded against a cancelled order
+    db.commit()
+    db.refresh(order)
+    return order
+
+
+def record_payment_succeeded(
+    db: Session,
+    *,
+    stripe_session_id: str | None,
+    payment_intent_id: str | None,
+    order_id: int | None,
+) -> tuple[Order, bool]:
+    """`mark_order_paid` without the commit; returns `(order, newly_paid)`.
+
+    For callers batching several events in one transaction. Fulfillment of a newly paid
+    order is queued in the same transaction (outbox), so it happens iff the caller commits.
+
+    The order is only paid if it is still `PENDING_PAYMENT` and still holds its reserved
+    stock. A payment arriving after the sweeper cancelled the order (stock already back on
+    sale) is recorded as `SUCCEEDED` against the `CANCELLED` order, to be refunded or
+    re-reserved, and nothing ships: `(order, False)`.
+    """
     q = db.query(Payment)
     if order_id is not None:
         q = q.filter(Payment.order_id == order_id)
@@ -112,21 +254,21 @@ def mark_order_paid(
         raise HTTPException(status_code=404, detail="Payment not found")
 
     if payment.status == PaymentStatus.succeeded:
-        return payment.order  # idempotent
+        return payment.order, False
 
     payment.status = PaymentStatus.succeeded
     if payment_intent_id:
         payment.stripe_payment_intent_id = payment_intent_id
 
-    order = payment.order
+    # the sweeper claims orders FOR UPDATE SKIP LOCKED: holding the lock keeps it away
+    order = db.query(Order).filter(Order.id == payment.order_id).with_for_update().populate_existing().one()
+    consumed = consume_reservations(db, order.id) if order.status == OrderStatus.pending_payment else 0
+    if not consumed:
+        logger.warning(
+            "payment %s succeeded for order %s (%s) holding no stock: refund or re-reserve it",
+            payment.id, order.id, order.status.value,
+        )
+        return order, False
     order.status = OrderStatus.paid
-    db.commit()
-    db.refresh(order)
-
-    # async pipeline (fulfillment)
-    try:
-        post_payment_pipeline.delay(order.id)
-    except Exception:
-        pass
-
-    return order
+    start_fulfillment(db, order.id)
+    return order, True
@@ -0,0 +1,71 @@
+from __future__ import annotations
+import csv
+import io
+import json
+from typing import AsyncIterator, Iterator
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.models.product import Product
+
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+EXPORT_COLUMNS = ("id", "category_id", "sku", "name", "description", "price_cents", "currency", "stock", "active")
+EXPORT_BATCH_SIZE = 1000
+
+
+def export_products(db: Session | AsyncSession, fmt: str) -> Iterator[str] | AsyncIterator[str]:
+    """Whole catalog (active or not) as NDJSON / CSV chunks, ordered by id.
+
+    - Plain column rows through a server-side cursor (`yield_per`): no ORM objects, no
+      identity map, memory bounded by one batch whatever the catalog size
+    - One chunk per batch, ready for `StreamingResponse`
+    - The request's session is used while the body streams: FastAPI >= 0.118 keeps `yield`
+      dependencies open until the response is sent (older versions close it first); it is
+      closed here when the stream ends
+    """
+    if isinstance(db, AsyncSession):
+        return _aiter_export(db, fmt)
+    return _iter_export(db, fmt)
+
+
+def _statement():
+    return (
+        select(*(getattr(Product, c) for c in EXPORT_COLUMNS))
+        .order_by(Product.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+
+
+def _iter_export(db: Session, fmt: str) -> Iterator[str]:
+    try:
+        if fmt == "csv":
+            yield _encode_csv([EXPORT_COLUMNS])
+        for rows in db.execute(_statement()).partitions():
+            yield _encode(rows, fmt)
+    finally:
+        db.close()
+
+
+async def _aiter_export(db: AsyncSession, fmt: str) -> AsyncIterator[str]:
+    try:
+        if fmt == "csv":
+            yield _encode_csv([EXPORT_COLUMNS])
+        result = await db.stream(_statement())
+        async for rows in result.partitions():
+            yield _encode(rows, fmt)
+    finally:
+        await db.close()
+
+
+def _encode(rows, fmt: str) -> str:
+    if fmt == "csv":
+        return _encode_csv(rows)
+    return "".join(json.dumps(dict(zip(EXPORT_COLUMNS, r)), separators=(",", ":")) + "\n" for r in rows)
+
+
+def _encode_csv(rows) -> str:
+    buf = io.StringIO()
+    csv.writer(buf, lineterminator="\n").writerows(rows)
+    return buf.getvalue()
@@ -0,0 +1,121 @@
+"""Post-payment fulfillment: PAID -> FULFILLED, then per-order hooks.
+
+Two modes:
+- default: one `post_payment_pipeline` task per paid order
+- `FULFILLMENT_BATCHED`: paid order ids are appended to a Redis stream and beat drains it
+  every `FULFILLMENT_FLUSH_SECONDS`, `FULFILLMENT_BATCH_SIZE` orders per `UPDATE` + commit
+
+Both are queued through the outbox, in the transaction that marks the order PAID, and
+either way the transition goes through `fulfill_orders`, so hooks run the same.
+"""
+from __future__ import annotations
+import logging
+import os
+import socket
+from typing import Callable
+
+import redis
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.core.cache import get_redis
+from app.core.config import settings
+from app.models.order import Order, OrderStatus
+from app.services.outbox_service import enqueue_task, register_publisher
+
+logger = logging.getLogger(__name__)
+
+STREAM_KEY = "fulfillment:paid"
+# outbox task name for "append to the stream" (published by the relay, not Celery)
+STREAM_TASK = "fulfillment:stream"
+GROUP = "fulfillment"
+# bounds the stream if no consumer runs; acknowledged entries are deleted anyway
+STREAM_MAXLEN = 1_000_000
+# an entry read but not acknowledged for this long belongs to a dead consumer: re-claim it
+CLAIM_IDLE_MS = 60_000
+
+_hooks: list[Callable[[Session, int], None]] = []
+
+
+def register_fulfillment_hook(fn: Callable[[Session, int], None]):
+    """Run `fn(db, order_id)` for every order once it is FULFILLED (after the commit).
+
+    Usable as a decorator. A failing hook is logged and does not affect other orders.
+    """
+    _hooks.append(fn)
+    return fn
+
+
+def start_fulfillment(db: Session, order_id: int):
+    """Queue fulfillment of a just-paid order in the caller's transaction (outbox, no commit)."""
+    if settings.FULFILLMENT_BATCHED:
+        enqueue_task(db, STREAM_TASK, order_id)
+    else:
+        enqueue_task(db, "post_payment_pipeline", order_id)
+
+
+@register_publisher(STREAM_TASK)
+def _append_to_stream(order_id: int):
+    get_redis().xadd(STREAM_KEY, {"order_id": order_id}, maxlen=STREAM_MAXLEN, approximate=True)
+
+
+def fulfill_orders(db: Session, order_ids: list[int]) -> list[int]:
+    """Move the PAID orders among `order_ids` to FULFILLED in one statement, commit, run hooks.
+
+    Ids that are not PAID (already fulfilled, replayed, cancelled) are skipped.
+    Returns the ids that were transitioned.
+    """
+    if not order_ids:
+        return []
+    fulfilled = db.execute(
+        update(Order)
+        .where(Order.id.in_(sorted(set(order_ids))), Order.status == OrderStatus.paid)
+        .values(status=OrderStatus.fulfilled)
+        .returning(Order.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    db.commit()
+    for order_id in fulfilled:
+        for hook in _hooks:
+            try:
+                hook(db, order_id)
+            except Exception:
+                db.rollback()
+                logger.exception("fulfillment hook %s failed for order %s", getattr(hook, "__name__", hook), order_id)
+    return fulfilled
+
+
+def flush_fulfillment(db: Session, *, limit: int | None = None, consumer: str | None = None) -> dict:
+    """Drain one batch of the paid-orders stream (`FULFILLMENT_BATCHED`).
+
+    Entries left unacknowledged by a crashed consumer are re-claimed first; the batch is
+    acknowledged (and deleted) only after its transaction committed, so a crash replays it
+    and the `status = PAID` guard makes the replay a no-op.
+    """
+    limit = limit or settings.FULFILLMENT_BATCH_SIZE
+    consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+    r = get_redis()
+    _ensure_group(r)
+
+    _, entries, _ = r.xautoclaim(STREAM_KEY, GROUP, consumer, min_idle_time=CLAIM_IDLE_MS, start_id="0-0", count=limit)
+    if len(entries) < limit:
+        for _, new in r.xreadgroup(GROUP, consumer, {STREAM_KEY: ">"}, count=limit - len(entries)) or []:
+            entries.extend(new)
+
+    order_ids = [int(fields["order_id"]) for _, fields in entries if fields and "order_id" in fields]
+    fulfilled = fulfill_orders(db, order_ids)
+    if entries:
+        entry_ids = [entry_id for entry_id, _ in entries]
+        pipe = r.pipeline(transaction=False)
+        pipe.xack(STREAM_KEY, GROUP, *entry_ids)
+        pipe.xdel(STREAM_KEY, *entry_ids)
+        pipe.execute()
+    return {"read": len(entries), "fulfilled": len(fulfilled)}
+
+
+def _ensure_group(r: redis.Redis):
+    try:
+        r.xgroup_create(STREAM_KEY, GROUP, id="0", mkstream=True)
+    except redis.ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
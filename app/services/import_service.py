@@ -0,0 +1,194 @@
+from __future__ import annotations
+import csv
+import json
+from typing import AsyncIterator
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy import literal_column, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.db import run_sync
+from app.models.category import Category
+from app.models.product import Product
+from app.schemas.product import ProductImportRow
+from app.services.catalog_service import invalidate_products_cache
+
+IMPORT_FORMATS = {"application/x-ndjson": "ndjson", "application/jsonl": "ndjson", "text/csv": "csv"}
+_UPSERT_COLUMNS = ("category_id", "name", "description", "price_cents", "currency", "stock", "active")
+# Postgres takes at most 65535 bind parameters per statement, one per column per row
+_MAX_BIND_PARAMS = 65535
+MAX_BATCH_ROWS = _MAX_BIND_PARAMS // len(ProductImportRow.model_fields)
+
+
+async def import_products(db: Session | AsyncSession, chunks: AsyncIterator[bytes], fmt: str | None) -> dict:
+    """Stream NDJSON/CSV rows into `products`, upserting on `sku` in batches.
+
+    - Memory is bounded by one batch (`IMPORT_BATCH_SIZE`, capped at `MAX_BATCH_ROWS`), not by the feed size
+    - Each batch is one `INSERT ... ON CONFLICT (sku) DO UPDATE` and its own commit
+    - Every line is counted once: inserted, updated, superseded (a later line of the same batch
+      has the same SKU) or failed
+    - Bad rows are reported with their line number and skipped; good rows still land (a batch
+      the database rejects is retried row by row to find the offenders)
+    - The catalog cache is invalidated once, after the last batch (or the failure that ended the import)
+    - A line longer than `IMPORT_MAX_LINE_BYTES` is reported and skipped without being buffered
+    """
+    if fmt not in ("ndjson", "csv"):
+        raise HTTPException(status_code=415, detail="Use application/x-ndjson or text/csv")
+    report = {"inserted": 0, "updated": 0, "superseded": 0, "failed": 0, "errors": [], "errors_truncated": False}
+    touched: list[int] = []
+    batch_size = min(settings.IMPORT_BATCH_SIZE, MAX_BATCH_ROWS)
+    batch: list[tuple[int, ProductImportRow]] = []
+
+    async def flush():
+        inserted, updated, errors = await run_sync(db, upsert_products_batch, batch)
+        report["inserted"] += len(inserted)
+        report["updated"] += len(updated)
+        # earlier lines of a SKU repeated within the batch (the last one is applied)
+        report["superseded"] += len(batch) - len({row.sku for _, row in batch})
+        touched.extend(inserted + updated)
+        for e in errors:
+            _add_error(report, *e)
+        batch.clear()
+
+    try:
+        async for line_no, row in _iter_rows(chunks, fmt):
+            if isinstance(row, dict) and "_error" in row:
+                _add_error(report, line_no, None, row["_error"])
+                continue
+            try:
+                batch.append((line_no, ProductImportRow.model_validate(row)))
+            except ValidationError as e:
+                _add_error(report, line_no, row.get("sku") if isinstance(row, dict) else None, _short_error(e))
+                continue
+            if len(batch) >= batch_size:
+                await flush()
+        if batch:
+            await flush()
+    finally:
+        # batches committed before an aborted upload or a failing batch are live too
+        if touched:
+            invalidate_products_cache(touched)
+    return report
+
+
+def upsert_products_batch(db: Session, batch: list[tuple[int, ProductImportRow]]):
+    """Returns `(inserted_ids, updated_ids, errors)`; errors are `(line, sku, message)`."""
+    errors = []
+    # ON CONFLICT cannot touch the same row twice in one statement: last occurrence wins,
+    # exactly as if the rows had been applied one by one
+    by_sku = {row.sku: (line_no, row) for line_no, row in batch}
+
+    category_ids = {row.category_id for _, row in by_sku.values()}
+    known = set(db.execute(select(Category.id).where(Category.id.in_(category_ids))).scalars())
+    pending = []
+    for line_no, row in by_sku.values():
+        if row.category_id not in known:
+            errors.append((line_no, row.sku, "category not found"))
+            continue
+        pending.append((line_no, row))
+    if not pending:
+        return [], [], errors
+
+    try:
+        rows = db.execute(_upsert_statement([row.model_dump() for _, row in pending])).all()
+        db.commit()
+    except (IntegrityError, DataError):
+        # a row the checks above let through (e.g. its category was just deleted): find it
+        # by retrying row by row, each in a savepoint; connection errors still propagate
+        db.rollback()
+        rows = []
+        for line_no, row in pending:
+            try:
+                with db.begin_nested():
+                    rows += db.execute(_upsert_statement([row.model_dump()])).all()
+            except (IntegrityError, DataError) as e:
+                errors.append((line_no, row.sku, e.orig.diag.message_primary or type(e.orig).__name__))
+        db.commit()
+
+    inserted = [r.id for r in rows if r.inserted]
+    updated = [r.id for r in rows if not r.inserted]
+    return inserted, updated, errors
+
+
+def _upsert_statement(values: list[dict]):
+    stmt = insert(Product).values(values)
+    return stmt.on_conflict_do_update(
+        index_elements=[Product.sku],
+        set_={c: stmt.excluded[c] for c in _UPSERT_COLUMNS},
+    ).returning(Product.id, literal_column("(xmax = 0)").label("inserted"))
+
+
+async def _iter_lines(chunks: AsyncIterator[bytes]):
+    """Yield the body's lines; None for a line over `IMPORT_MAX_LINE_BYTES` (its bytes are dropped)."""
+    max_bytes = settings.IMPORT_MAX_LINE_BYTES
+    buf = b""
+    # inside an overlong line, already reported: drop everything up to its newline
+    skipping = False
+    async for chunk in chunks:
+        buf += chunk
+        *lines, buf = buf.split(b"\n")
+        for line in lines:
+            if skipping:
+                skipping = False
+                continue
+            yield line if len(line) <= max_bytes else None
+        if len(buf) > max_bytes:
+            if not skipping:
+                yield None
+                skipping = True
+            buf = b""
+    if buf and not skipping:
+        yield buf
+
+
+async def _iter_rows(chunks: AsyncIterator[bytes], fmt: str):
+    """Yield `(line_no, row)`; unreadable lines (too long, bad UTF-8, JSON or CSV shape) come back as `{"_error": ...}` rows.
+
+    CSV must hold one record per line (no quoted newlines) so rows can be parsed as they stream.
+    """
+    header = None
+    line_no = 0
+    async for raw in _iter_lines(chunks):
+        line_no += 1
+        if raw is None:
+            yield line_no, {"_error": f"line longer than {settings.IMPORT_MAX_LINE_BYTES} bytes"}
+            continue
+        try:
+            line = raw.decode("utf-8").rstrip("\r")
+        except UnicodeDecodeError:
+            yield line_no, {"_error": "invalid UTF-8"}
+            continue
+        if not line.strip():
+            continue
+        if fmt == "ndjson":
+            try:
+                yield line_no, json.loads(line)
+            except ValueError:
+                yield line_no, {"_error": "invalid JSON"}
+            continue
+        values = next(csv.reader([line]))
+        if header is None:
+            header = [h.strip() for h in values]
+            continue
+        if len(values) != len(header):
+            yield line_no, {"_error": f"expected {len(header)} columns, got {len(values)}"}
+            continue
+        # empty cells mean "use the default"
+        yield line_no, {k: v for k, v in zip(header, values) if v != ""}
+
+
+def _short_error(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(map(str, err['loc'])) or 'row'}: {err['msg']}" for err in e.errors())
+
+
+def _add_error(report: dict, line_no: int, sku, message: str):
+    report["failed"] += 1
+    if len(report["errors"]) < settings.IMPORT_MAX_ERRORS:
+        report["errors"].append({"line": line_no, "sku": sku, "error": message})
+    else:
+        report["errors_truncated"] = True
@@ -0,0 +1,52 @@
+from datetime import datetime
+
+from sqlalchemy.orm import Session, joinedload, selectinload
+from fastapi import HTTPException
+
+from app.models.order import Order, OrderStatus
+
+# everything `OrderOut` serializes, loaded up front: 2 queries for any number of orders
+_ORDER_LOAD = (selectinload(Order.items), joinedload(Order.payment))
+
+EXPORT_BATCH_SIZE = 500
+
+def get_order(db: Session, order_id: int) -> Order:
+    o = db.query(Order).options(*_ORDER_LOAD).filter(Order.id == order_id).first()
+    if not o:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return o
+
+def list_orders(
+    db: Session,
+    status: str | None = None,
+    *,
+    created_from: datetime | None = None,
+    created_to: datetime | None = None,
+    before_id: int | None = None,
+    limit: int = 50,
+) -> tuple[list[Order], int | None]:
+    """Newest first, with **cursor pagination** (keyset).
+
+    - Stable order: by Order.id DESC (index `(status, id)` when filtering by status)
+    - Cursor: last returned `id` (`before_id` param)
+    - `created_from` inclusive, `created_to` exclusive
+
+    Returns `(orders, next_cursor)`.
+    """
+    limit = max(1, min(int(limit), 500))
+    q = db.query(Order).options(*_ORDER_LOAD)
+    if status:
+        q = q.filter(Order.status == OrderStatus(status))
+    if created_from is not None:
+        q = q.filter(Order.created_at >= created_from)
+    if created_to is not None:
+        q = q.filter(Order.created_at < created_to)
+    if before_id is not None:
+        q = q.filter(Order.id < before_id)
+
+    # Fetch one extra to know if there's a next page
+    orders = q.order_by(Order.id.desc()).limit(limit + 1).all()
+    has_more = len(orders) > limit
+    orders = orders[:limit]
+    next_cursor = orders[-1].id if (has_more and orders) else None
+    return orders, next_cursor
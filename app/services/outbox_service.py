@@ -0,0 +1,106 @@
+"""Transactional outbox: tasks are queued as rows in the caller's transaction.
+
+`enqueue_task` adds an `outbox` row (no commit, no broker call): the task exists if and
+only if the change that called for it commits. The relay (`python -m app.outbox_relay`)
+publishes rows in batches and deletes them. Delivery is at-least-once (a relay crash
+between publish and delete republishes), so tasks sent this way must be idempotent.
+
+A row whose own publish keeps failing (bad arguments, unknown publisher) is parked after
+`OUTBOX_MAX_ATTEMPTS` tries: it stays in the table for inspection but is no longer claimed.
+"""
+from __future__ import annotations
+import logging
+from typing import Callable
+
+import kombu.exceptions
+import redis.exceptions
+from sqlalchemy import delete, text
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.outbox import OutboxMessage
+from app.tasks.celery_app import celery_app
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = "outbox"
+
+_publishers: dict[str, Callable[..., None]] = {}
+
+# the broker (or Redis, for stream publishers) is unreachable: every row would fail the same way
+BROKER_ERRORS = (
+    ConnectionError,
+    TimeoutError,
+    kombu.exceptions.OperationalError,
+    redis.exceptions.ConnectionError,
+    redis.exceptions.TimeoutError,
+)
+
+
+def register_publisher(task: str):
+    """Publish `task` rows with the decorated `fn(*args, **kwargs)` instead of Celery."""
+    def decorator(fn: Callable[..., None]):
+        _publishers[task] = fn
+        return fn
+    return decorator
+
+
+def enqueue_task(db: Session, task: str, *args, **kwargs):
+    """Queue a task by name in the current transaction; published once it commits."""
+    db.add(OutboxMessage(task=task, args=list(args), kwargs=kwargs))
+    # delivered on commit only, and once per transaction however many rows
+    db.execute(text("SELECT pg_notify(:channel, '')"), {"channel": NOTIFY_CHANNEL})
+
+
+def relay_outbox(db: Session, *, limit: int | None = None) -> dict:
+    """Publish one batch of outbox rows (oldest first) and delete them in one transaction.
+
+    `FOR UPDATE SKIP LOCKED` lets several relays run side by side. A row that fails on its
+    own is counted (`attempts`, `last_error`) and skipped, so it cannot hold back the rows
+    behind it; a broker-level error (`BROKER_ERRORS`) ends the batch without blaming the row.
+    Published rows are deleted either way.
+    """
+    limit = limit or settings.OUTBOX_BATCH_SIZE
+    messages = (
+        db.query(OutboxMessage)
+        .filter(OutboxMessage.attempts < settings.OUTBOX_MAX_ATTEMPTS)
+        .order_by(OutboxMessage.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    published = []
+    failed = 0
+    for msg in messages:
+        try:
+            _publish(msg)
+        except BROKER_ERRORS as e:
+            msg.last_error = _error_text(e)
+            logger.warning("broker unavailable, outbox batch stopped at %s (%s)", msg.id, msg.task, exc_info=True)
+            break
+        except Exception as e:
+            failed += 1
+            msg.attempts += 1
+            msg.last_error = _error_text(e)
+            if msg.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+                logger.error("parking outbox message %s (%s) after %s attempts", msg.id, msg.task, msg.attempts, exc_info=True)
+            else:
+                logger.warning("could not publish outbox message %s (%s)", msg.id, msg.task, exc_info=True)
+            continue
+        published.append(msg.id)
+    if published:
+        db.execute(delete(OutboxMessage).where(OutboxMessage.id.in_(published)))
+    db.commit()
+    return {"claimed": len(messages), "published": len(published), "failed": failed}
+
+
+def _error_text(e: Exception) -> str:
+    return f"{type(e).__name__}: {e}"[:1000]
+
+
+def _publish(msg: OutboxMessage):
+    publisher = _publishers.get(msg.task)
+    if publisher is not None:
+        publisher(*msg.args, **msg.kwargs)
+    else:
+        celery_app.send_task(msg.task, args=msg.args, kwargs=msg.kwargs)
@@ -0,0 +1,92 @@
+from __future__ import annotations
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException
+from sqlalchemy import Integer, column, insert, select, update, values
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.product import Product
+from app.models.reservation import ReservationStatus, StockReservation
+
+_products = Product.__table__
+
+
+def reserve_stock(db: Session, order_id: int, lines: list[tuple[int, int]]):
+    """Take `(product_id, qty)` lines out of stock for `order_id` (no commit).
+
+    Each product is one conditional decrement (`... WHERE stock >= :qty`): no read, no
+    `FOR UPDATE`, the row lock lasts from that statement to the caller's commit. Products
+    are touched in id order so two checkouts can never lock each other in a cycle.
+    Raises 409 (the caller's transaction must then be rolled back).
+    """
+    qty_by_product: dict[int, int] = defaultdict(int)
+    for product_id, qty in lines:
+        qty_by_product[product_id] += qty
+
+    for product_id in sorted(qty_by_product):
+        qty = qty_by_product[product_id]
+        reserved = db.execute(
+            update(_products)
+            .where(_products.c.id == product_id, _products.c.active.is_(True), _products.c.stock >= qty)
+            .values(stock=_products.c.stock - qty)
+            .returning(_products.c.id)
+        ).first()
+        if reserved is None:
+            active = db.execute(select(Product.active).where(Product.id == product_id)).scalar_one_or_none()
+            raise HTTPException(status_code=409, detail="Insufficient stock" if active else "Product inactive")
+
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=settings.RESERVATION_TTL_SECONDS)
+    db.execute(
+        insert(StockReservation),
+        [
+            {"order_id": order_id, "product_id": pid, "qty": qty, "status": ReservationStatus.held, "expires_at": expires_at}
+            for pid, qty in qty_by_product.items()
+        ],
+    )
+
+
+def consume_reservations(db: Session, order_id: int) -> int:
+    """The order was paid: its held stock is sold for good (no commit).
+
+    Returns how many lines were still held; 0 means the stock already went back (the order
+    was cancelled or expired), so the order must not ship.
+    """
+    return db.execute(
+        update(StockReservation)
+        .where(StockReservation.order_id == order_id, StockReservation.status == ReservationStatus.held)
+        .values(status=ReservationStatus.consumed)
+    ).rowcount
+
+
+def release_reservations(db: Session, *order_ids: int) -> int:
+    """Give the orders' held stock back (no commit); returns how many lines were released.
+
+    Only `HELD` rows flip to `RELEASED`, so a retried or concurrent release restores stock once.
+    """
+    released = db.execute(
+        update(StockReservation)
+        .where(StockReservation.order_id.in_(order_ids), StockReservation.status == ReservationStatus.held)
+        .values(status=ReservationStatus.released)
+        .returning(StockReservation.product_id, StockReservation.qty)
+    ).all()
+    restock: dict[int, int] = defaultdict(int)
+    for product_id, qty in released:
+        restock[product_id] += qty
+    if restock:
+        # one `UPDATE ... FROM (VALUES ...)`, like `adjust_products`; the subquery takes the
+        # row locks in id order, as `reserve_stock` does, so it cannot deadlock with a checkout
+        v = values(column("id", Integer), column("delta", Integer), name="v").data(sorted(restock.items()))
+        in_id_order = (
+            select(_products.c.id)
+            .where(_products.c.id.in_(list(restock)))
+            .order_by(_products.c.id)
+            .with_for_update()
+        )
+        db.execute(
+            update(_products)
+            .where(_products.c.id == v.c.id, _products.c.id.in_(in_id_order))
+            .values(stock=_products.c.stock + v.c.delta)
+        )
+    return len(released)
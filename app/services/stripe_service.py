@@ -1,8 +1,24 @@
 from __future__ import annotations
+import json
+import requests
 import stripe
 from app.core.config import settings
 
 stripe.api_key = settings.STRIPE_API_KEY
+if settings.STRIPE_API_BASE:
+    stripe.api_base = settings.STRIPE_API_BASE
+stripe.max_network_retries = settings.STRIPE_MAX_RETRIES
+
+def _http_client() -> stripe.HTTPClient:
+    """Process-wide keep-alive pool: Stripe calls reuse TLS connections instead of
+    handshaking per checkout (urllib3 pools are thread-safe)."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=settings.STRIPE_HTTP_POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return stripe.RequestsClient(timeout=settings.STRIPE_HTTP_TIMEOUT, session=session)
+
+stripe.default_http_client = _http_client()
 
 def create_checkout_session(*, order_id: int, amount_cents: int, currency: str) -> dict:
     # Note: in tests we monkeypatch this function, so no real Stripe calls are made.
@@ -19,6 +35,8 @@ def create_checkout_session(*, order_id: int, amount_cents: int, currency: str)
                 "product_data": {"name": f"Order #{order_id}"},
             }
         }],
+        # retries (SDK or worker) return the same session instead of opening another
+        idempotency_key=f"checkout-order-{order_id}",
     )
     return {"id": session.id, "url": session.url}
 
@@ -26,12 +44,12 @@ def verify_webhook(payload: bytes, sig_header: str) -> dict:
     # In tests we monkeypatch this too.
     if settings.ALLOW_INSECURE_WEBHOOK and not settings.STRIPE_WEBHOOK_SECRET:
         # unsafe fallback
-        return stripe.Event.construct_from(stripe.util.json.loads(payload.decode("utf-8")), stripe.api_key)
+        return json.loads(payload.decode("utf-8"))
 
     event = stripe.Webhook.construct_event(
         payload=payload,
         sig_header=sig_header,
         secret=settings.STRIPE_WEBHOOK_SECRET,
     )
-    # Convert to plain dict
-    return stripe.util.convert_to_dict(event)
+    # Convert to plain dict (`stripe.util` is gone from recent SDKs)
+    return event.to_dict()
@@ -1,34 +1,116 @@
 from __future__ import annotations
+import logging
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 from fastapi import HTTPException
 
-from app.models.webhook_event import WebhookEvent
-from app.services.checkout_service import mark_order_paid
+from app.core.cache import get_redis
+from app.core.config import settings
+from app.models.webhook_event import WebhookEvent, WebhookStatus
+from app.services.checkout_service import record_payment_succeeded
+from app.services.outbox_service import enqueue_task
+
+logger = logging.getLogger(__name__)
+
+KICK_KEY = "webhooks:inbox:kick"
+MAX_RETRY_DELAY_SECONDS = 3600
 
-def process_stripe_event(db: Session, event: dict):
+def enqueue_stripe_event(db: Session, event: dict) -> dict:
+    """Store a verified event in the inbox and return at once (processing is a worker's job).
+
+    A redelivered event hits `uq_provider_event_id` and is acknowledged as a duplicate.
+    """
     event_id = event.get("id")
     event_type = event.get("type")
     if not event_id or not event_type:
         raise HTTPException(status_code=400, detail="Invalid event")
 
-    # idempotency
-    existing = db.query(WebhookEvent).filter(WebhookEvent.provider == "stripe", WebhookEvent.event_id == event_id).first()
-    if existing:
+    inserted = db.execute(
+        insert(WebhookEvent)
+        .values(provider="stripe", event_id=event_id, event_type=event_type, payload=dict(event))
+        .on_conflict_do_nothing(constraint="uq_provider_event_id")
+        .returning(WebhookEvent.id)
+    ).first()
+    if inserted is not None:
+        kick_inbox_consumer(db)
+    db.commit()
+    if inserted is None:
         return {"status": "ok", "idempotent": True}
+    return {"status": "ok"}
+
+def kick_inbox_consumer(db: Session):
+    """Wake a worker now instead of at the next beat tick; at most one task per second
+    however many events arrive (a Stripe retry storm must not become a task storm).
+
+    The task goes through the outbox, in the caller's transaction: no broker call on the
+    request path. A kick lost with a rolled-back transaction is covered by beat.
+    """
+    try:
+        due = get_redis().set(KICK_KEY, 1, nx=True, px=1000)
+    except Exception:
+        logger.warning("could not kick the webhook inbox consumer; beat will pick the event up", exc_info=True)
+        return
+    if due:
+        enqueue_task(db, "process_webhook_inbox")
 
-    db.add(WebhookEvent(provider="stripe", event_id=event_id))
+def process_webhook_inbox(db: Session, *, limit: int | None = None) -> dict:
+    """Process one batch of due inbox events in one transaction.
+
+    - `FOR UPDATE SKIP LOCKED`: concurrent consumers take disjoint batches
+    - each event runs in a savepoint, so one failure does not undo the others
+    - a failed event is retried with exponential backoff, then parked as `FAILED`
+    - fulfillment is queued (outbox) inside the event's savepoint: it is sent iff the event applied
+    """
+    limit = limit or settings.WEBHOOK_BATCH_SIZE
+    events = (
+        db.query(WebhookEvent)
+        .filter(WebhookEvent.status == WebhookStatus.received, WebhookEvent.next_attempt_at <= func.now())
+        .order_by(WebhookEvent.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    stats = {"claimed": len(events), "processed": 0, "retried": 0, "failed": 0}
+    for ev in events:
+        ev.attempts += 1
+        try:
+            with db.begin_nested():
+                handle_stripe_event(db, ev.payload or {})
+        except Exception as e:
+            ev.last_error = f"{type(e).__name__}: {e}"[:1000]
+            if ev.attempts >= settings.WEBHOOK_MAX_ATTEMPTS:
+                ev.status = WebhookStatus.failed
+                stats["failed"] += 1
+                logger.error("webhook event %s failed %s times, giving up: %s", ev.event_id, ev.attempts, ev.last_error)
+            else:
+                delay = min(settings.WEBHOOK_RETRY_BASE_SECONDS * 2 ** (ev.attempts - 1), MAX_RETRY_DELAY_SECONDS)
+                ev.next_attempt_at = datetime.now(timezone.utc) + timedelta(seconds=delay)
+                stats["retried"] += 1
+            continue
+        ev.status = WebhookStatus.processed
+        ev.processed_at = func.now()
+        ev.last_error = None
+        stats["processed"] += 1
     db.commit()
+    return stats
 
+def handle_stripe_event(db: Session, event: dict) -> int | None:
+    """Apply one event (no commit); returns the id of an order it just moved to PAID."""
     obj = (event.get("data") or {}).get("object") or {}
 
-    if event_type == "checkout.session.completed":
+    if event.get("type") == "checkout.session.completed":
         session_id = obj.get("id")
         metadata = obj.get("metadata") or {}
         order_id = metadata.get("order_id")
         order_id_int = int(order_id) if order_id else None
-        order = mark_order_paid(db, stripe_session_id=session_id, payment_intent_id=obj.get("payment_intent"), order_id=order_id_int)
-        return {"status": "ok", "order_id": order.id}
+        order, newly_paid = record_payment_succeeded(
+            db, stripe_session_id=session_id, payment_intent_id=obj.get("payment_intent"), order_id=order_id_int
+        )
+        return order.id if newly_paid else None
 
     # you can add more event types here:
     # payment_intent.succeeded, charge.refunded, etc.
-    return {"status": "ok"}
+    return None
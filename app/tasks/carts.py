@@ -1,16 +1,24 @@
 from __future__ import annotations
 from app.tasks.celery_app import celery_app
 from app.core.config import settings
-from app.core.db import init_db, SessionLocal
-from app.services.cart_service import expire_cart
+from app.core.db import session_scope
+from app.services.cart_service import expire_cart, sweep_expired_carts
+
+@celery_app.task(name="sweep_expired_carts")
+def sweep_expired_carts_task():
+    """Periodic (beat, every `CART_SWEEP_SECONDS`): expire idle carts and unpaid orders in batches."""
+    totals = {"carts_expired": 0, "orders_cancelled": 0, "lines_released": 0}
+    with session_scope() as db:
+        while True:
+            stats = sweep_expired_carts(db)
+            for k, v in stats.items():
+                totals[k] += v
+            if max(stats["carts_expired"], stats["orders_cancelled"]) < settings.CART_SWEEP_BATCH_SIZE:
+                return totals
 
 @celery_app.task(name="expire_cart_later")
 def expire_cart_later(cart_id: int):
-    # simple: expire after 30 minutes using countdown in celery beat in real life.
-    # Here we just exist as a task hook for demo.
-    init_db(settings.DATABASE_URL)
-    db = SessionLocal()
-    try:
+    # No longer scheduled (see sweep_expired_carts); kept registered so countdown
+    # messages queued before the sweeper existed are still consumed.
+    with session_scope() as db:
         expire_cart(db, cart_id)
-    finally:
-        db.close()
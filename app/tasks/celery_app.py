@@ -1,5 +1,7 @@
 from celery import Celery
+from celery.signals import worker_process_init
 from app.core.config import settings
+from app.core.db import reset_db_after_fork
 
 broker = settings.CELERY_BROKER_URL or settings.REDIS_URL
 backend = settings.CELERY_RESULT_BACKEND or settings.REDIS_URL
@@ -8,10 +10,21 @@ celery_app = Celery(
     "mini_ecommerce",
     broker=broker,
     backend=backend,
-    include=["app.tasks.carts", "app.tasks.orders"],
+    include=["app.tasks.carts", "app.tasks.orders", "app.tasks.webhooks", "app.tasks.health"],
 )
 celery_app.conf.update(
     task_always_eager=False,
     task_ignore_result=True,
+    beat_schedule={
+        "process-webhook-inbox": {"task": "process_webhook_inbox", "schedule": settings.WEBHOOK_POLL_SECONDS},
+        "sweep-expired-carts": {"task": "sweep_expired_carts", "schedule": settings.CART_SWEEP_SECONDS},
+        "flush-fulfillment": {"task": "flush_fulfillment", "schedule": settings.FULFILLMENT_FLUSH_SECONDS},
+    },
 )
 celery_app.autodiscover_tasks(["app.tasks"])
+
+
+@worker_process_init.connect
+def _reset_db_pool(**_):
+    # prefork children must not share sockets opened by the parent
+    reset_db_after_fork()
@@ -0,0 +1,12 @@
+from __future__ import annotations
+import os
+from app.tasks.celery_app import celery_app
+from app.core.db import pool_stats
+
+@celery_app.task(name="db_pool_stats", ignore_result=False)
+def db_pool_stats():
+    """Pool counters of whichever worker process picks this up.
+
+    `celery -A app.tasks.celery_app.celery_app call db_pool_stats` (or `.delay().get()`).
+    """
+    return {"pid": os.getpid(), **pool_stats()}
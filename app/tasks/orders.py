@@ -1,24 +1,54 @@
 from __future__ import annotations
+import stripe
 from app.tasks.celery_app import celery_app
 from app.core.config import settings
-from app.core.db import init_db, SessionLocal
-from app.models.order import Order, OrderStatus
+from app.core.db import session_scope
+from app.services.checkout_service import fail_checkout, open_checkout_session
+from app.services.fulfillment_service import flush_fulfillment, fulfill_orders
 
 @celery_app.task(name="post_payment_pipeline")
 def post_payment_pipeline(order_id: int):
-    """Post-payment pipeline.
+    """Post-payment pipeline for one order (default, unbatched mode).
 
-    In this project, stock is **reserved at checkout** under a DB row lock.
-    After payment confirmation we simply mark the order as fulfilled.
+    In this project, stock is **reserved at checkout** (see `reservation_service`).
+    After payment confirmation we simply mark the order as fulfilled and run the hooks.
     """
-    init_db(settings.DATABASE_URL)
-    db = SessionLocal()
-    try:
-        order = db.query(Order).filter(Order.id == order_id).first()
-        if not order or order.status != OrderStatus.paid:
-            return
+    with session_scope() as db:
+        fulfill_orders(db, [order_id])
 
-        order.status = OrderStatus.fulfilled
-        db.commit()
-    finally:
-        db.close()
+@celery_app.task(name="flush_fulfillment")
+def flush_fulfillment_task():
+    """Periodic (beat, every `FULFILLMENT_FLUSH_SECONDS`) with `FULFILLMENT_BATCHED`:
+    fulfill queued paid orders in batches until one comes back short."""
+    totals = {"read": 0, "fulfilled": 0}
+    with session_scope() as db:
+        while True:
+            stats = flush_fulfillment(db)
+            for k, v in stats.items():
+                totals[k] += v
+            if stats["read"] < settings.FULFILLMENT_BATCH_SIZE:
+                return totals
+
+# Stripe said "try again": network, rate limit, 5xx
+_RETRYABLE = (stripe.APIConnectionError, stripe.RateLimitError, stripe.APIError)
+
+@celery_app.task(name="open_checkout_session", bind=True, max_retries=5)
+def open_checkout_session_task(self, order_id: int):
+    """Create the Stripe session for an order placed with `CHECKOUT_ASYNC` (202).
+
+    Transient Stripe errors retry with exponential backoff; once retries run out, or on
+    a non-retryable error, the order is cancelled and its stock released.
+    """
+    with session_scope() as db:
+        try:
+            open_checkout_session(db, order_id)
+        except _RETRYABLE as e:
+            db.rollback()
+            if self.request.retries < self.max_retries:
+                raise self.retry(exc=e, countdown=min(2 ** self.request.retries, 60))
+            fail_checkout(db, order_id)
+            raise
+        except stripe.StripeError:
+            db.rollback()
+            fail_checkout(db, order_id)
+            raise
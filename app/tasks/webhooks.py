@@ -0,0 +1,21 @@
+from __future__ import annotations
+from app.tasks.celery_app import celery_app
+from app.core.config import settings
+from app.core.db import session_scope
+from app.services.webhook_service import process_webhook_inbox
+
+@celery_app.task(name="process_webhook_inbox")
+def process_webhook_inbox_task():
+    """Drain the webhook inbox: batches until one comes back short.
+
+    Kicked by the webhook endpoint and run by beat every `WEBHOOK_POLL_SECONDS`
+    (which also picks up events whose retry is due).
+    """
+    totals = {"claimed": 0, "processed": 0, "retried": 0, "failed": 0}
+    with session_scope() as db:
+        while True:
+            stats = process_webhook_inbox(db)
+            for k, v in stats.items():
+                totals[k] += v
+            if stats["claimed"] < settings.WEBHOOK_BATCH_SIZE:
+                return totals
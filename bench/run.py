@@ -0,0 +1,319 @@
+"""Load test for the hot endpoints: `python -m bench.run [--requests 500] [--concurrency 16]`.
+
+Seeds a throwaway Postgres (testcontainers, or `--database-url`) and drives the app
+in-process (httpx over ASGI: no HTTP server in the measurement) with `--concurrency`
+clients per scenario:
+
+- `products_list`     GET /products?category={slug}&limit=20 (one cached page per category)
+- `product_get`       GET /products/{id}
+- `cart_create`       POST /cart
+- `cart_add_item`     POST /cart/{id}/items
+- `cart_update_item`  PATCH /cart/{id}/items/{item_id}
+- `checkout`          POST /checkout/{cart_id} (Stripe: local stub over HTTP)
+- `webhook`           POST /webhooks/stripe (signed `checkout.session.completed`)
+
+Each scenario reports p50/p95/p99/max latency, RPS, errors and SQL statements per request
+as JSON (stdout or `--output`); `--baseline old.json` prints the change against an
+earlier run. Redis is an in-process fakeredis unless `--redis-url` is given; the Celery
+broker is in-memory (nothing on the request path needs a worker).
+
+Settings come from the environment as usual (e.g. `DB_ASYNC=true python -m bench.run`).
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import math
+import os
+import random
+import sys
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+@contextmanager
+def count_statements():
+    """Count SQL statements sent by the app's engines (sync and async) while active."""
+    from sqlalchemy import event
+    from app.core import db as core_db
+
+    engines = [e for e in (core_db.engine, getattr(core_db.async_engine, "sync_engine", None)) if e is not None]
+    counter = {"n": 0}
+
+    def _count(*_):
+        counter["n"] += 1
+
+    for e in engines:
+        event.listen(e, "before_cursor_execute", _count)
+    try:
+        yield counter
+    finally:
+        for e in engines:
+            event.remove(e, "before_cursor_execute", _count)
+
+
+async def drive(jobs: list, send, concurrency: int) -> dict:
+    """Run `send(job)` (one request, returns the response) for every job, `concurrency` at a time."""
+    latencies, statuses = [], Counter()
+    pending = iter(jobs)
+    results = []
+
+    async def client():
+        for job in pending:  # shared iterator: each job is taken once
+            t0 = time.perf_counter()
+            try:
+                r = await send(job)
+                statuses[r.status_code] += 1
+                results.append((job, r))
+            except Exception as e:
+                statuses[type(e).__name__] += 1
+            latencies.append(time.perf_counter() - t0)
+
+    with count_statements() as statements:
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    n = len(latencies)
+    ok = sum(v for k, v in statuses.items() if isinstance(k, int) and k < 400)
+    stats = {
+        "requests": n,
+        "errors": n - ok,
+        "statuses": {str(k): v for k, v in sorted(statuses.items(), key=str)},
+        "rps": round(n / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+            "max": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+            "mean": round(sum(latencies) / n * 1000, 2) if n else 0.0,
+        },
+        "queries_per_request": round(statements["n"] / n, 2) if n else 0.0,
+    }
+    return {"stats": stats, "results": results}
+
+
+def seed(db, *, categories: int, products: int, token: str) -> tuple[list[str], list[int]]:
+    """Insert `categories` categories and `products` active products (deep stock).
+
+    Returns the category slugs (what `GET /products` filters on) and the product ids.
+    """
+    from sqlalchemy import insert
+    from app.models.category import Category
+    from app.models.product import Product
+
+    rnd = random.Random(token)
+    category_rows = db.execute(
+        insert(Category).returning(Category.id, Category.slug),
+        [{"name": f"Bench {token} {i}", "slug": f"bench-{token}-{i}"} for i in range(categories)],
+    ).all()
+    category_ids = [row.id for row in category_rows]
+    product_ids = []
+    for start in range(0, products, 1000):
+        rows = [
+            {
+                "category_id": category_ids[i % categories],
+                "sku": f"BENCH-{token}-{i}",
+                "name": f"Bench product {i}",
+                "description": "seeded by bench.run",
+                "price_cents": rnd.randint(100, 100_000),
+                "currency": "brl",
+                "stock": 1_000_000,
+                "active": True,
+            }
+            for i in range(start, min(start + 1000, products))
+        ]
+        product_ids += db.execute(insert(Product).returning(Product.id), rows).scalars().all()
+    db.commit()
+    return [row.slug for row in category_rows], product_ids
+
+
+def sign_webhook(payload: bytes, secret: str) -> str:
+    """`Stripe-Signature` header for `payload`, as Stripe computes it."""
+    t = int(time.time())
+    v1 = hmac.new(secret.encode(), f"{t}.".encode() + payload, hashlib.sha256).hexdigest()
+    return f"t={t},v1={v1}"
+
+
+async def run_benchmark(*, requests: int = 500, concurrency: int = 16, categories: int = 20,
+                        products: int = 2000, seed_value: int = 0) -> dict:
+    """Seed, run every scenario in order, return the report (the app's settings must point at the DB)."""
+    import httpx
+    import stripe
+    from app.core.config import settings
+    from app.core.db import session_scope
+    from app.main import create_app
+    from tests.stripe_stub import StripeStub
+
+    token = uuid.uuid4().hex[:8]
+    with session_scope() as db:
+        category_slugs, product_ids = seed(db, categories=categories, products=products, token=token)
+
+    rnd = random.Random(seed_value)
+    app = create_app()
+    report = {
+        "meta": {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "requests": requests,
+            "concurrency": concurrency,
+            "categories": categories,
+            "products": products,
+            "settings": {
+                k: getattr(settings, k)
+                for k in ("DB_ASYNC", "DB_POOL_SIZE", "DB_MAX_OVERFLOW", "LOCAL_CACHE_ENABLED", "CART_BACKEND", "CHECKOUT_ASYNC")
+            },
+        },
+        "scenarios": {},
+    }
+    scenarios = report["scenarios"]
+
+    saved_api_base = stripe.api_base
+    with StripeStub() as stub:
+        stripe.api_base = stub.url
+        try:
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as c:
+                async def run(name, jobs, send):
+                    out = await drive(jobs, send, concurrency)
+                    scenarios[name] = out["stats"]
+                    return out["results"]
+
+                await run(
+                    "products_list", [rnd.choice(category_slugs) for _ in range(requests)],
+                    lambda slug: c.get("/products", params={"category": slug, "limit": 20}),
+                )
+                await run(
+                    "product_get", [rnd.choice(product_ids) for _ in range(requests)],
+                    lambda pid: c.get(f"/products/{pid}"),
+                )
+                created = await run("cart_create", list(range(requests)), lambda _: c.post("/cart"))
+                cart_ids = [r.json()["id"] for _, r in created if r.status_code == 201]
+                added = await run(
+                    "cart_add_item", [(cid, rnd.choice(product_ids)) for cid in cart_ids],
+                    lambda job: c.post(f"/cart/{job[0]}/items", json={"product_id": job[1], "qty": 1}),
+                )
+                items = [(cid, r.json()["items"][0]["id"]) for (cid, _), r in added if r.status_code == 200]
+                await run(
+                    "cart_update_item", items,
+                    lambda job: c.patch(f"/cart/{job[0]}/items/{job[1]}", json={"qty": 2}),
+                )
+                checked_out = await run(
+                    "checkout", [cid for cid, _ in items], lambda cid: c.post(f"/checkout/{cid}"),
+                )
+                order_ids = [r.json()["order_id"] for _, r in checked_out if r.status_code in (200, 202)]
+
+                def webhook(order_id):
+                    payload = json.dumps({
+                        "id": f"evt_bench_{token}_{order_id}",
+                        "object": "event",
+                        "type": "checkout.session.completed",
+                        "data": {"object": {"id": f"cs_bench_{order_id}", "metadata": {"order_id": str(order_id)}}},
+                    }).encode()
+                    headers = {"Stripe-Signature": sign_webhook(payload, settings.STRIPE_WEBHOOK_SECRET)}
+                    return c.post("/webhooks/stripe", content=payload, headers=headers)
+
+                await run("webhook", order_ids, webhook)
+        finally:
+            stripe.api_base = saved_api_base
+    return report
+
+
+def compare(baseline: dict, current: dict) -> str:
+    """Plain-text table of p50/p95/p99/RPS/queries changes between two reports."""
+    lines = [f"{'scenario':<18}{'p50 ms':>16}{'p95 ms':>16}{'p99 ms':>16}{'rps':>18}{'queries':>14}"]
+
+    def cell(old, new):
+        if not old:
+            return f"{new}"
+        return f"{new} ({(new - old) / old * 100:+.0f}%)"
+
+    for name, new in current["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if old is None:
+            continue
+        lines.append(
+            f"{name:<18}"
+            + "".join(f"{cell(old['latency_ms'][p], new['latency_ms'][p]):>16}" for p in ("p50", "p95", "p99"))
+            + f"{cell(old['rps'], new['rps']):>18}"
+            + f"{cell(old['queries_per_request'], new['queries_per_request']):>14}"
+        )
+    return "\n".join(lines)
+
+
+def use_fakeredis():
+    """Point the app's Redis clients (sync, and asyncio under `DB_ASYNC`) at one in-process fakeredis."""
+    import fakeredis
+    import app.core.cache as cache
+    server = fakeredis.FakeServer()
+    cache._redis = fakeredis.FakeRedis(server=server, decode_responses=True)
+    cache._new_async_redis = lambda: fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+    cache._async_redis = None
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(prog="python -m bench.run", description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--categories", type=int, default=20)
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0, help="random seed for request mixes")
+    parser.add_argument("--database-url", help="use this (migrated here) database instead of a container")
+    parser.add_argument("--redis-url", help="use this Redis instead of an in-process fakeredis")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="earlier JSON report to compare against (printed to stderr)")
+    args = parser.parse_args(argv)
+
+    container = None
+    database_url = args.database_url
+    if database_url is None:
+        from testcontainers.postgres import PostgresContainer
+        container = PostgresContainer("postgres:16").__enter__()
+        database_url = container.get_connection_url().replace("postgresql://", "postgresql+psycopg://")
+    # before any app import: settings are read once
+    os.environ["DATABASE_URL"] = database_url
+    if args.redis_url:
+        os.environ["REDIS_URL"] = args.redis_url
+
+    try:
+        from alembic import command
+        from alembic.config import Config
+        command.upgrade(Config("alembic.ini"), "head")
+
+        from app.tasks.celery_app import celery_app
+        if not args.redis_url:
+            use_fakeredis()
+        celery_app.conf.broker_url = "memory://"
+
+        report = asyncio.run(run_benchmark(
+            requests=args.requests, concurrency=args.concurrency, categories=args.categories,
+            products=args.products, seed_value=args.seed,
+        ))
+        report["meta"]["redis"] = args.redis_url or "fakeredis (in-process)"
+    finally:
+        if container is not None:
+            container.__exit__(None, None, None)
+
+    out = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(out + "\n")
+    else:
+        print(out)
+    if args.baseline:
+        with open(args.baseline) as f:
+            print(compare(json.load(f), report), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 import pytest
-from sqlalchemy import create_engine
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from httpx import AsyncClient
 
@@ -45,6 +46,21 @@ def db_session(engine):
         db.rollback()
         db.close()
 
+@pytest.fixture
+def count_queries(engine):
+    """`with count_queries() as statements:` collects every SQL statement sent to the test DB."""
+    @contextmanager
+    def _count():
+        statements = []
+        def _record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(engine, "before_cursor_execute", _record)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, "before_cursor_execute", _record)
+    return _count
+
 @pytest.fixture
 def app(db_session):
     app = create_app()
@@ -0,0 +1,57 @@
+"""A tiny local stand-in for the Stripe API (enough of `POST /v1/checkout/sessions`)."""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class StripeStub:
+    def __init__(self):
+        self.calls = []  # (path, idempotency key, client port)
+        self.fail_next = 0  # answer this many requests with a 500 first
+        self._sessions = {}
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like api.stripe.com
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+                key = self.headers.get("Idempotency-Key")
+                stub.calls.append((self.path, key, self.client_address[1]))
+                if stub.fail_next:
+                    stub.fail_next -= 1
+                    return self._send(500, {"error": {"type": "api_error", "message": "stub failure"}})
+                if self.path != "/v1/checkout/sessions":
+                    return self._send(404, {"error": {"type": "invalid_request_error", "message": "unknown path"}})
+                if key not in stub._sessions:
+                    n = len(stub._sessions) + 1
+                    stub._sessions[key] = {
+                        "id": f"cs_stub_{n}",
+                        "object": "checkout.session",
+                        "url": f"https://checkout.stub/pay/{n}",
+                        "metadata": {"order_id": parse_qs(body).get("metadata[order_id]", [None])[0]},
+                    }
+                self._send(200, stub._sessions[key])
+
+            def _send(self, status, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
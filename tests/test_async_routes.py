@@ -0,0 +1,109 @@
+"""Routes on an `AsyncSession` (`DB_ASYNC`): the same services, run through `AsyncSession.run_sync`.
+
+Redis is shared between a sync and an asyncio fake; the sync one fails any call made on the
+event loop thread, so a blocking round trip that stalls the loop fails the request.
+"""
+import threading
+
+import fakeredis
+import fakeredis.aioredis
+import pytest
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import app.core.cache as cache
+from app.core.config import settings
+from app.core.db import async_database_url, get_db
+from app.main import create_app
+
+
+class OffLoopRedis(fakeredis.FakeRedis):
+    loop_thread = None
+
+    def execute_command(self, *args, **options):
+        assert threading.get_ident() != self.loop_thread, f"blocking Redis {args[0]} on the event loop"
+        return super().execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        assert threading.get_ident() != self.loop_thread, "blocking Redis pipeline on the event loop"
+        return super().pipeline(transaction, shard_hint)
+
+
+@pytest.fixture
+async def client(engine, pg_url, monkeypatch):
+    server = fakeredis.FakeServer()
+    sync_redis = OffLoopRedis(server=server, decode_responses=True)
+    sync_redis.loop_thread = threading.get_ident()
+    monkeypatch.setattr(cache, "_redis", sync_redis)
+    monkeypatch.setattr(cache, "_new_async_redis", lambda: fakeredis.aioredis.FakeRedis(server=server, decode_responses=True))
+    monkeypatch.setattr(cache, "_async_redis", None)
+    cache.local_cache.clear()
+    monkeypatch.setattr(
+        "app.services.checkout_service.create_checkout_session",
+        lambda **kwargs: {"id": f"cs_async_{kwargs['order_id']}", "url": "https://fake.checkout/async"},
+    )
+
+    async_engine = create_async_engine(async_database_url(pg_url))
+    AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+    async def _get_async_db():
+        async with AsyncSessionLocal() as db:
+            yield db
+
+    app = create_app()
+    app.dependency_overrides[get_db] = _get_async_db
+    async with AsyncClient(app=app, base_url="http://test") as c:
+        yield c
+    cache.local_cache.clear()
+    await async_engine.dispose()
+
+
+async def _product(client, name, stock=10):
+    cat = (await client.post("/categories", json={"name": name})).json()
+    r = await client.post("/products", json={
+        "category_id": cat["id"], "name": name, "price_cents": 400, "currency": "brl", "stock": stock, "active": True,
+    })
+    assert r.status_code == 201
+    return cat, r.json()
+
+
+async def test_catalog_reads_and_writes(client):
+    cat, product = await _product(client, "Async catalog")
+    for _ in range(2):  # miss, then cached
+        r = await client.get(f"/products/{product['id']}")
+        assert r.status_code == 200 and r.json()["name"] == "Async catalog"
+    page = (await client.get("/products", params={"category": cat["slug"]})).json()
+    assert [p["id"] for p in page["items"]] == [product["id"]]
+    r = await client.patch(f"/products/{product['id']}", json={"name": "Async catalog v2"})
+    assert r.status_code == 200
+    assert (await client.get(f"/products/{product['id']}")).json()["name"] == "Async catalog v2"
+    batch = (await client.post("/products/batch", json={"ids": [product["id"], 10**9]})).json()
+    assert [p["id"] for p in batch["items"]] == [product["id"]]
+
+
+async def test_cart_and_checkout(client):
+    _, product = await _product(client, "Async cart")
+    cart = (await client.post("/cart")).json()
+    r = await client.post(f"/cart/{cart['id']}/items", json={"product_id": product["id"], "qty": 2})
+    assert (r.status_code, r.json()["total_cents"]) == (200, 800)
+    item_id = r.json()["items"][0]["id"]
+    r = await client.patch(f"/cart/{cart['id']}/items/{item_id}", json={"qty": 3})
+    assert r.json()["total_cents"] == 1200
+    assert (await client.post(f"/cart/{cart['id']}/items", json={"product_id": product["id"], "qty": 8})).status_code == 409
+
+    r = await client.post(f"/checkout/{cart['id']}", headers={"Idempotency-Key": "async-checkout"})
+    assert r.status_code == 200
+    order_id = r.json()["order_id"]
+    assert r.json()["session_id"] == f"cs_async_{order_id}"
+    assert (await client.get(f"/orders/{order_id}")).json()["total_cents"] == 1200
+    assert (await client.get(f"/cart/{cart['id']}")).json()["status"] == "checked_out"
+
+
+async def test_redis_cart_backend(client, monkeypatch):
+    monkeypatch.setattr(settings, "CART_BACKEND", "redis")
+    _, product = await _product(client, "Async redis cart", stock=3)
+    cart = (await client.post("/cart")).json()
+    r = await client.post(f"/cart/{cart['id']}/items", json={"product_id": product["id"], "qty": 2})
+    assert (r.status_code, r.json()["total_cents"]) == (200, 800)
+    assert (await client.patch(f"/cart/{cart['id']}/items/{product['id']}", json={"qty": 5})).status_code == 409
+    assert (await client.delete(f"/cart/{cart['id']}/items/{product['id']}")).json()["items"] == []
@@ -0,0 +1,48 @@
+import pytest
+
+import app.core.cache as cache
+from app.core.config import settings
+from app.core.db import get_async_db, get_db
+from app.services.webhook_service import process_webhook_inbox
+from bench.run import compare, percentile, run_benchmark, use_fakeredis
+
+
+def test_percentile_is_nearest_rank():
+    values = [float(i) for i in range(1, 101)]
+    assert (percentile(values, 50), percentile(values, 99), percentile(values, 100)) == (50.0, 99.0, 100.0)
+    assert percentile([], 50) == 0.0
+
+
+@pytest.mark.parametrize("db_async", [False, True], ids=["sync", "db_async"])
+async def test_benchmark_runs_every_scenario_without_errors(pg_url, db_session, monkeypatch, db_async):
+    monkeypatch.setattr(settings, "DATABASE_URL", pg_url)
+    monkeypatch.setattr(settings, "DB_ASYNC", db_async)
+    monkeypatch.setattr(settings, "REDIS_URL", "redis://127.0.0.1:1/0")  # nothing may reach a real Redis
+    for name in ("_redis", "_new_async_redis", "_async_redis"):
+        monkeypatch.setattr(cache, name, getattr(cache, name))
+    # what `main` does without --redis-url; in DB_ASYNC mode Redis is reached through the asyncio client
+    use_fakeredis()
+    if db_async:
+        # routes bound `get_session` at import: serve it from the async engine, as DB_ASYNC would
+        from app import main
+        create_app = main.create_app
+
+        def create_async_app():
+            app = create_app()
+            app.dependency_overrides[get_db] = get_async_db
+            return app
+
+        monkeypatch.setattr(main, "create_app", create_async_app)
+
+    report = await run_benchmark(requests=6, concurrency=3, categories=2, products=10)
+
+    assert list(report["scenarios"]) == [
+        "products_list", "product_get", "cart_create", "cart_add_item", "cart_update_item", "checkout", "webhook",
+    ]
+    for name, stats in report["scenarios"].items():
+        assert (name, stats["requests"], stats["errors"]) == (name, 6, 0)
+        assert stats["latency_ms"]["p50"] <= stats["latency_ms"]["p99"] <= stats["latency_ms"]["max"]
+    assert report["scenarios"]["checkout"]["queries_per_request"] > 0
+    assert "checkout" in compare(report, report)
+    # the webhook scenario only fills the inbox: apply its events so other tests start from an empty one
+    assert process_webhook_inbox(db_session)["processed"] == 6
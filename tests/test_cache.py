@@ -0,0 +1,127 @@
+import threading
+import time
+
+import fakeredis
+import pytest
+
+import app.core.cache as cache
+from app.core.cache import LocalCache
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    r = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(cache, "_redis", r)
+    cache.stop_invalidation_listener()
+    cache.local_cache.clear()
+    yield r
+    cache.stop_invalidation_listener()
+    cache.local_cache.clear()
+
+
+def _wait_for(cond, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not cond() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_local_cache_is_bounded_lru():
+    lc = LocalCache(max_items=2, ttl_seconds=60)
+    lc.set("a", 1)
+    lc.set("b", 2)
+    assert lc.get("a") == (True, 1)  # "a" is now most recent
+    lc.set("c", 3)
+    assert lc.get("b") == (False, None)
+    assert lc.get("a") == (True, 1)
+    assert lc.get("c") == (True, 3)
+
+
+def test_local_cache_ttl_is_capped_by_redis_ttl():
+    lc = LocalCache(max_items=10, ttl_seconds=60)
+    lc.set("k", "v", ttl_seconds=0.01)
+    time.sleep(0.02)
+    assert lc.get("k") == (False, None)
+
+
+def test_second_read_is_served_in_process(fake_redis):
+    cache.cache_set_json("product:1", {"id": 1}, ttl_seconds=60)
+    fake_redis.delete("product:1")  # prove Redis is not consulted
+    assert cache.cache_get_json("product:1") == {"id": 1}
+
+
+def test_invalidation_from_another_worker_evicts_local_copy(fake_redis):
+    cache.cache_set_json("product:1", {"id": 1}, ttl_seconds=60)
+    assert cache.cache_get_json("product:1") == {"id": 1}
+    _wait_for(lambda: fake_redis.pubsub_numsub(cache.INVALIDATION_CHANNEL)[0][1] > 0)
+
+    # another worker updates the product: deletes in Redis and publishes
+    fake_redis.delete("product:1")
+    fake_redis.publish(cache.INVALIDATION_CHANNEL, '["product:1"]')
+
+    _wait_for(lambda: not cache.local_cache.get("product:1")[0])
+    assert cache.cache_get_json("product:1") is None
+
+
+def test_stopping_the_listener_ends_its_thread(fake_redis):
+    cache.cache_get_json("product:1")
+    _wait_for(lambda: fake_redis.pubsub_numsub(cache.INVALIDATION_CHANNEL)[0][1] > 0)
+    thread, _ = cache._listener
+
+    cache.stop_invalidation_listener()
+    assert not thread.is_alive()
+    assert fake_redis.pubsub_numsub(cache.INVALIDATION_CHANNEL)[0][1] == 0
+
+
+def test_concurrent_misses_compute_once(fake_redis):
+    calls = []
+    barrier = threading.Barrier(8)
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.1)
+        return {"items": [], "next_cursor": None}
+
+    def worker(out):
+        barrier.wait()
+        out.append(cache.cache_get_or_compute_json("products:list", compute, ttl_seconds=60))
+
+    results = []
+    threads = [threading.Thread(target=worker, args=(results,)) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert results == [{"items": [], "next_cursor": None}] * 8
+
+
+def test_stale_value_served_while_another_caller_recomputes(fake_redis):
+    cache.cache_set_json("product:1", {"v": {"id": 1, "stock": 5}, "fresh_until": time.time() - 1}, 60)
+    fake_redis.set("lock:product:1", "someone-else")
+
+    def compute():
+        raise AssertionError("must not recompute while the lock is held")
+
+    assert cache.cache_get_or_compute_json("product:1", compute, ttl_seconds=60) == {"id": 1, "stock": 5}
+
+
+def test_get_or_compute_many_computes_only_misses_in_one_call(fake_redis):
+    cache.cache_get_or_compute_json("product:1", lambda: {"id": 1}, ttl_seconds=60)
+    calls = []
+
+    def compute_many(keys):
+        calls.append(keys)
+        return {k: {"id": int(k.split(":")[1])} for k in keys if k != "product:404"}
+
+    keys = ["product:1", "product:2", "product:404"]
+    assert cache.cache_get_or_compute_many_json(keys, compute_many, ttl_seconds=60) == {
+        "product:1": {"id": 1}, "product:2": {"id": 2}, "product:404": None,
+    }
+    assert calls == [["product:2", "product:404"]]
+
+    # misses were written back (None included) as envelopes the single-key path reads
+    cache.local_cache.clear()
+    assert cache.cache_get_or_compute_many_json(keys, compute_many, ttl_seconds=60)["product:404"] is None
+    assert cache.cache_get_or_compute_json("product:2", lambda: pytest.fail("recomputed"), ttl_seconds=60) == {"id": 2}
+    assert len(calls) == 1
@@ -0,0 +1,54 @@
+import fakeredis
+
+import app.core.cache as cache
+from app.core.config import settings
+from app.models.cart import Cart, CartItem
+from app.services import cart_store
+
+
+async def test_redis_cart_is_written_to_postgres_only_at_checkout(client, db_session, monkeypatch):
+    monkeypatch.setattr(settings, "CART_BACKEND", "redis")
+    # reserved cart ids belong to this test database's sequence
+    monkeypatch.setattr(cache, "_redis", fakeredis.FakeRedis(decode_responses=True))
+    monkeypatch.setattr(
+        "app.services.checkout_service.create_checkout_session",
+        lambda **kwargs: {"id": "cs_redis_cart", "url": "https://fake.checkout/redis"},
+    )
+    cat = (await client.post("/categories", json={"name": "Hot carts"})).json()
+    prod = (await client.post("/products", json={
+        "category_id": cat["id"], "name": "Hot", "price_cents": 250, "currency": "brl", "stock": 3, "active": True,
+    })).json()
+
+    cart = (await client.post("/cart")).json()
+    r = await client.post(f"/cart/{cart['id']}/items", json={"product_id": prod["id"], "qty": 2})
+    assert r.json()["total_cents"] == 500
+    assert (await client.post(f"/cart/{cart['id']}/items", json={"product_id": prod["id"], "qty": 2})).status_code == 409
+    r = await client.patch(f"/cart/{cart['id']}/items/{prod['id']}", json={"qty": 1})
+    assert r.json()["items"] == [{"id": prod["id"], "product_id": prod["id"], "qty": 1, "unit_price_cents": 250}]
+
+    assert db_session.get(Cart, cart["id"]) is None
+
+    assert (await client.post(f"/checkout/{cart['id']}")).status_code == 200
+    persisted = db_session.get(Cart, cart["id"])
+    assert persisted.status.value == "checked_out"
+    assert (persisted.total_cents, persisted.item_count, persisted.currency) == (250, 1, "brl")
+    assert [(i.product_id, i.qty) for i in db_session.query(CartItem).filter(CartItem.cart_id == cart["id"])] == [(prod["id"], 1)]
+
+    assert (await client.get(f"/cart/{cart['id']}")).json()["status"] == "checked_out"
+
+
+def test_redis_cart_ids_are_reserved_from_the_sequence_in_blocks(db_session, count_queries, monkeypatch):
+    monkeypatch.setattr(cache, "_redis", fakeredis.FakeRedis(decode_responses=True))
+    monkeypatch.setattr(settings, "CART_ID_BLOCK_SIZE", 3)
+
+    with count_queries() as statements:
+        ids = [cart_store.create(db_session).id for _ in range(4)]
+        # a db-backend cart draws from the same sequence meanwhile
+        db_cart = Cart()
+        db_session.add(db_cart)
+        db_session.commit()
+        ids.append(cart_store.create(db_session).id)
+
+    assert sum("nextval" in s for s in statements) == 2  # one per block of 3, not one per cart
+    assert ids[:3] == list(range(ids[0], ids[0] + 3))
+    assert len(set(ids + [db_cart.id])) == 6
@@ -0,0 +1,176 @@
+import json
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from app.core.config import settings
+from app.services.catalog_service import update_product
+from app.schemas.product import ProductImportRow
+from app.services import import_service
+from app.services.import_service import MAX_BATCH_ROWS, import_products, upsert_products_batch
+
+
+async def test_import_upserts_by_sku_and_reports_bad_rows(client):
+    cat = (await client.post("/categories", json={"name": "Feed"})).json()
+    rows = [
+        {"sku": "FEED-1", "category_id": cat["id"], "name": "One", "price_cents": 100, "stock": 1},
+        {"sku": "FEED-2", "category_id": cat["id"], "name": "Two", "price_cents": 200, "stock": 2},
+        {"sku": "FEED-3", "category_id": 999999, "name": "Orphan", "price_cents": 300},
+    ]
+    body = ("\n".join(json.dumps(r) for r in rows) + "\n{broken\n").encode() + b'{"name": "\xff"}\n'
+    r = await client.post("/products/import", content=body, headers={"Content-Type": "application/x-ndjson"})
+    assert r.status_code == 200
+    report = r.json()
+    assert (report["inserted"], report["updated"], report["failed"]) == (2, 0, 3)
+    assert sorted((e["line"], e["error"]) for e in report["errors"])[1:] == [(4, "invalid JSON"), (5, "invalid UTF-8")]
+
+    csv_body = f"sku,category_id,name,price_cents,stock\nFEED-1,{cat['id']},One v1.5,140,5\nFEED-1,{cat['id']},One v2,150,5\n"
+    report = (await client.post("/products/import", content=csv_body, headers={"Content-Type": "text/csv"})).json()
+    assert (report["inserted"], report["updated"], report["superseded"], report["failed"]) == (0, 1, 1, 0)
+
+    # out-of-range rows fail on their own; the rest of their batch still lands
+    csv_body = (
+        f"sku,category_id,name,price_cents,currency,stock\n"
+        f"FEED-4,{cat['id']},{'x' * 201},100,brl,1\n"
+        f"FEED-5,{cat['id']},Five,-1,brl,1\n"
+        f"FEED-6,{cat['id']},Six,100,{'c' * 11},1\n"
+        f"FEED-7,{cat['id']},Seven,100,brl,-3\n"
+        f"FEED-8,{cat['id']},Eight,100,brl,1\n"
+    )
+    report = (await client.post("/products/import", content=csv_body, headers={"Content-Type": "text/csv"})).json()
+    assert (report["inserted"], report["updated"], report["failed"]) == (1, 0, 4)
+    assert [(e["line"], e["sku"]) for e in report["errors"]] == [(2, "FEED-4"), (3, "FEED-5"), (4, "FEED-6"), (5, "FEED-7")]
+
+    page = (await client.get("/products", params={"category": cat["slug"]})).json()
+    assert {p["sku"]: p["price_cents"] for p in page["items"]} == {"FEED-1": 150, "FEED-2": 200, "FEED-8": 100}
+
+
+async def test_import_batches_stay_under_the_bind_parameter_limit(client, monkeypatch):
+    monkeypatch.setattr(settings, "IMPORT_BATCH_SIZE", 100_000)
+    cat = (await client.post("/categories", json={"name": "Big feed"})).json()
+    n = MAX_BATCH_ROWS + 10
+    body = "".join(
+        json.dumps({"sku": f"BIG-{i}", "category_id": cat["id"], "name": f"Big {i}", "price_cents": 1}) + "\n"
+        for i in range(n)
+    )
+    r = await client.post("/products/import", content=body, headers={"Content-Type": "application/x-ndjson"})
+    assert r.status_code == 200
+    assert (r.json()["inserted"], r.json()["failed"]) == (n, 0)
+
+
+async def test_overlong_lines_are_reported_without_being_buffered(monkeypatch):
+    monkeypatch.setattr(settings, "IMPORT_MAX_LINE_BYTES", 10)
+
+    async def chunks():
+        for chunk in (b"short\n" + b"x" * 8, b"x" * 8, b"x" * 30, b"xx\nok\n" + b"y" * 11 + b"\nlast"):
+            yield chunk
+
+    assert [line async for line in import_service._iter_lines(chunks())] == [b"short", None, b"ok", None, b"last"]
+
+
+async def test_committed_batches_are_invalidated_when_the_upload_aborts(client, db_session, monkeypatch):
+    cat = (await client.post("/categories", json={"name": "Aborted feed"})).json()
+    monkeypatch.setattr(settings, "IMPORT_BATCH_SIZE", 2)
+    invalidated = []
+    monkeypatch.setattr(import_service, "invalidate_products_cache", lambda ids: invalidated.extend(ids))
+
+    async def chunks():
+        for i in range(3):
+            yield (json.dumps({"sku": f"ABORT-{i}", "category_id": cat["id"], "name": "A", "price_cents": 1}) + "\n").encode()
+        raise ConnectionError("client went away")
+
+    with pytest.raises(ConnectionError):
+        await import_products(db_session, chunks(), "ndjson")
+    assert len(invalidated) == 2  # the first batch committed; the third row never did
+
+
+async def test_a_batch_the_database_rejects_is_retried_row_by_row(client, db_session):
+    cat = (await client.post("/categories", json={"name": "Retry feed"})).json()
+    good = [ProductImportRow(sku=f"RETRY-{i}", category_id=cat["id"], name=f"Retry {i}", price_cents=1) for i in range(2)]
+    # skips validation, as a row the schema missed would
+    too_long = ProductImportRow.model_construct(
+        sku="RETRY-X", category_id=cat["id"], name="x" * 300, description=None,
+        price_cents=1, currency="brl", stock=0, active=True,
+    )
+    orphan = ProductImportRow(sku="RETRY-O", category_id=999999, name="Orphan", price_cents=1)
+
+    inserted, updated, errors = upsert_products_batch(db_session, [(1, good[0]), (2, too_long), (3, orphan), (4, good[1])])
+    assert (len(inserted), updated) == (2, [])
+    assert [(line, sku) for line, sku, _ in errors] == [(3, "RETRY-O"), (2, "RETRY-X")]
+    assert "too long" in errors[1][2]
+
+
+async def test_product_writes_map_only_known_constraints_to_409(client, db_session):
+    cat = (await client.post("/categories", json={"name": "Constraints"})).json()
+    body = {"category_id": cat["id"], "sku": "DUP-1", "name": "Dup", "price_cents": 100}
+    p = (await client.post("/products", json=body)).json()
+    r = await client.post("/products", json=body)
+    assert (r.status_code, r.json()["detail"]) == (409, "SKU exists")
+    r = await client.post("/products", json={**body, "sku": "DUP-2", "category_id": 999999})
+    assert (r.status_code, r.json()["detail"]) == (409, "Category not found")
+
+    # any other violation (here NOT NULL) is not reported as a conflict
+    with pytest.raises(IntegrityError):
+        update_product(db_session, p["id"], {"category_id": None})
+
+
+async def test_adjust_applies_deltas_in_one_statement_and_never_goes_negative(client):
+    cat = (await client.post("/categories", json={"name": "Warehouse"})).json()
+    base = {"category_id": cat["id"], "price_cents": 100, "currency": "brl", "active": True}
+    a = (await client.post("/products", json={**base, "name": "A", "stock": 5})).json()
+    b = (await client.post("/products", json={**base, "name": "B", "stock": 1})).json()
+    await client.get(f"/products/{a['id']}")  # warm the cache
+
+    r = await client.post("/products/adjust", json={"items": [
+        {"product_id": a["id"], "stock_delta": -2, "price_cents": 90},
+        {"product_id": b["id"], "stock_delta": -2},
+    ]})
+    assert r.status_code == 200
+    assert r.json()["applied"] == [{"id": a["id"], "stock": 3, "price_cents": 90}]
+    assert r.json()["rejected"] == [{"product_id": b["id"], "reason": "insufficient stock"}]
+    assert (await client.get(f"/products/{a['id']}")).json()["stock"] == 3
+
+    r = await client.post("/products/adjust", json={"atomic": True, "items": [
+        {"product_id": a["id"], "stock_delta": -1},
+        {"product_id": b["id"], "stock_delta": -2},
+    ]})
+    assert r.status_code == 409
+    assert (await client.get(f"/products/{a['id']}")).json()["stock"] == 3
+
+
+async def test_export_streams_whole_catalog_as_ndjson_and_csv(client, monkeypatch):
+    monkeypatch.setattr("app.services.export_service.EXPORT_BATCH_SIZE", 2)
+    cat = (await client.post("/categories", json={"name": "Export"})).json()
+    base = {"category_id": cat["id"], "price_cents": 100, "currency": "brl", "stock": 1}
+    made = [(await client.post("/products", json={**base, "name": f"E{i}", "active": i != 2})).json() for i in range(5)]
+
+    r = await client.get("/products/export")
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    rows = {p["id"]: p for p in map(json.loads, r.text.splitlines())}
+    assert [rows[p["id"]]["name"] for p in made] == ["E0", "E1", "E2", "E3", "E4"]
+    assert rows[made[2]["id"]]["active"] is False
+    assert list(rows) == sorted(rows)
+
+    r = await client.get("/products/export", params={"format": "csv"})
+    lines = r.text.splitlines()
+    assert lines[0] == "id,category_id,sku,name,description,price_cents,currency,stock,active"
+    assert len(lines) == len(rows) + 1
+
+    assert (await client.get("/products/export", params={"format": "xml"})).status_code == 422
+
+
+async def test_batch_lookup_keeps_order_and_reports_missing(client):
+    cat = (await client.post("/categories", json={"name": "Wishlist"})).json()
+    base = {"category_id": cat["id"], "price_cents": 100, "currency": "brl", "stock": 1, "active": True}
+    a = (await client.post("/products", json={**base, "name": "Wish A"})).json()
+    b = (await client.post("/products", json={**base, "name": "Wish B"})).json()
+
+    body = {"ids": [b["id"], 987654, a["id"], b["id"]]}
+    for _ in range(2):  # cold, then served from cache
+        r = (await client.post("/products/batch", json=body)).json()
+        assert [p["name"] for p in r["items"]] == ["Wish B", "Wish A"]
+        assert r["missing"] == [987654]
+
+    await client.patch(f"/products/{a['id']}", json={"name": "Wish A2"})
+    r = (await client.post("/products/batch", json={"ids": [a["id"]]})).json()
+    assert r["items"][0]["name"] == "Wish A2"
@@ -0,0 +1,87 @@
+import pytest
+import stripe
+
+from app.core.config import settings
+from app.models.product import Product
+from app.services import checkout_service, outbox_service
+from app.services.stripe_service import create_checkout_session
+from tests.stripe_stub import StripeStub
+
+
+@pytest.fixture
+def stripe_stub(monkeypatch):
+    with StripeStub() as stub:
+        monkeypatch.setattr(stripe, "api_base", stub.url)
+        monkeypatch.setattr(stripe, "max_network_retries", 0)
+        yield stub
+
+
+def test_stripe_client_reuses_connection_and_is_idempotent(stripe_stub):
+    first = create_checkout_session(order_id=7, amount_cents=1000, currency="brl")
+    again = create_checkout_session(order_id=7, amount_cents=1000, currency="brl")
+    other = create_checkout_session(order_id=8, amount_cents=1000, currency="brl")
+
+    assert first == again != other
+    assert first["url"].startswith("https://checkout.stub/")
+    assert [key for _, key, _ in stripe_stub.calls] == ["checkout-order-7", "checkout-order-7", "checkout-order-8"]
+    assert len({port for _, _, port in stripe_stub.calls}) == 1  # one keep-alive connection
+
+
+async def test_deferred_checkout_returns_202_and_worker_fills_in_the_url(client, db_session, stripe_stub, monkeypatch):
+    monkeypatch.setattr(settings, "CHECKOUT_ASYNC", True)
+    sent = []
+    monkeypatch.setattr(
+        outbox_service.celery_app, "send_task", lambda name, args, kwargs: sent.append((name, args))
+    )
+
+    cat = (await client.post("/categories", json={"name": "Deferred"})).json()
+    prod = (await client.post("/products", json={
+        "category_id": cat["id"], "name": "Later", "price_cents": 700, "currency": "brl", "stock": 5, "active": True,
+    })).json()
+    cart = (await client.post("/cart")).json()
+    await client.post(f"/cart/{cart['id']}/items", json={"product_id": prod["id"], "qty": 2})
+
+    r = await client.post(f"/checkout/{cart['id']}")
+    assert r.status_code == 202
+    order_id = r.json()["order_id"]
+    assert stripe_stub.calls == []  # Stripe is not on the request path
+    # queued in the order's transaction, handed to the broker by the relay
+    outbox_service.relay_outbox(db_session)
+    assert ("open_checkout_session", [order_id]) in sent
+
+    status = (await client.get(r.json()["status_url"])).json()
+    assert (status["status"], status["checkout_url"]) == ("pending", None)
+
+    # what the Celery task runs
+    session = checkout_service.open_checkout_session(db_session, order_id)
+    assert checkout_service.open_checkout_session(db_session, order_id) == session
+    assert len(stripe_stub.calls) == 1
+
+    status = (await client.get(f"/checkout/orders/{order_id}", params={"wait": 5})).json()
+    assert status == {
+        "order_id": order_id, "order_status": "PENDING_PAYMENT", "status": "ready",
+        "session_id": session["id"], "checkout_url": session["url"],
+    }
+
+
+async def test_deferred_checkout_failure_cancels_order_and_releases_stock(client, db_session, stripe_stub, monkeypatch):
+    monkeypatch.setattr(settings, "CHECKOUT_ASYNC", True)
+
+    cat = (await client.post("/categories", json={"name": "Deferred fail"})).json()
+    prod = (await client.post("/products", json={
+        "category_id": cat["id"], "name": "Never", "price_cents": 700, "currency": "brl", "stock": 5, "active": True,
+    })).json()
+    cart = (await client.post("/cart")).json()
+    await client.post(f"/cart/{cart['id']}/items", json={"product_id": prod["id"], "qty": 2})
+    order_id = (await client.post(f"/checkout/{cart['id']}")).json()["order_id"]
+
+    stripe_stub.fail_next = 1
+    with pytest.raises(stripe.APIError):
+        checkout_service.open_checkout_session(db_session, order_id)
+    db_session.rollback()
+    checkout_service.fail_checkout(db_session, order_id)
+
+    status = (await client.get(f"/checkout/orders/{order_id}")).json()
+    assert (status["status"], status["order_status"]) == ("failed", "CANCELLED")
+    db_session.expire_all()
+    assert db_session.get(Product, prod["id"]).stock == 5
@@ -1,6 +1,14 @@
 import json
 
-async def test_checkout_and_webhook_happy_path(client, monkeypatch):
+import fakeredis
+
+import app.core.cache as cache
+from app.models.outbox import OutboxMessage
+from app.models.webhook_event import WebhookEvent, WebhookStatus
+from app.services import outbox_service
+from app.services.webhook_service import enqueue_stripe_event, process_webhook_inbox
+
+async def test_checkout_and_webhook_happy_path(client, db_session, monkeypatch):
     # create category
     cat = (await client.post("/categories", json={"name": "Games"})).json()
 
@@ -43,10 +51,14 @@ async def test_checkout_and_webhook_happy_path(client, monkeypatch):
     resp = await client.post("/webhooks/stripe", content=json.dumps(fake_event), headers={"Stripe-Signature": "t=fake"})
     assert resp.status_code == 200
 
+    # acknowledged, not yet applied: the inbox consumer (Celery) does that
+    assert (await client.get(f"/orders/{order_id}")).json()["status"] == "PENDING_PAYMENT"
+    assert process_webhook_inbox(db_session)["processed"] == 1
+
     order = (await client.get(f"/orders/{order_id}")).json()
     assert order["status"] == "PAID"
 
-async def test_webhook_idempotent(client, monkeypatch):
+async def test_webhook_idempotent(client, db_session, monkeypatch):
     cat = (await client.post("/categories", json={"name": "Books"})).json()
     prod = (await client.post("/products", json={
         "category_id": cat["id"], "name": "Book", "price_cents": 500, "currency": "brl", "stock": 10, "active": True
@@ -74,6 +86,49 @@ async def test_webhook_idempotent(client, monkeypatch):
     r2 = await client.post("/webhooks/stripe", content=json.dumps(fake_event), headers={"Stripe-Signature": "t=fake"})
     assert r1.status_code == 200
     assert r2.status_code == 200
+    assert r2.json()["idempotent"] is True
+    assert process_webhook_inbox(db_session)["processed"] == 1
+    assert process_webhook_inbox(db_session)["claimed"] == 0
 
     order = (await client.get(f"/orders/{order_id}")).json()
     assert order["status"] == "PAID"
+
+
+async def test_webhook_inbox_retries_with_backoff_then_gives_up(client, db_session, monkeypatch):
+    monkeypatch.setattr("app.services.webhook_service.settings.WEBHOOK_MAX_ATTEMPTS", 2)
+    fake_event = {
+        "id": "evt_unknown_payment",
+        "type": "checkout.session.completed",
+        "data": {"object": {"id": "cs_does_not_exist", "metadata": {}}},
+    }
+    monkeypatch.setattr("app.api.routes.webhooks.verify_webhook", lambda payload, sig: fake_event)
+    assert (await client.post("/webhooks/stripe", content=json.dumps(fake_event))).status_code == 200
+
+    assert process_webhook_inbox(db_session)["retried"] == 1
+    ev = db_session.query(WebhookEvent).filter(WebhookEvent.event_id == "evt_unknown_payment").one()
+    assert (ev.status, ev.attempts) == (WebhookStatus.received, 1)
+    assert "Payment not found" in ev.last_error
+    assert process_webhook_inbox(db_session)["claimed"] == 0  # not due yet
+
+    ev.next_attempt_at = ev.received_at
+    db_session.commit()
+    assert process_webhook_inbox(db_session)["failed"] == 1
+    db_session.refresh(ev)
+    assert (ev.status, ev.attempts) == (WebhookStatus.failed, 2)
+
+def test_webhook_kick_goes_through_the_outbox(db_session, monkeypatch):
+    monkeypatch.setattr(cache, "_redis", fakeredis.FakeRedis(decode_responses=True))
+
+    def no_broker(*args, **kwargs):
+        raise AssertionError("broker called on the request path")
+
+    monkeypatch.setattr(outbox_service.celery_app, "send_task", no_broker)
+    monkeypatch.setattr("app.tasks.webhooks.process_webhook_inbox_task.delay", no_broker)
+    before = db_session.query(OutboxMessage).filter(OutboxMessage.task == "process_webhook_inbox").count()
+
+    for i in range(3):  # a burst: one kick
+        enqueue_stripe_event(db_session, {"id": f"evt_kick_{i}", "type": "customer.created"})
+
+    kicks = db_session.query(OutboxMessage).filter(OutboxMessage.task == "process_webhook_inbox").count()
+    assert kicks - before == 1
+    assert process_webhook_inbox(db_session)["processed"] == 3
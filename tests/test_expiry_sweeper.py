@@ -0,0 +1,116 @@
+from sqlalchemy import text
+
+from app.models.cart import Cart, CartStatus
+from app.models.order import Order, OrderStatus
+from app.models.outbox import OutboxMessage
+from app.models.payment import Payment, PaymentStatus
+from app.models.product import Product
+from app.models.reservation import ReservationStatus, StockReservation
+from app.services.cart_service import sweep_expired_carts
+from app.services.checkout_service import mark_order_paid
+from app.services.reservation_service import release_reservations
+
+
+async def test_sweeper_expires_idle_carts_and_unpaid_orders_in_batches(client, db_session, monkeypatch):
+    monkeypatch.setattr(
+        "app.services.checkout_service.create_checkout_session",
+        lambda **kwargs: {"id": f"cs_sweep_{kwargs['order_id']}", "url": "https://fake.checkout/sweep"},
+    )
+    cat = (await client.post("/categories", json={"name": "Sweeper"})).json()
+    prod = (await client.post("/products", json={
+        "category_id": cat["id"], "name": "Swept", "price_cents": 100, "currency": "brl", "stock": 10, "active": True,
+    })).json()
+
+    idle = [(await client.post("/cart")).json()["id"] for _ in range(3)]
+    fresh = (await client.post("/cart")).json()["id"]
+    unpaid = []
+    for _ in range(3):
+        cart = (await client.post("/cart")).json()
+        await client.post(f"/cart/{cart['id']}/items", json={"product_id": prod["id"], "qty": 2})
+        unpaid.append((await client.post(f"/checkout/{cart['id']}")).json()["order_id"])
+    db_session.expire_all()
+    assert db_session.get(Product, prod["id"]).stock == 4
+
+    db_session.execute(text("UPDATE carts SET updated_at = now() - interval '2 days' WHERE id = ANY(:ids)"), {"ids": idle})
+    db_session.execute(
+        text("UPDATE stock_reservations SET expires_at = now() - interval '1 minute' WHERE order_id = ANY(:ids)"),
+        {"ids": unpaid[:2]},
+    )
+    db_session.commit()
+
+    assert sweep_expired_carts(db_session, limit=2) == {"carts_expired": 2, "orders_cancelled": 2, "lines_released": 2}
+    assert sweep_expired_carts(db_session, limit=2) == {"carts_expired": 1, "orders_cancelled": 0, "lines_released": 0}
+    assert sweep_expired_carts(db_session, limit=2)["carts_expired"] == 0
+
+    db_session.expire_all()
+    assert db_session.get(Product, prod["id"]).stock == 8
+    assert [db_session.get(Cart, c).status for c in idle + [fresh]] == [CartStatus.expired] * 3 + [CartStatus.active]
+    assert [db_session.get(Order, o).status for o in unpaid] == [OrderStatus.cancelled] * 2 + [OrderStatus.pending_payment]
+    statuses = {
+        r.order_id: r.status
+        for r in db_session.query(StockReservation).filter(StockReservation.order_id.in_(unpaid))
+    }
+    assert statuses == {
+        unpaid[0]: ReservationStatus.released, unpaid[1]: ReservationStatus.released, unpaid[2]: ReservationStatus.held,
+    }
+
+
+async def test_payment_after_the_sweeper_cancelled_the_order_does_not_ship(client, db_session, monkeypatch):
+    monkeypatch.setattr(
+        "app.services.checkout_service.create_checkout_session",
+        lambda **kwargs: {"id": f"cs_late_{kwargs['order_id']}", "url": "https://fake.checkout/late"},
+    )
+    cat = (await client.post("/categories", json={"name": "Late payers"})).json()
+    prod = (await client.post("/products", json={
+        "category_id": cat["id"], "name": "Last one", "price_cents": 100, "currency": "brl", "stock": 1, "active": True,
+    })).json()
+    cart = (await client.post("/cart")).json()
+    await client.post(f"/cart/{cart['id']}/items", json={"product_id": prod["id"], "qty": 1})
+    order_id = (await client.post(f"/checkout/{cart['id']}")).json()["order_id"]
+
+    db_session.execute(
+        text("UPDATE stock_reservations SET expires_at = now() - interval '1 minute' WHERE order_id = :id"),
+        {"id": order_id},
+    )
+    db_session.commit()
+    assert sweep_expired_carts(db_session)["orders_cancelled"] >= 1
+    outbox_before = db_session.query(OutboxMessage).count()
+
+    order = mark_order_paid(db_session, stripe_session_id=None, payment_intent_id="pi_late", order_id=order_id)
+
+    db_session.expire_all()
+    assert order.status == OrderStatus.cancelled
+    payment = db_session.query(Payment).filter(Payment.order_id == order_id).one()
+    assert (payment.status, payment.stripe_payment_intent_id) == (PaymentStatus.succeeded, "pi_late")
+    assert db_session.get(Product, prod["id"]).stock == 1  # still on sale, not sold twice
+    assert db_session.query(OutboxMessage).count() == outbox_before  # no fulfillment queued
+
+
+async def test_released_stock_goes_back_in_one_update(client, db_session, count_queries, monkeypatch):
+    monkeypatch.setattr(
+        "app.services.checkout_service.create_checkout_session",
+        lambda **kwargs: {"id": f"cs_restock_{kwargs['order_id']}", "url": "https://fake.checkout/restock"},
+    )
+    cat = (await client.post("/categories", json={"name": "Restock"})).json()
+    products = [
+        (await client.post("/products", json={
+            "category_id": cat["id"], "name": f"Restock {i}", "price_cents": 100, "currency": "brl", "stock": 5, "active": True,
+        })).json()["id"]
+        for i in range(3)
+    ]
+    orders = []
+    for _ in range(2):
+        cart = (await client.post("/cart")).json()
+        for pid in products:
+            await client.post(f"/cart/{cart['id']}/items", json={"product_id": pid, "qty": 2})
+        orders.append((await client.post(f"/checkout/{cart['id']}")).json()["order_id"])
+
+    with count_queries() as statements:
+        assert release_reservations(db_session, *orders) == 6
+        db_session.commit()
+
+    restock = [s for s in statements if s.lstrip().upper().startswith("UPDATE PRODUCTS")]
+    # one set-based statement (not an executemany of per-product updates)
+    assert len(restock) == 1 and "(VALUES" in restock[0].upper()
+    db_session.expire_all()
+    assert [db_session.get(Product, pid).stock for pid in products] == [5, 5, 5]
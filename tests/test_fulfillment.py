@@ -0,0 +1,75 @@
+import fakeredis
+import pytest
+
+import app.core.cache as cache
+from app.core.config import settings
+from app.models.cart import Cart
+from app.models.order import Order, OrderStatus
+from app.services import fulfillment_service, outbox_service
+from app.services.fulfillment_service import STREAM_KEY, flush_fulfillment, start_fulfillment
+from app.services.outbox_service import relay_outbox
+
+
+@pytest.fixture(autouse=True)
+def broker(monkeypatch):
+    # rows other tests left in the outbox go to Celery: keep them off the network
+    sent = []
+    monkeypatch.setattr(outbox_service.celery_app, "send_task", lambda name, args, kwargs: sent.append((name, args)))
+    return sent
+
+
+def _orders(db, n, status):
+    carts = [Cart() for _ in range(n)]
+    db.add_all(carts)
+    db.flush()
+    orders = [Order(cart_id=c.id, total_cents=100, currency="brl", status=status) for c in carts]
+    db.add_all(orders)
+    db.commit()
+    return [o.id for o in orders]
+
+
+def test_batched_fulfillment_one_update_per_batch(db_session, monkeypatch, count_queries):
+    r = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(cache, "_redis", r)
+    monkeypatch.setattr(settings, "FULFILLMENT_BATCHED", True)
+    hooked = []
+    monkeypatch.setattr(fulfillment_service, "_hooks", [lambda db, order_id: hooked.append(order_id)])
+
+    paid = _orders(db_session, 5, OrderStatus.paid)
+    cancelled = _orders(db_session, 1, OrderStatus.cancelled)
+    for order_id in paid + cancelled + paid[:1]:  # a replayed event enqueues twice
+        start_fulfillment(db_session, order_id)
+    db_session.commit()
+    relay_outbox(db_session)
+    assert r.xlen(STREAM_KEY) == 7
+
+    with count_queries() as statements:
+        assert flush_fulfillment(db_session, limit=4, consumer="c1") == {"read": 4, "fulfilled": 4}
+    assert sum(s.lstrip().upper().startswith("UPDATE") for s in statements) == 1
+    assert flush_fulfillment(db_session, limit=4, consumer="c1") == {"read": 3, "fulfilled": 1}
+    assert flush_fulfillment(db_session, limit=4, consumer="c1") == {"read": 0, "fulfilled": 0}
+
+    db_session.expire_all()
+    assert [db_session.get(Order, o).status for o in paid] == [OrderStatus.fulfilled] * 5
+    assert db_session.get(Order, cancelled[0]).status == OrderStatus.cancelled
+    assert sorted(hooked) == sorted(paid)
+    assert r.xlen(STREAM_KEY) == 0
+
+
+def test_unacknowledged_entries_are_reclaimed(db_session, monkeypatch):
+    r = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(cache, "_redis", r)
+    monkeypatch.setattr(settings, "FULFILLMENT_BATCHED", True)
+    monkeypatch.setattr(fulfillment_service, "CLAIM_IDLE_MS", 0)
+
+    paid = _orders(db_session, 2, OrderStatus.paid)
+    for order_id in paid:
+        start_fulfillment(db_session, order_id)
+    db_session.commit()
+    relay_outbox(db_session)
+    fulfillment_service._ensure_group(r)
+    # a consumer that read the batch and died before committing
+    r.xreadgroup(fulfillment_service.GROUP, "dead", {STREAM_KEY: ">"}, count=10)
+
+    assert flush_fulfillment(db_session, consumer="alive") == {"read": 2, "fulfilled": 2}
+    assert r.xpending(STREAM_KEY, fulfillment_service.GROUP)["pending"] == 0
@@ -0,0 +1,90 @@
+import asyncio
+
+import fakeredis
+import pytest
+from fastapi import FastAPI, HTTPException
+from httpx import AsyncClient
+
+import app.core.cache as cache
+from app.core.idempotency import IdempotencyMiddleware
+
+
+@pytest.fixture
+def idem_app(monkeypatch):
+    monkeypatch.setattr(cache, "_redis", fakeredis.FakeRedis(decode_responses=True))
+    calls = []
+    app = FastAPI()
+    app.add_middleware(IdempotencyMiddleware, path_prefixes=("/cart",))
+
+    @app.post("/cart/{cart_id}/items")
+    async def add(cart_id: int, payload: dict):
+        calls.append(payload)
+        await asyncio.sleep(0.1)
+        if payload.get("boom"):
+            raise HTTPException(status_code=503, detail="try again")
+        if payload.get("crash"):
+            raise RuntimeError("handler bug")
+        return {"cart_id": cart_id, "call": len(calls)}
+
+    app.state.calls = calls
+    return app
+
+
+@pytest.fixture
+async def idem_client(idem_app):
+    async with AsyncClient(app=idem_app, base_url="http://test") as c:
+        yield c
+
+
+async def test_retry_with_same_key_is_replayed(idem_client, idem_app):
+    headers = {"Idempotency-Key": "k1"}
+    r1 = await idem_client.post("/cart/1/items", json={"qty": 1}, headers=headers)
+    r2 = await idem_client.post("/cart/1/items", json={"qty": 1}, headers=headers)
+    assert r1.json() == r2.json() == {"cart_id": 1, "call": 1}
+    assert r2.headers["idempotent-replayed"] == "true"
+    assert "idempotent-replayed" not in r1.headers
+
+    # no key, or another key: runs again
+    assert (await idem_client.post("/cart/1/items", json={"qty": 1})).json()["call"] == 2
+    assert (await idem_client.post("/cart/1/items", json={"qty": 1}, headers={"Idempotency-Key": "k2"})).json()["call"] == 3
+
+
+async def test_concurrent_duplicates_execute_once(idem_client, idem_app):
+    headers = {"Idempotency-Key": "same"}
+    responses = await asyncio.gather(*[
+        idem_client.post("/cart/7/items", json={"qty": 2}, headers=headers) for _ in range(5)
+    ])
+    assert len(idem_app.state.calls) == 1
+    assert {r.json()["call"] for r in responses} == {1}
+    assert sum(r.headers.get("idempotent-replayed") == "true" for r in responses) == 4
+
+
+async def test_key_reuse_with_other_payload_is_rejected_and_5xx_not_stored(idem_client, idem_app):
+    headers = {"Idempotency-Key": "k3"}
+    await idem_client.post("/cart/1/items", json={"qty": 1}, headers=headers)
+    assert (await idem_client.post("/cart/1/items", json={"qty": 9}, headers=headers)).status_code == 422
+
+    headers = {"Idempotency-Key": "k4"}
+    assert (await idem_client.post("/cart/1/items", json={"boom": True}, headers=headers)).status_code == 503
+    assert (await idem_client.post("/cart/1/items", json={"boom": True}, headers=headers)).status_code == 503
+    assert len(idem_app.state.calls) == 3
+
+
+async def test_duplicate_waiting_on_a_failed_holder_runs_itself(idem_client, idem_app):
+    headers = {"Idempotency-Key": "k5"}
+    responses = await asyncio.gather(*[
+        idem_client.post("/cart/1/items", json={"boom": True}, headers=headers) for _ in range(2)
+    ])
+    # the waiter took over once the holder's 5xx released the lock: no 409 "in progress"
+    assert [r.status_code for r in responses] == [503, 503]
+    assert len(idem_app.state.calls) == 2
+
+
+async def test_lock_is_released_when_the_handler_raises(idem_client, idem_app):
+    headers = {"Idempotency-Key": "k6"}
+    with pytest.raises(RuntimeError):
+        await idem_client.post("/cart/1/items", json={"crash": True}, headers=headers)
+    assert cache.get_redis().keys("idem:*:lock") == []
+    with pytest.raises(RuntimeError):  # the retry runs again instead of waiting for the lock TTL
+        await idem_client.post("/cart/1/items", json={"crash": True}, headers=headers)
+    assert len(idem_app.state.calls) == 2
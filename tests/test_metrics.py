@@ -0,0 +1,56 @@
+import re
+
+import fakeredis
+import pytest
+
+import app.core.cache as cache
+from app.core.metrics import instrument_engine, registry
+
+
+@pytest.fixture(autouse=True)
+def instrumented(engine, monkeypatch):
+    # the `app` fixture serves requests from the test engine, not the one init_db built
+    instrument_engine(engine)
+    monkeypatch.setattr(cache, "_redis", fakeredis.FakeRedis(decode_responses=True))
+    cache.local_cache.clear()
+    registry.reset()
+    yield
+    cache.local_cache.clear()
+
+
+def _timing(response) -> dict:
+    """`Server-Timing` -> {name: {"dur": float, "desc": str}}."""
+    out = {}
+    for metric in response.headers["server-timing"].split(", "):
+        name, *params = metric.split(";")
+        out[name] = {k: v.strip('"') for k, v in (p.split("=", 1) for p in params)}
+    return out
+
+
+async def test_server_timing_and_prometheus_metrics(client):
+    cat = (await client.post("/categories", json={"name": "Metrics"})).json()
+    product = (await client.post("/products", json={
+        "category_id": cat["id"], "name": "Metered", "price_cents": 100, "currency": "brl", "stock": 5, "active": True,
+    })).json()
+
+    first = await client.get(f"/products/{product['id']}")
+    timing = _timing(first)
+    assert int(timing["db"]["desc"].split()[0]) >= 1
+    assert float(timing["app"]["dur"]) >= float(timing["db"]["dur"])
+    assert "miss=1" in timing["cache"]["desc"]
+
+    second = await client.get(f"/products/{product['id']}")
+    timing = _timing(second)
+    assert timing["db"]["desc"] == "0 queries"
+    assert "miss=0" in timing["cache"]["desc"]
+
+    text = (await client.get("/metrics")).text
+    labels = 'method="GET",route="/products/{product_id}"'
+    assert f'http_requests_total{{{labels},status="200"}} 2' in text
+    assert f"http_request_duration_seconds_count{{{labels}}} 2" in text
+    # one request ran no SQL at all
+    assert f'http_request_sql_queries_bucket{{{labels},le="0"}} 1' in text
+    assert f'http_request_cache_lookups_total{{{labels},result="miss"}} 1' in text
+    assert re.search(rf'http_request_db_seconds_total\{{{re.escape(labels)}\}} [0-9.e-]+', text)
+    # /metrics itself is not measured
+    assert 'route="/metrics"' not in text
@@ -0,0 +1,71 @@
+import pytest
+from sqlalchemy import delete
+
+from app.core.config import settings
+from app.models.outbox import OutboxMessage
+from app.services import outbox_service
+from app.services.outbox_service import enqueue_task, relay_outbox
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    broker = {"sent": [], "down": False}
+
+    def send_task(name, args, kwargs):
+        if broker["down"]:
+            raise ConnectionError("broker unreachable")
+        broker["sent"].append((name, args, kwargs))
+
+    monkeypatch.setattr(outbox_service.celery_app, "send_task", send_task)
+    return broker
+
+
+def test_outbox_rows_follow_the_transaction_and_survive_broker_outages(db_session, broker):
+    relay_outbox(db_session, limit=10_000)  # rows left by other tests
+    broker["sent"].clear()
+
+    enqueue_task(db_session, "post_payment_pipeline", 1)
+    db_session.rollback()
+    enqueue_task(db_session, "post_payment_pipeline", 2)
+    enqueue_task(db_session, "open_checkout_session", 3, attempt=1)
+    db_session.commit()
+
+    broker["down"] = True
+    assert relay_outbox(db_session) == {"claimed": 2, "published": 0, "failed": 0}
+    first = db_session.query(OutboxMessage).order_by(OutboxMessage.id).first()
+    # an outage is not the row's fault: nothing counts toward parking it
+    assert (first.attempts, first.last_error) == (0, "ConnectionError: broker unreachable")
+
+    broker["down"] = False
+    assert relay_outbox(db_session) == {"claimed": 2, "published": 2, "failed": 0}
+    assert broker["sent"] == [("post_payment_pipeline", [2], {}), ("open_checkout_session", [3], {"attempt": 1})]
+    assert db_session.query(OutboxMessage).count() == 0
+
+
+def test_a_row_that_always_fails_is_skipped_then_parked(db_session, broker, monkeypatch):
+    relay_outbox(db_session, limit=10_000)  # rows left by other tests
+    broker["sent"].clear()
+    monkeypatch.setattr(settings, "OUTBOX_MAX_ATTEMPTS", 3)
+
+    def poison(*args, **kwargs):
+        raise ValueError("cannot publish this one")
+
+    monkeypatch.setitem(outbox_service._publishers, "poison", poison)
+    enqueue_task(db_session, "poison", 1)
+    enqueue_task(db_session, "post_payment_pipeline", 2)
+    db_session.commit()
+
+    assert relay_outbox(db_session) == {"claimed": 2, "published": 1, "failed": 1}
+    assert broker["sent"] == [("post_payment_pipeline", [2], {})]
+    assert relay_outbox(db_session) == {"claimed": 1, "published": 0, "failed": 1}
+    assert relay_outbox(db_session) == {"claimed": 1, "published": 0, "failed": 1}
+
+    # parked: kept for inspection, no longer claimed, does not hold back new rows
+    enqueue_task(db_session, "post_payment_pipeline", 3)
+    db_session.commit()
+    assert relay_outbox(db_session) == {"claimed": 1, "published": 1, "failed": 0}
+    parked = db_session.query(OutboxMessage).one()
+    assert (parked.task, parked.attempts, parked.last_error) == ("poison", 3, "ValueError: cannot publish this one")
+
+    db_session.execute(delete(OutboxMessage))
+    db_session.commit()
@@ -1,12 +1,15 @@
+import json
 import threading
 import pytest
+from sqlalchemy import text
 from sqlalchemy.orm import sessionmaker
 
 from app.models.category import Category
 from app.models.product import Product
 from app.models.cart import Cart, CartItem, CartStatus
+from app.models.reservation import ReservationStatus, StockReservation
+from app.services.cart_service import add_item, expire_cart
 from app.services.checkout_service import checkout
-import app.services.stripe_service as stripe_service
 
 
 @pytest.mark.asyncio
@@ -49,11 +52,45 @@ async def test_products_cursor_pagination(client):
     assert ids1.isdisjoint(ids2)
 
 
+@pytest.mark.asyncio
+async def test_category_pages_are_cached_and_invalidated_by_generation(client):
+    cat = (await client.post("/categories", json={"name": "Mouses"})).json()
+    slug = cat["slug"]
+    product = {"category_id": cat["id"], "name": "Mouse", "price_cents": 100, "currency": "brl", "stock": 1, "active": True}
+    await client.post("/products", json=product)
+
+    page = (await client.get("/products", params={"category": slug, "q": "  MOUSE "})).json()
+    assert len(page["items"]) == 1
+    # same page, differently spelled query -> same cache entry
+    assert (await client.get("/products", params={"category": slug, "q": "mouse"})).json() == page
+
+    # creating a product bumps the listing generation: every page is recomputed
+    await client.post("/products", json={**product, "name": "Mouse 2"})
+    page = (await client.get("/products", params={"category": slug, "q": "mouse"})).json()
+    assert len(page["items"]) == 2
+
+
+@pytest.mark.asyncio
+async def test_search_ranks_name_matches_first_and_pages_without_duplicates(client):
+    cat = (await client.post("/categories", json={"name": "Posters"})).json()
+    base = {"category_id": cat["id"], "price_cents": 100, "currency": "brl", "stock": 1, "active": True}
+    for i in range(4):
+        await client.post("/products", json={**base, "name": f"Print {i}", "description": "zelda artwork"})
+    top = (await client.post("/products", json={**base, "name": "Zelda print", "description": None})).json()
+
+    page = (await client.get("/products/search", params={"q": "zelda", "limit": 2})).json()
+    assert page["items"][0]["id"] == top["id"]
+    ids = [p["id"] for p in page["items"]]
+    while page["next_cursor"]:
+        page = (await client.get("/products/search", params={"q": "zelda", "limit": 2, "cursor": page["next_cursor"]})).json()
+        ids += [p["id"] for p in page["items"]]
+    assert len(ids) == len(set(ids)) == 5
+
+
 def test_checkout_stock_reservation_is_concurrency_safe(engine, monkeypatch):
-    # avoid real Stripe call
+    # avoid real Stripe call (patched where checkout looks it up)
     monkeypatch.setattr(
-        stripe_service,
-        "create_checkout_session",
+        "app.services.checkout_service.create_checkout_session",
         lambda **kwargs: {"id": "cs_test", "url": "https://example.test/checkout"},
     )
 
@@ -90,6 +127,7 @@ def test_checkout_stock_reservation_is_concurrency_safe(engine, monkeypatch):
             ]
         )
         db.commit()
+        c1_id, c2_id, product_id = c1.id, c2.id, p.id
     finally:
         db.close()
 
@@ -109,16 +147,6 @@ def test_checkout_stock_reservation_is_concurrency_safe(engine, monkeypatch):
         finally:
             s.close()
 
-    # carts inserted above will have ids 1 and 2 in a fresh DB, but to be safe
-    # we can query them back:
-    db2 = SessionLocal()
-    try:
-        cart_ids = [c.id for c in db2.query(Cart).order_by(Cart.id.asc()).all()]
-        assert len(cart_ids) >= 2
-        c1_id, c2_id = cart_ids[0], cart_ids[1]
-    finally:
-        db2.close()
-
     t1 = threading.Thread(target=run_checkout, args=(c1_id,), daemon=True)
     t2 = threading.Thread(target=run_checkout, args=(c2_id,), daemon=True)
     t1.start()
@@ -130,3 +158,109 @@ def test_checkout_stock_reservation_is_concurrency_safe(engine, monkeypatch):
     assert len(results) == 1
     assert len(errors) == 1
     assert "Insufficient stock" in errors[0][1]
+
+    db = SessionLocal()
+    try:
+        assert db.get(Product, product_id).stock == 0
+        held = db.query(StockReservation).filter(StockReservation.product_id == product_id).all()
+        assert [(r.order_id, r.qty, r.status) for r in held] == [(results[0][1], 1, ReservationStatus.held)]
+
+        # unpaid order expires: stock comes back exactly once
+        cart_id = results[0][0]
+        expire_cart(db, cart_id)
+        expire_cart(db, cart_id)
+        db.expire_all()
+        assert db.get(Product, product_id).stock == 1
+        assert db.get(StockReservation, held[0].id).status == ReservationStatus.released
+    finally:
+        db.close()
+
+
+def test_concurrent_adds_of_one_product_upsert_one_line(engine, count_queries):
+    SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
+    db = SessionLocal()
+    try:
+        cat = Category(name="Upserts", slug="upserts")
+        db.add(cat)
+        db.flush()
+        p = Product(category_id=cat.id, name="Scarce", price_cents=300, currency="usd", stock=5, active=True)
+        cart = Cart(status=CartStatus.active)
+        db.add_all([p, cart])
+        db.commit()
+        cart_id, product_id = cart.id, p.id
+    finally:
+        db.close()
+
+    statuses = []
+    barrier = threading.Barrier(8)
+
+    def run_add():
+        s = SessionLocal()
+        try:
+            barrier.wait()
+            add_item(s, cart_id, product_id, 1)
+            statuses.append(200)
+        except Exception as e:
+            statuses.append(getattr(e, "status_code", repr(e)))
+            s.rollback()
+        finally:
+            s.close()
+
+    threads = [threading.Thread(target=run_add, daemon=True) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # no unique violation, no lost update: the line stops at the stock
+    assert sorted(statuses) == [200] * 5 + [409] * 3
+    db = SessionLocal()
+    try:
+        assert [(i.product_id, i.qty) for i in db.query(CartItem).filter(CartItem.cart_id == cart_id)] == [(product_id, 5)]
+        cart = db.get(Cart, cart_id)
+        assert (cart.total_cents, cart.item_count, cart.currency) == (1500, 5, "usd")
+
+        db.query(Product).filter(Product.id == product_id).update({"stock": 10})
+        db.commit()
+        with count_queries() as statements:
+            assert add_item(db, cart_id, product_id, 1).total_cents == 1800
+        # one write statement, then the cart and its items are read back for the response
+        assert len(statements) == 3
+    finally:
+        db.close()
+
+
+@pytest.mark.asyncio
+async def test_orders_cursor_pagination_filters_and_export(client, db_session, monkeypatch):
+    monkeypatch.setattr(
+        "app.services.checkout_service.create_checkout_session",
+        lambda **kwargs: {"id": "cs_orders_page", "url": "https://fake.checkout/orders"},
+    )
+    since = db_session.execute(text("SELECT clock_timestamp()")).scalar_one().isoformat()
+    db_session.commit()
+    cat = (await client.post("/categories", json={"name": "Order pages"})).json()
+    prod = (await client.post("/products", json={
+        "category_id": cat["id"], "name": "Paged", "price_cents": 100, "currency": "brl", "stock": 10, "active": True,
+    })).json()
+    order_ids = []
+    for _ in range(3):
+        cart = (await client.post("/cart")).json()
+        await client.post(f"/cart/{cart['id']}/items", json={"product_id": prod["id"], "qty": 1})
+        order_ids.append((await client.post(f"/checkout/{cart['id']}")).json()["order_id"])
+
+    params = {"status": "PENDING_PAYMENT", "created_from": since, "limit": 2}
+    page1 = (await client.get("/orders", params=params)).json()
+    assert [o["id"] for o in page1["items"]] == order_ids[:0:-1]
+    assert page1["next_cursor"] == order_ids[1]
+    page2 = (await client.get("/orders", params={**params, "before_id": page1["next_cursor"]})).json()
+    assert [o["id"] for o in page2["items"]] == [order_ids[0]]
+    assert page2["next_cursor"] is None
+
+    assert (await client.get("/orders", params={"status": "PAID", "created_from": since})).json()["items"] == []
+    assert (await client.get("/orders", params={"status": "BOGUS"})).status_code == 422
+
+    r = await client.get("/orders/export", params={"created_from": since})
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    exported = [json.loads(line) for line in r.text.splitlines()]
+    assert [o["id"] for o in exported] == order_ids[::-1]
+    assert exported[0]["items"][0]["product_id"] == prod["id"]
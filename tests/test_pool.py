@@ -0,0 +1,64 @@
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+from sqlalchemy import exc
+
+import app.core.db as db
+from app.core.config import settings
+from app.core.pool import InstrumentedQueuePool
+
+
+@pytest.fixture
+def pool():
+    def creator():
+        time.sleep(0.02)  # a slow connect shows up in the checkout wait
+        return mock.MagicMock()
+
+    pool = InstrumentedQueuePool(creator, pool_size=1, max_overflow=1, timeout=0.05)
+    yield pool
+    pool.dispose()
+
+
+async def test_pool_counts_checkouts_overflow_and_timeouts(pool, client, monkeypatch):
+    first = pool.connect()
+    second = pool.connect()  # past pool_size: overflow
+    with pytest.raises(exc.TimeoutError):
+        pool.connect()
+    second.close()  # overflow connections are closed on checkin, not kept
+    first.close()
+    pool.connect().close()  # reuses the pooled connection: no connect, no wait
+
+    snap = pool.snapshot()
+    assert (snap["pool_size"], snap["checked_out"], snap["checked_in"], snap["overflow"]) == (1, 0, 1, 0)
+    assert (snap["checkouts"], snap["overflow_hits"], snap["timeouts"]) == (3, 1, 1)
+    assert snap["wait_ms_max"] >= 20
+    assert snap["wait_ms_avg"] < snap["wait_ms_max"]
+
+    # the counters survive a pool recreate (engine.dispose)
+    assert pool.recreate().stats is pool.stats
+
+    monkeypatch.setattr(db, "engine", SimpleNamespace(pool=pool))
+    monkeypatch.setattr(db, "async_engine", None)
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", "s3cret")
+    r = await client.get("/admin/db/pool", headers={"Authorization": "Bearer s3cret"})
+    assert r.json() == {"sync": snap}
+
+
+async def test_admin_endpoints_need_the_admin_token(client, monkeypatch):
+    monkeypatch.setattr(settings, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", None)
+    assert (await client.get("/admin/db/pool")).status_code == 404  # not served at all
+    assert (await client.get("/admin/profiles")).status_code == 404
+
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", "s3cret")
+    for headers in ({}, {"Authorization": "Bearer wrong"}, {"Authorization": "s3cret"}):
+        assert (await client.get("/admin/db/pool", headers=headers)).status_code == 401
+        assert (await client.get("/admin/profiles", headers=headers)).status_code == 401
+    admin = {"Authorization": "Bearer s3cret"}
+    assert (await client.get("/admin/db/pool", headers=admin)).status_code == 200
+    assert (await client.get("/admin/profiles", headers=admin)).status_code == 200
+
+    monkeypatch.setattr(settings, "PROFILING_ENABLED", False)
+    assert (await client.get("/admin/profiles", headers=admin)).status_code == 404
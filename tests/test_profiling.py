@@ -0,0 +1,102 @@
+import cProfile
+import logging
+
+import fakeredis
+import pytest
+from sqlalchemy import select
+
+import app.core.cache as cache
+from app.core.config import settings
+from app.core.profiling import profile_engine, profiles
+from app.models.product import Product
+
+ADMIN = {"Authorization": "Bearer s3cret"}
+
+
+@pytest.fixture(autouse=True)
+def profiling(engine, monkeypatch):
+    monkeypatch.setattr(settings, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", "s3cret")
+    monkeypatch.setattr(cache, "_redis", fakeredis.FakeRedis(decode_responses=True))
+    cache.local_cache.clear()
+    # the `app` fixture serves requests from the test engine, not the one init_db built
+    profile_engine(engine)
+    profiles.clear()
+    yield
+    cache.local_cache.clear()
+
+
+async def test_requested_profile_has_call_tree_and_sql(client):
+    cat = (await client.post("/categories", json={"name": "Profiled"})).json()
+    product = (await client.post("/products", json={
+        "category_id": cat["id"], "name": "Profiled", "price_cents": 100, "currency": "brl", "stock": 5, "active": True,
+    })).json()
+    assert "x-profile-id" not in (await client.get(f"/products/{product['id']}")).headers
+
+    cache.local_cache.clear()
+    cache._redis.flushall()
+    r = await client.get(f"/products/{product['id']}", headers={"X-Profile": "1"})
+    profile_id = int(r.headers["x-profile-id"])
+
+    listed = (await client.get("/admin/profiles", headers=ADMIN)).json()["items"]
+    assert [p["id"] for p in listed] == [profile_id]
+    assert listed[0]["route"] == "/products/{product_id}"
+
+    detail = (await client.get(f"/admin/profiles/{profile_id}", headers=ADMIN)).json()
+    assert detail["sql_count"] == len(detail["sql"]) >= 1
+    assert any("FROM products" in s["sql"] for s in detail["sql"])
+    assert "get_product" in detail["call_tree"]
+    assert (await client.get("/admin/profiles/999999", headers=ADMIN)).status_code == 404
+
+
+def test_slow_query_is_logged_with_plan(db_session, engine, monkeypatch, caplog):
+    monkeypatch.setattr(settings, "SLOW_QUERY_MS", 0.001)
+    # alembic's fileConfig (migrations in the engine fixture) disables loggers that existed before it
+    monkeypatch.setattr(logging.getLogger("app.core.profiling"), "disabled", False)
+    profile_engine(engine)
+    with caplog.at_level(logging.WARNING, logger="app.core.profiling"):
+        db_session.execute(select(Product).where(Product.sku == "no-such-sku")).all()
+    slow = [r.getMessage() for r in caplog.records if r.getMessage().startswith("slow query")]
+    assert slow and "FROM products" in slow[0] and "Scan" in slow[0]
+    # the EXPLAIN ran in a savepoint: the transaction is still usable
+    assert db_session.execute(select(1)).scalar() == 1
+
+
+async def _cart_with_item(client, name):
+    cat = (await client.post("/categories", json={"name": name})).json()
+    product = (await client.post("/products", json={
+        "category_id": cat["id"], "name": name, "price_cents": 100, "currency": "brl", "stock": 5, "active": True,
+    })).json()
+    cart = (await client.post("/cart")).json()
+    await client.post(f"/cart/{cart['id']}/items", json={"product_id": product["id"], "qty": 1})
+    return cart
+
+
+async def test_sampled_checkout_profiles_threadpool_and_stripe_call(client, monkeypatch):
+    # one profiler at a time: on 3.12+ a second enable() in the worker thread raised
+    monkeypatch.setattr(
+        "app.services.checkout_service.create_checkout_session",
+        lambda **kwargs: {"id": "cs_profiled", "url": "https://fake.checkout/profiled"},
+    )
+    cart = await _cart_with_item(client, "Profiled checkout")
+
+    r = await client.post(f"/checkout/{cart['id']}", headers={"X-Profile": "1"})
+    assert r.status_code == 200
+    detail = (await client.get(f"/admin/profiles/{r.headers['x-profile-id']}", headers=ADMIN)).json()
+    assert detail["note"] is None
+    # run_sync work in the threadpool is in the tree (merged per-thread profile on 3.11)
+    assert "place_order" in detail["call_tree"]
+    assert any(s["sql"].startswith("UPDATE products SET stock") for s in detail["sql"])
+
+
+async def test_sampled_request_survives_another_active_profiler(client):
+    cart = await _cart_with_item(client, "Profiler busy")
+    other = cProfile.Profile()
+    other.enable()
+    try:
+        r = await client.get(f"/cart/{cart['id']}", headers={"X-Profile": "1"})
+    finally:
+        other.disable()
+    assert r.status_code == 200
+    detail = (await client.get(f"/admin/profiles/{r.headers['x-profile-id']}", headers=ADMIN)).json()
+    assert detail["sql_count"] >= 1
@@ -0,0 +1,87 @@
+async def _product(client, cat_id, name, stock=100):
+    return (await client.post("/products", json={
+        "category_id": cat_id, "name": name, "price_cents": 100, "currency": "brl", "stock": stock, "active": True,
+    })).json()
+
+async def _order(client, products):
+    cart = (await client.post("/cart")).json()
+    for p in products:
+        await client.post(f"/cart/{cart['id']}/items", json={"product_id": p["id"], "qty": 1})
+    return (await client.post(f"/checkout/{cart['id']}")).json()
+
+async def test_cart_and_order_queries_do_not_grow_with_rows(client, db_session, count_queries, monkeypatch):
+    monkeypatch.setattr(
+        "app.services.checkout_service.create_checkout_session",
+        lambda **kwargs: {"id": "cs_n_plus_one", "url": "https://fake.checkout/n"},
+    )
+    cat = (await client.post("/categories", json={"name": "Query counts"})).json()
+    products = [await _product(client, cat["id"], f"QC {i}") for i in range(5)]
+
+    cart = (await client.post("/cart")).json()
+    await client.post(f"/cart/{cart['id']}/items", json={"product_id": products[0]["id"], "qty": 1})
+    db_session.expunge_all()
+    with count_queries() as one_item:
+        await client.get(f"/cart/{cart['id']}")
+    for p in products[1:]:
+        await client.post(f"/cart/{cart['id']}/items", json={"product_id": p["id"], "qty": 1})
+    db_session.expunge_all()
+    with count_queries() as five_items:
+        await client.get(f"/cart/{cart['id']}")
+    assert len(five_items) == len(one_item)
+
+    # checkout walks every item and product
+    small = (await client.post("/cart")).json()
+    await client.post(f"/cart/{small['id']}/items", json={"product_id": products[0]["id"], "qty": 1})
+    db_session.expunge_all()
+    with count_queries() as one_line:
+        await client.post(f"/checkout/{small['id']}")
+    db_session.expunge_all()
+    with count_queries() as five_lines:
+        await client.post(f"/checkout/{cart['id']}")
+    # no lazy loads; only the per-product conditional stock decrement scales with lines
+    decrements = [q for q in five_lines if q.startswith("UPDATE products SET stock")]
+    assert len(decrements) == 5
+    assert len(five_lines) - len(decrements) == len(one_line) - 1
+
+    db_session.expunge_all()
+    with count_queries() as before:
+        listing = (await client.get("/orders?limit=200")).json()["items"]
+    for _ in range(3):
+        await _order(client, products[:2])
+    db_session.expunge_all()
+    with count_queries() as after:
+        assert len((await client.get("/orders?limit=200")).json()["items"]) == len(listing) + 3
+    assert len(after) == len(before) <= 2
+
+    db_session.expunge_all()
+    with count_queries() as single:
+        order = (await client.get(f"/orders/{listing[0]['id']}")).json()
+    assert order["items"] and order["payment"]
+    assert len(single) <= 2
+
+async def test_cart_totals_are_kept_on_the_cart_row(client, db_session, count_queries):
+    cat = (await client.post("/categories", json={"name": "Cart totals"})).json()
+    a = await _product(client, cat["id"], "Totals A")
+    b = (await client.post("/products", json={
+        "category_id": cat["id"], "name": "Totals B", "price_cents": 250, "currency": "usd", "stock": 100, "active": True,
+    })).json()
+
+    cart = (await client.post("/cart")).json()
+    await client.post(f"/cart/{cart['id']}/items", json={"product_id": b["id"], "qty": 1})
+    await client.post(f"/cart/{cart['id']}/items", json={"product_id": a["id"], "qty": 2})
+    r = (await client.post(f"/cart/{cart['id']}/items", json={"product_id": b["id"], "qty": 2})).json()
+    assert (r["total_cents"], r["item_count"], r["currency"]) == (3 * 250 + 2 * 100, 5, "usd")
+
+    item_a = next(i for i in r["items"] if i["product_id"] == a["id"])
+    r = (await client.patch(f"/cart/{cart['id']}/items/{item_a['id']}", json={"qty": 1})).json()
+    assert (r["total_cents"], r["item_count"]) == (3 * 250 + 100, 4)
+    r = (await client.delete(f"/cart/{cart['id']}/items/{item_a['id']}")).json()
+    assert (r["total_cents"], r["item_count"]) == (3 * 250, 3)
+
+    db_session.expunge_all()
+    with count_queries() as statements:
+        r = (await client.get(f"/cart/{cart['id']}")).json()
+    assert r["total_cents"] == 750
+    # the cart row and its items; no product lookups for the currency
+    assert len(statements) == 2
+    assert not any("products" in s for s in statements)